@@ -0,0 +1,190 @@
+from ..encoder import CHIPS, SETUP_TO_END
+
+# The chip's end of the bus, for the PIO emulator
+#
+# Each model is an observer on the emulated RP2040 (see pio.py):  it
+# watches DA7-DA0, BC1, and BDIR every system clock cycle, latches,
+# writes, and reads registers as the chip would, and drives the data
+# bus for reads.  Every timing parameter it checks is recorded as a
+# margin, the time it was met by in ns, keeping the smallest seen;
+# a negative margin is a violation.
+#
+# LatchedChip is an 8910, YM2149, or 8930, checked against the timing
+# table in interface.py.  Setups run from the last change of the data
+# bus, and holds to the next; a bus no longer driven has changed.  A
+# read drives the register onto the bus once the read access time has
+# passed, and its margin is how long before the state machine sampled
+# the bus, through the input synchronizer.
+#
+# SyncChip is a HardAY, which samples the bus on each rising edge of
+# its clock.  Setup and hold are checked at every edge with a bus
+# phase other than idle, and a read drives the register from
+# output_delay after the edge that saw it.
+
+IDLE = 0b00
+READ = 0b01
+WRITE = 0b10
+LATCH = 0b11
+
+class _Chip:
+    def __init__(self, system, da_base: int, bc1: int):
+        self.system = system
+        self.da_base = da_base
+        self.bc1 = bc1
+        self.registers = {}
+        self.latched = None
+        self.margins = {}
+        self.latches = 0
+        self.writes = 0
+        self.reads = 0
+        self.contention = 0
+        self._da = None
+        self._da_since = 0.0
+        self._holds = []
+        # When the data of a read is valid, and if it is on the bus yet
+        self._read_due = None
+        self._driving = False
+        system.observers.append(self._observe)
+        system.input_hooks.append(self._sampled)
+
+    def _margin(self, name: str, margin: float):
+        if name not in self.margins or margin < self.margins[name]:
+            self.margins[name] = margin
+
+    def violations(self) -> list:
+        return [name for name, margin in self.margins.items() if margin < 0]
+
+    def _bus(self, system) -> tuple:
+        # (control, data bus), data None while not wholly driven
+        levels, driven = system.levels()
+        control = (levels >> self.bc1) & 0b11
+        mask = 0xff << self.da_base
+        da = (levels >> self.da_base) & 0xff if driven & mask == mask else None
+        if system.pin_dirs & system.external_mask & mask:
+            self.contention += 1
+        return control, da
+
+    def _track(self, da, now: float):
+        # Close out the holds waiting on the data bus changing
+        if da != self._da:
+            for name, since, required in self._holds:
+                self._margin(name, now - since - required)
+            self._holds = []
+            self._da = da
+            self._da_since = now
+
+    def _sampled(self, machine, base: int, count: int):
+        if self._read_due is None:
+            return
+        if base + count <= self.da_base or base >= self.da_base + 8:
+            return
+        # The synchronizer passes the levels of two cycles back, which
+        # show what was driven the cycle before
+        system = self.system
+        sampled = (system.cycle - 3) * 1e9 / system.sys_freq
+        self._margin("read access", sampled - self._read_due)
+        self.reads += 1
+
+    def _drive_when_due(self, now: float):
+        if self._read_due is not None and not self._driving \
+                and now >= self._read_due:
+            self.system.drive(self.da_base, 8,
+                              self.registers.get(self.latched, 0))
+            self._driving = True
+
+    def _release(self):
+        self.system.release(self.da_base, 8)
+        self._read_due = None
+        self._driving = False
+
+class LatchedChip(_Chip):
+    """AY-3-8910, YM2149, or AY-3-8930 on latched_io
+    registers:  Values written, by latched address.
+    margins:  Smallest margin in ns of each timing parameter.
+    """
+    def __init__(self, system, chip: str = "8910", da_base: int = 0,
+                 bc1: int = 8):
+        super().__init__(system, da_base, bc1)
+        self.chip = chip
+        self.timing = CHIPS[chip]
+        self._control = IDLE
+        self._control_since = 0.0
+
+    def _observe(self, system):
+        now = system.time_ns()
+        control, da = self._bus(system)
+        timing = self.timing
+        self._drive_when_due(now)
+        self._track(da, now)
+        if control == self._control:
+            return
+        if self._control == LATCH:
+            self._margin("address setup",
+                         now - self._da_since - timing["address_setup"])
+            self.latched = da
+            self.latches += 1
+            self._holds.append(("address hold", now,
+                                timing["address_hold"]))
+        elif self._control == WRITE:
+            self._margin("write pulse",
+                         now - self._control_since - timing["write_pulse"])
+            if self.chip in SETUP_TO_END:
+                self._margin("write setup",
+                             now - self._da_since - timing["write_setup"])
+            self.registers[self.latched] = da
+            self.writes += 1
+            self._holds.append(("write hold", now, timing["write_hold"]))
+        elif self._control == READ:
+            self._release()
+        if control == WRITE and self.chip not in SETUP_TO_END:
+            self._margin("write setup",
+                         now - self._da_since - timing["write_setup"])
+        elif control == READ:
+            self._read_due = now + timing["read_access"]
+        self._control = control
+        self._control_since = now
+
+class SyncChip(_Chip):
+    """HardAY on sync_io
+    setup, hold:  Required around each rising clock edge, in ns.
+    output_delay:  From the edge that sees a read to the data on the
+       bus, in ns.
+    """
+    def __init__(self, system, clock: int, da_base: int = 0, bc1: int = 8,
+                 setup: float = 5, hold: float = 2,
+                 output_delay: float = 5):
+        super().__init__(system, da_base, bc1)
+        self.clock = clock
+        self.setup = setup
+        self.hold = hold
+        self.output_delay = output_delay
+        self._clock_level = 0
+        self._control = IDLE
+
+    def _observe(self, system):
+        now = system.time_ns()
+        control, da = self._bus(system)
+        self._drive_when_due(now)
+        # Control and data share the holds and setups
+        if control != self._control:
+            self._track(object(), now)
+            self._control = control
+            if control != READ and self._read_due is not None:
+                self._release()
+        self._track(da, now)
+
+        clock = (system.levels()[0] >> self.clock) & 1
+        rising = clock and not self._clock_level
+        self._clock_level = clock
+        if not rising or control == IDLE:
+            return
+        self._margin("setup", now - self._da_since - self.setup)
+        self._holds.append(("hold", now, self.hold))
+        if control == LATCH:
+            self.latched = da
+            self.latches += 1
+        elif control == WRITE:
+            self.registers[self.latched] = da
+            self.writes += 1
+        elif self._read_due is None:
+            self._read_due = now + self.output_delay
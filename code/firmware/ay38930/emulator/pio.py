@@ -0,0 +1,717 @@
+import os
+import sys
+import types
+from array import array
+from collections import deque
+
+# Cycle-level RP2040 PIO emulator
+#
+# Runs PIO programs written for MicroPython's rp2 module on a host, one
+# system clock cycle at a time, so the bus programs in interface.py can
+# be timed and checked without an RP2040.  install() puts stand-in rp2
+# and machine modules (see shim/) on the path; interface.py then
+# imports and runs unchanged, and emulated time passes whenever it
+# blocks on a FIFO.
+#
+# asm_pio() takes the same DSL as MicroPython's and returns the same
+# program list, 16-bit PIO instructions included, with one more entry
+# on the end:  the labels.  The emulator runs the encoded instructions.
+#
+# Modeled:
+#   - Every instruction MicroPython can emit, with side-set, delay, and
+#     wrap; not OUT or MOV to EXEC, MOV from STATUS, relative IRQs, or
+#     FIFO joins.
+#   - Autopull and autopush.  The OSR refills from the TX FIFO whenever
+#     it's empty, so JMP !OSRE sees the next word a cycle after it's
+#     put.
+#   - Fractional clock dividers, 16.8 fixed point, with their jitter.
+#   - The two-flop input synchronizer:  IN, WAIT, and MOV see the pins
+#     as they were two system clock cycles earlier.
+#   - IRQ flags shared by a block's state machines, set at the end of
+#     the cycle.
+#   - Programs placed at the highest free address, as the SDK does, so
+#     OUT PC targets must add where the program was loaded.
+#
+# Pins are driven by the state machines that set them as outputs, else
+# by drive() from a model of the other end of the bus.  Observers are
+# called at the end of every cycle to watch the pins.
+
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+
+    def __init__(self, id: int):
+        self.id = id
+
+_PROG_DATA = 0
+_PROG_EXECCTRL = 3
+_PROG_SHIFTCTRL = 4
+_PROG_OUT_PINS = 5
+_PROG_SET_PINS = 6
+_PROG_SIDESET_PINS = 7
+_PROG_LABELS = 8
+
+##############
+# Assembler  #
+##############
+
+class PIOASMError(Exception):
+    pass
+
+class _Emitter:
+    # Same interface as MicroPython's PIOASMEmit
+    def __init__(self, *, out_init=None, set_init=None, sideset_init=None,
+                 in_shiftdir=0, out_shiftdir=0, autopush=False,
+                 autopull=False, push_thresh=32, pull_thresh=32,
+                 fifo_join=0):
+        self.labels = {}
+        self.sideset_count = (len(sideset_init)
+                              if isinstance(sideset_init, tuple)
+                              else int(sideset_init is not None))
+        self.delay_max = 31 >> self.sideset_count
+        shiftctrl = ((fifo_join << 30)
+                     | ((pull_thresh & 0x1f) << 25)
+                     | ((push_thresh & 0x1f) << 20)
+                     | (out_shiftdir << 19) | (in_shiftdir << 18)
+                     | (autopull << 17) | (autopush << 16))
+        self.prog = [array("H"), -1, -1, 0, shiftctrl,
+                     out_init, set_init, sideset_init, self.labels]
+
+    def start_pass(self, pass_: int):
+        self.pass_ = pass_
+        self.wrap_used = False
+        self.prog[_PROG_DATA] = array("H")
+        self.prog[_PROG_EXECCTRL] = 0
+
+    def __getitem__(self, key):
+        return self.delay(key)
+
+    def delay(self, delay: int):
+        if delay > self.delay_max:
+            raise PIOASMError("delay too large")
+        self.prog[_PROG_DATA][-1] |= delay << 8
+        return self
+
+    def side(self, value: int):
+        if self.sideset_count == 0:
+            raise PIOASMError("no sideset")
+        if value >= 1 << self.sideset_count:
+            raise PIOASMError("sideset too large")
+        self.prog[_PROG_DATA][-1] |= value << (13 - self.sideset_count)
+        return self
+
+    def wrap_target(self):
+        self.prog[_PROG_EXECCTRL] = ((self.prog[_PROG_EXECCTRL]
+                                      & ~(0x1f << 7))
+                                     | (len(self.prog[_PROG_DATA]) << 7))
+
+    def wrap(self):
+        if not self.prog[_PROG_DATA]:
+            raise PIOASMError("wrap before any instruction")
+        self.prog[_PROG_EXECCTRL] = ((self.prog[_PROG_EXECCTRL]
+                                      & ~(0x1f << 12))
+                                     | ((len(self.prog[_PROG_DATA]) - 1)
+                                        << 12))
+        self.wrap_used = True
+
+    def label(self, label: str):
+        if self.pass_ == 0:
+            if label in self.labels:
+                raise PIOASMError(f"duplicate label {label!r}")
+            self.labels[label] = len(self.prog[_PROG_DATA])
+
+    def word(self, instr: int, label=None):
+        if label is not None:
+            if self.pass_ == 1 and label not in self.labels:
+                raise PIOASMError(f"unknown label {label!r}")
+            instr |= self.labels.get(label, 0)
+        self.prog[_PROG_DATA].append(instr)
+        return self
+
+    def nop(self):
+        return self.word(0xa042)
+
+    def jmp(self, cond, label=None):
+        if label is None:
+            label = cond
+            cond = 0
+        return self.word(cond << 5, label)
+
+    def wait(self, polarity: int, src, index: int):
+        if src == 6:
+            src = 1
+        elif src != 0:
+            src = 2
+        return self.word(0x2000 | polarity << 7 | src << 5 | index)
+
+    def in_(self, src: int, data: int):
+        return self.word(0x4000 | src << 5 | data & 0x1f)
+
+    def out(self, dest: int, data: int):
+        if dest == 8:
+            dest = 7
+        return self.word(0x6000 | dest << 5 | data & 0x1f)
+
+    def push(self, value: int = 0, value2: int = 0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20
+        return self.word(0x8000 | (value & 0x60))
+
+    def pull(self, value: int = 0, value2: int = 0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20
+        return self.word(0x8080 | (value & 0x60))
+
+    def mov(self, dest: int, src: int):
+        if dest == 8:
+            dest = 4
+        return self.word(0xa000 | dest << 5 | src)
+
+    def irq(self, mod, index=None):
+        if index is None:
+            index = mod
+            mod = 0
+        return self.word(0xc000 | (mod & 0x60) | index)
+
+    def set(self, dest: int, data: int):
+        return self.word(0xe000 | dest << 5 | data)
+
+_pio_funcs = {
+    "gpio": 0,
+    "pins": 0, "x": 1, "y": 2, "null": 3, "pindirs": 4, "pc": 5,
+    "status": 5, "isr": 6, "osr": 7, "exec": 8,
+    "invert": lambda x: x | 0x08, "reverse": lambda x: x | 0x10,
+    "not_x": 1, "x_dec": 2, "not_y": 3, "y_dec": 4, "x_not_y": 5,
+    "pin": 6, "not_osre": 7,
+    "noblock": 0x01, "block": 0x21, "iffull": 0x40, "ifempty": 0x40,
+    "clear": 0x40, "rel": lambda x: x | 0x10,
+}
+
+def asm_pio(**kw):
+    """Assemble a PIO program, as MicroPython's rp2.asm_pio"""
+    emit = _Emitter(**kw)
+
+    def dec(f):
+        names = dict(_pio_funcs)
+        for name in ("word", "nop", "jmp", "wait", "in_", "out", "push",
+                     "pull", "mov", "irq", "set", "label", "wrap_target",
+                     "wrap"):
+            names[name] = getattr(emit, name)
+        body = types.FunctionType(f.__code__, names)
+        emit.start_pass(0)
+        body()
+        emit.start_pass(1)
+        body()
+        if not emit.wrap_used:
+            emit.wrap()
+        return emit.prog
+
+    return dec
+
+##############
+# Emulator   #
+##############
+
+_INSTRUCTION_COUNT = 32
+_FIFO_DEPTH = 4
+
+def _reverse(value: int) -> int:
+    return int(f"{value:032b}"[::-1], 2)
+
+def _mask(count: int) -> int:
+    return (1 << count) - 1
+
+def _pin_count(init) -> int:
+    if init is None:
+        return 0
+    return len(init) if isinstance(init, tuple) else 1
+
+def _pin_init(init) -> tuple:
+    if init is None:
+        return ()
+    return init if isinstance(init, tuple) else (init,)
+
+def _pin_id(pin) -> int:
+    return pin if isinstance(pin, int) else pin.id
+
+class _Block:
+    def __init__(self, system, index: int):
+        self.system = system
+        self.index = index
+        self.memory = [0xa042] * _INSTRUCTION_COUNT
+        self.used = 0
+        self.loaded = {}
+        self.irq = 0
+        self.irq_set = 0
+
+    def add_program(self, prog) -> int:
+        key = id(prog)
+        if key in self.loaded:
+            return self.loaded[key]
+        data = prog[_PROG_DATA]
+        mask = _mask(len(data))
+        for offset in range(_INSTRUCTION_COUNT - len(data), -1, -1):
+            if not self.used & (mask << offset):
+                break
+        else:
+            raise OSError("no space in PIO instruction memory")
+        for i, instr in enumerate(data):
+            if instr >> 13 == 0:
+                # JMP targets are relocated, as by the SDK
+                instr = (instr & ~0x1f) | ((instr + offset) & 0x1f)
+            self.memory[offset + i] = instr
+        self.used |= mask << offset
+        self.loaded[key] = offset
+        return offset
+
+class System:
+    """Emulated RP2040:  system clock, GPIO, and both PIO blocks
+    sys_freq:  System clock in Hz.
+    cycle:  System clock cycles run.
+    observers:  Called with the System at the end of every cycle.
+    input_hooks:  Called with (state machine, pin base, count) whenever
+       a state machine reads pins.
+    """
+    def __init__(self, sys_freq: int = 125_000_000):
+        self.sys_freq = sys_freq
+        self.cycle = 0
+        self.blocks = [_Block(self, 0), _Block(self, 1)]
+        self.machines = {}
+        self.observers = []
+        self.input_hooks = []
+        self.pin_values = 0
+        self.pin_dirs = 0
+        self.external_values = 0
+        self.external_mask = 0
+        # Pin levels for the last three cycles, oldest first
+        self._history = deque([0, 0, 0], maxlen=3)
+
+    def time(self) -> float:
+        """Emulated time in seconds"""
+        return self.cycle / self.sys_freq
+
+    def time_ns(self) -> float:
+        return self.cycle * 1e9 / self.sys_freq
+
+    def levels(self) -> tuple:
+        """(levels, driven) of every pin, as bit masks"""
+        driven = self.pin_dirs | self.external_mask
+        levels = ((self.pin_values & self.pin_dirs)
+                  | (self.external_values & self.external_mask
+                     & ~self.pin_dirs))
+        return levels, driven
+
+    def inputs(self) -> int:
+        # Pin levels through the two-flop synchronizer
+        return self._history[-2]
+
+    def drive(self, base: int, count: int, value: int):
+        """Drive pins from outside, e.g. a chip's data bus"""
+        mask = _mask(count) << base
+        self.external_mask |= mask
+        self.external_values = ((self.external_values & ~mask)
+                                | ((value << base) & mask))
+
+    def release(self, base: int, count: int):
+        self.external_mask &= ~(_mask(count) << base)
+
+    def step(self):
+        for machine in self.machines.values():
+            if machine._enabled and machine._clock():
+                machine._execute()
+        for block in self.blocks:
+            block.irq |= block.irq_set
+            block.irq_set = 0
+        self._history.append(self.levels()[0])
+        for observer in self.observers:
+            observer(self)
+        self.cycle += 1
+
+    def run(self, cycles: int):
+        for i in range(0, cycles):
+            self.step()
+
+    def run_until(self, condition, limit: int = 10_000_000):
+        """Step until condition() is true; raises if it never is"""
+        for i in range(0, limit):
+            if condition():
+                return
+            self.step()
+        raise RuntimeError(f"no progress in {limit} cycles")
+
+_system = System()
+
+def system() -> System:
+    """The emulated RP2040"""
+    return _system
+
+def reset(sys_freq: int = 125_000_000) -> System:
+    """Start over with a new emulated RP2040"""
+    global _system
+    _system = System(sys_freq)
+    return _system
+
+def install():
+    """Put the stand-in rp2 and machine modules on the path"""
+    shim = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shim")
+    if shim not in sys.path:
+        sys.path.insert(0, shim)
+
+class StateMachine:
+    """PIO state machine, as MicroPython's rp2.StateMachine"""
+    def __init__(self, id: int, program=None, *args, **kwargs):
+        self.id = id
+        self._system = system()
+        self._block = self._system.blocks[id // 4]
+        self._enabled = False
+        if program is not None:
+            self.init(program, *args, **kwargs)
+
+    def init(self, program, freq: int = -1, *, in_base=None, out_base=None,
+             set_base=None, jmp_pin=None, sideset_base=None,
+             in_shiftdir=None, out_shiftdir=None, push_thresh=None,
+             pull_thresh=None):
+        system = self._system
+        self._system.machines[self.id] = self
+        self.offset = self._block.add_program(program)
+        execctrl = program[_PROG_EXECCTRL]
+        shiftctrl = program[_PROG_SHIFTCTRL]
+        self.wrap_bottom = self.offset + ((execctrl >> 7) & 0x1f)
+        self.wrap_top = self.offset + ((execctrl >> 12) & 0x1f)
+        self.autopush = bool(shiftctrl & (1 << 16))
+        self.autopull = bool(shiftctrl & (1 << 17))
+        self.in_shiftdir = (in_shiftdir if in_shiftdir is not None
+                            else (shiftctrl >> 18) & 1)
+        self.out_shiftdir = (out_shiftdir if out_shiftdir is not None
+                             else (shiftctrl >> 19) & 1)
+        self.push_thresh = (push_thresh if push_thresh is not None
+                            else (shiftctrl >> 20) & 0x1f) or 32
+        self.pull_thresh = (pull_thresh if pull_thresh is not None
+                            else (shiftctrl >> 25) & 0x1f) or 32
+
+        self.in_base = _pin_id(in_base) if in_base is not None else 0
+        self.out_base = _pin_id(out_base) if out_base is not None else 0
+        self.set_base = _pin_id(set_base) if set_base is not None else 0
+        self.sideset_base = (_pin_id(sideset_base)
+                             if sideset_base is not None else 0)
+        self.jmp_pin = _pin_id(jmp_pin) if jmp_pin is not None else 0
+        self.out_count = _pin_count(program[_PROG_OUT_PINS])
+        self.set_count = _pin_count(program[_PROG_SET_PINS])
+        self.sideset_count = _pin_count(program[_PROG_SIDESET_PINS])
+        for base, init in ((self.out_base, program[_PROG_OUT_PINS]),
+                           (self.set_base, program[_PROG_SET_PINS]),
+                           (self.sideset_base,
+                            program[_PROG_SIDESET_PINS])):
+            for i, mode in enumerate(_pin_init(init)):
+                self._write_pins(base + i, 1, mode & 1)
+                self._write_dirs(base + i, 1, mode >> 1)
+
+        # Clock divider in 1/256 system clock cycles
+        if freq is None or freq < 0:
+            self._divider = 256
+        else:
+            self._divider = max(256, round(system.sys_freq * 256 / freq))
+        self._phase = 0
+        self.restart()
+
+    def restart(self):
+        self.pc = self.offset
+        self.x = 0
+        self.y = 0
+        self.osr = 0
+        self.osr_count = 32
+        self.isr = 0
+        self.isr_count = 0
+        self.tx = deque()
+        self.rx = deque()
+        self._delay = 0
+
+    def active(self, value=None) -> bool:
+        if value is not None:
+            self._enabled = bool(value)
+        return self._enabled
+
+    def put(self, value, shift: int = 0):
+        """Put a word, or every word of a buffer, waiting on a full FIFO"""
+        words = [value] if isinstance(value, int) else value
+        for word in words:
+            self._system.run_until(lambda: len(self.tx) < _FIFO_DEPTH)
+            self.tx.append((word << shift) & 0xffffffff)
+
+    def get(self, buf=None, shift: int = 0) -> int:
+        """Get a word, waiting on an empty FIFO"""
+        self._system.run_until(lambda: len(self.rx) > 0)
+        return self.rx.popleft() >> shift
+
+    def tx_fifo(self) -> int:
+        return len(self.tx)
+
+    def rx_fifo(self) -> int:
+        return len(self.rx)
+
+    def idle(self) -> bool:
+        """Nothing left to do:  FIFO and OSR empty, back at the start"""
+        return (not self.tx and self.osr_count >= self.pull_thresh
+                and self.pc == self.offset and self._delay == 0)
+
+    def _clock(self) -> bool:
+        self._phase += 256
+        if self._phase >= self._divider:
+            self._phase -= self._divider
+            return True
+        return False
+
+    def _write_pins(self, base: int, count: int, value: int):
+        system = self._system
+        for i in range(0, count):
+            bit = 1 << ((base + i) % 32)
+            if (value >> i) & 1:
+                system.pin_values |= bit
+            else:
+                system.pin_values &= ~bit
+
+    def _write_dirs(self, base: int, count: int, value: int):
+        system = self._system
+        for i in range(0, count):
+            bit = 1 << ((base + i) % 32)
+            if (value >> i) & 1:
+                system.pin_dirs |= bit
+            else:
+                system.pin_dirs &= ~bit
+
+    def _read_pins(self, count: int = 32) -> int:
+        for hook in self._system.input_hooks:
+            hook(self, self.in_base, count)
+        inputs = self._system.inputs()
+        value = ((inputs >> self.in_base)
+                 | (inputs << (32 - self.in_base))) & 0xffffffff
+        return value & _mask(count)
+
+    def _refill(self):
+        if self.autopull and self.osr_count >= self.pull_thresh and self.tx:
+            self.osr = self.tx.popleft()
+            self.osr_count = 0
+
+    def _execute(self):
+        if self._delay:
+            self._delay -= 1
+            self._refill()
+            return
+        instr = self._block.memory[self.pc]
+        # Side-set takes effect as the instruction issues, stalled or not
+        delay_bits = 5 - self.sideset_count
+        if self.sideset_count:
+            self._write_pins(self.sideset_base, self.sideset_count,
+                             (instr >> (8 + delay_bits))
+                             & _mask(self.sideset_count))
+        result = self._do(instr)
+        if result is False:
+            self._refill()
+            return
+        if result is None:
+            self.pc = (self.wrap_bottom if self.pc == self.wrap_top
+                       else (self.pc + 1) % _INSTRUCTION_COUNT)
+        else:
+            self.pc = result
+        self._delay = (instr >> 8) & _mask(delay_bits)
+        self._refill()
+
+    def _do(self, instr: int):
+        # Returns False to stall, a new pc to jump, or None
+        opcode = instr >> 13
+        operand = instr & 0xff
+        block = self._block
+        if opcode == 0:
+            condition = (operand >> 5) & 7
+            if condition == 0:
+                taken = True
+            elif condition == 1:
+                taken = self.x == 0
+            elif condition == 2:
+                taken = self.x != 0
+                self.x = (self.x - 1) & 0xffffffff
+            elif condition == 3:
+                taken = self.y == 0
+            elif condition == 4:
+                taken = self.y != 0
+                self.y = (self.y - 1) & 0xffffffff
+            elif condition == 5:
+                taken = self.x != self.y
+            elif condition == 6:
+                taken = bool((self._system.inputs() >> self.jmp_pin) & 1)
+            else:
+                taken = self.osr_count < self.pull_thresh
+            return operand & 0x1f if taken else None
+        if opcode == 1:
+            polarity = operand >> 7
+            source = (operand >> 5) & 3
+            index = operand & 0x1f
+            if source == 2:
+                flag = 1 << (index & 7)
+                if polarity:
+                    if not block.irq & flag:
+                        return False
+                    block.irq &= ~flag
+                    return None
+                return None if not block.irq & flag else False
+            pin = index if source == 0 else self.in_base + index
+            if source == 0:
+                for hook in self._system.input_hooks:
+                    hook(self, pin, 1)
+                level = (self._system.inputs() >> pin) & 1
+            else:
+                level = self._read_pins(index + 1) >> index
+            return None if level == polarity else False
+        if opcode == 2:
+            source = (operand >> 5) & 7
+            count = (operand & 0x1f) or 32
+            if (self.autopush and self.isr_count >= self.push_thresh
+                    and len(self.rx) >= _FIFO_DEPTH):
+                return False
+            data = {
+                0: lambda: self._read_pins(count),
+                1: lambda: self.x,
+                2: lambda: self.y,
+                3: lambda: 0,
+                6: lambda: self.isr,
+                7: lambda: self.osr,
+            }[source]() & _mask(count)
+            if self.in_shiftdir:
+                self.isr = ((self.isr >> count) if count < 32 else 0) \
+                    | (data << (32 - count))
+            else:
+                self.isr = ((self.isr << count) | data) & 0xffffffff
+            self.isr_count = min(32, self.isr_count + count)
+            if self.autopush and self.isr_count >= self.push_thresh:
+                self.rx.append(self.isr)
+                self.isr = 0
+                self.isr_count = 0
+            return None
+        if opcode == 3:
+            dest = (operand >> 5) & 7
+            count = (operand & 0x1f) or 32
+            if self.autopull and self.osr_count >= self.pull_thresh:
+                if not self.tx:
+                    return False
+                self._refill()
+            if self.out_shiftdir:
+                data = self.osr & _mask(count)
+                self.osr = (self.osr >> count) if count < 32 else 0
+            else:
+                data = self.osr >> (32 - count)
+                self.osr = (self.osr << count) & 0xffffffff
+            self.osr_count = min(32, self.osr_count + count)
+            if dest == 0:
+                self._write_pins(self.out_base, count, data)
+            elif dest == 1:
+                self.x = data
+            elif dest == 2:
+                self.y = data
+            elif dest == 4:
+                self._write_dirs(self.out_base, count, data)
+            elif dest == 5:
+                return data & 0x1f
+            elif dest == 6:
+                self.isr = data
+                self.isr_count = count
+            elif dest == 7:
+                raise NotImplementedError("OUT EXEC")
+            return None
+        if opcode == 4:
+            condition = bool(operand & 0x40)
+            blocking = bool(operand & 0x20)
+            if not operand & 0x80:
+                if condition and self.isr_count < self.push_thresh:
+                    return None
+                if len(self.rx) >= _FIFO_DEPTH:
+                    if blocking:
+                        return False
+                else:
+                    self.rx.append(self.isr)
+                self.isr = 0
+                self.isr_count = 0
+                return None
+            if condition and self.osr_count < self.pull_thresh:
+                return None
+            if not self.tx:
+                if blocking:
+                    return False
+                self.osr = self.x
+            else:
+                self.osr = self.tx.popleft()
+            self.osr_count = 0
+            return None
+        if opcode == 5:
+            dest = (operand >> 5) & 7
+            op = (operand >> 3) & 3
+            source = operand & 7
+            if source == 5:
+                raise NotImplementedError("MOV from STATUS")
+            data = {
+                0: lambda: self._read_pins(),
+                1: lambda: self.x,
+                2: lambda: self.y,
+                3: lambda: 0,
+                6: lambda: self.isr,
+                7: lambda: self.osr,
+            }[source]()
+            if op == 1:
+                data = ~data & 0xffffffff
+            elif op == 2:
+                data = _reverse(data)
+            if dest == 0:
+                self._write_pins(self.out_base, self.out_count, data)
+            elif dest == 1:
+                self.x = data
+            elif dest == 2:
+                self.y = data
+            elif dest == 4:
+                raise NotImplementedError("MOV EXEC")
+            elif dest == 5:
+                return data & 0x1f
+            elif dest == 6:
+                self.isr = data
+                self.isr_count = 0
+            elif dest == 7:
+                self.osr = data
+                self.osr_count = 0
+            return None
+        if opcode == 6:
+            flag = 1 << (operand & 7)
+            if operand & 0x10:
+                raise NotImplementedError("relative IRQ")
+            if operand & 0x40:
+                block.irq &= ~flag
+                return None
+            if operand & 0x20:
+                # Set, then wait for it to be cleared
+                if getattr(self, "_irq_waiting", False):
+                    if block.irq & flag:
+                        return False
+                    self._irq_waiting = False
+                    return None
+                block.irq_set |= flag
+                self._irq_waiting = True
+                return False
+            block.irq_set |= flag
+            return None
+        dest = (operand >> 5) & 7
+        data = operand & 0x1f
+        if dest == 0:
+            self._write_pins(self.set_base, self.set_count, data)
+        elif dest == 1:
+            self.x = data
+        elif dest == 2:
+            self.y = data
+        elif dest == 4:
+            self._write_dirs(self.set_base, self.set_count, data)
+        return None
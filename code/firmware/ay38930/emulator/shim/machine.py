@@ -0,0 +1,26 @@
+# Stand-in for MicroPython's machine module, backed by the PIO emulator
+# (see ../pio.py)
+
+from ay38930.emulator import pio
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id: int, mode: int = -1, pull: int = -1,
+                 value=None):
+        self.id = id
+
+    def value(self, value=None):
+        levels, driven = pio.system().levels()
+        if value is None:
+            return (levels >> self.id) & 1
+        pio.system().drive(self.id, 1, value)
+
+def freq(hz=None):
+    """The emulated system clock; setting it starts a new emulation"""
+    if hz is None:
+        return pio.system().sys_freq
+    pio.reset(hz)
@@ -0,0 +1,4 @@
+# Stand-in for MicroPython's rp2 module, backed by the PIO emulator
+# (see ../pio.py)
+
+from ay38930.emulator.pio import asm_pio, PIO, PIOASMError, StateMachine
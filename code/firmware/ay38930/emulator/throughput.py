@@ -0,0 +1,133 @@
+import argparse
+import sys
+from . import pio
+from .bus import LatchedChip, SyncChip
+
+# Bus throughput and timing of PIOInterface, under emulation
+#
+#   cd code/firmware && python -m ay38930.emulator.throughput
+#
+# Runs interface.py unchanged on the emulated RP2040 (see pio.py) against
+# a model of each chip (see bus.py), and reports register writes and
+# reads per second and the smallest margin of every timing parameter.
+# The writes are all different, so WriteBatch drops none of them, but
+# the address is only latched when it changes.  Exits nonzero if a
+# register or read comes back wrong, or any timing is violated.
+#
+# The emulator is cycle-level for the state machines and nothing else:
+# it does not model the CPU, so each batch starts as flush() is called,
+# or pin slew and input thresholds, so a pin is at its new level the
+# cycle it changes.
+
+SYS_FREQ = 125_000_000
+
+# (name, chip, chip clock in Hz)
+VARIANTS = (
+    ("8910", "8910", 2_000_000),
+    ("YM2149", "YM2149", 2_000_000),
+    ("8930", "8930", 2_000_000),
+    ("HardAY 9.216MHz", "HardAY", 9_216_000),
+    ("HardAY 24.576MHz", "HardAY", 24_576_000),
+)
+
+# Pins:  DA7-DA0, then BC1 and BDIR, the chip clock, and reset
+DA_BASE = 0
+BC1 = 8
+CLOCK = 10
+RESET = 11
+
+def _check_labels(interface):
+    # The encoder's entry points must match the programs
+    from .. import encoder
+    for program, names in (
+            (interface.latched_io, ("SET_ADDRESS", "SET_DATA", "GET_DATA")),
+            (interface.sync_io, ("SYNC_WRITE_REGISTER", "SYNC_SET_DATA",
+                                 "SYNC_SET_ADDRESS", "SYNC_GET_DATA"))):
+        labels = program[pio._PROG_LABELS]
+        for name in names:
+            label = name.lower().replace("sync_", "").replace("_", " ")
+            assert labels[label] == getattr(encoder, name), \
+                f"encoder.{name} is {getattr(encoder, name)}, " \
+                f"but the program has '{label}' at {labels[label]}"
+
+def run(chip: str, clock_freq: int, writes: int = 256,
+        reads: int = 64) -> dict:
+    """Emulate one chip on PIOInterface
+    Returns writes/s, reads/s, the chip model's margins, and a list of
+    errors, empty if all went well.
+    """
+    system = pio.reset(SYS_FREQ)
+    pio.install()
+    from machine import Pin
+    from ..interface import PIOInterface
+    _check_labels(PIOInterface)
+
+    interface = PIOInterface(Pin(DA_BASE), Pin(BC1), Pin(CLOCK),
+                             Pin(RESET), chip=chip, clock_freq=clock_freq)
+    if interface.sync:
+        model = SyncChip(system, CLOCK, DA_BASE, BC1)
+    else:
+        model = LatchedChip(system, chip, DA_BASE, BC1)
+    errors = []
+
+    expected = {}
+    batch = []
+    for i in range(0, writes):
+        address, value = i % 13, (i * 37 + 1) & 0xff
+        batch.append((address, value))
+        expected[address] = value
+    start = system.cycle
+    interface.write_registers(batch)
+    system.run_until(interface.pio_sm.idle)
+    write_time = (system.cycle - start) / system.sys_freq
+    if model.writes != writes:
+        errors.append(f"{model.writes} of {writes} writes reached the chip")
+    wrong = [x for x in expected if model.registers.get(x) != expected[x]]
+    if wrong:
+        errors.append("wrong value in " + ", ".join(f"R{x}" for x in wrong))
+
+    # Alternate addresses, so every read latches
+    start = system.cycle
+    wrong = 0
+    for i in range(0, reads):
+        address = (i * 5) % 13
+        if interface.read_register(address) != expected[address]:
+            wrong += 1
+    if wrong:
+        errors.append(f"{wrong} of {reads} reads came back wrong")
+    system.run_until(interface.pio_sm.idle)
+    read_time = (system.cycle - start) / system.sys_freq
+
+    errors += [f"{name} violated by {-model.margins[name]:.0f}ns"
+               for name in model.violations()]
+    if model.contention:
+        errors.append(f"bus contention for {model.contention} cycles")
+    return {
+        "writes": writes / write_time,
+        "reads": reads / read_time,
+        "margins": dict(model.margins),
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Emulate PIOInterface against each chip")
+    parser.add_argument("-n", "--writes", type=int, default=256)
+    parser.add_argument("--reads", type=int, default=64)
+    args = parser.parse_args()
+
+    failed = False
+    for name, chip, clock_freq in VARIANTS:
+        result = run(chip, clock_freq, args.writes, args.reads)
+        margins = ", ".join(f"{x} {y:.0f}ns"
+                            for x, y in sorted(result["margins"].items()))
+        print(f"{name}: {result['writes']:,.0f} writes/s, "
+              f"{result['reads']:,.0f} reads/s")
+        print(f"  margins: {margins}")
+        for error in result["errors"]:
+            print(f"  error: {error}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# Batched register writes for PIOInterface
+#
+# Plain Python, so it runs on the RP2040 and on a host alike:  the only
+# thing it needs from the bus is a state machine, or anything else
+# with put(), to take an array of OSR words.
+#
+# WriteBatch turns register writes into OSR words for latched_io (see
+# interface.py), keeping what the chip holds so a batch carries only
+# what changes it:
+#
+#   - A shadow copy of every register written.  A write of the value
+#     already there is dropped, except R13, which restarts the
+#     envelope, and R14 and R15, the I/O ports and mode select.
+#   - The address last latched.  The chip keeps it, so writing the
+#     same register again, e.g. a stream of R13 or R15 writes, skips
+#     the address word.
+#   - The bank or page selected, since the same address is a different
+#     register in each:  on an AY-3-8930, R13 B7-B4 select its expanded
+#     mode and bank; on a HardAY, R15 of file zero selects the bank or
+#     enhanced page.  The 8910 and YM2149 have no banks, and their R15
+#     is an I/O port.
+#
+# A register write is an address word, unless the address is already
+# latched, then a data word; a read is the same with a read word.  Words
+# are packed ahead of time into one array, and flush() hands the whole
+# batch to the state machine with one put().
+#
+# BusTiming sets the count field of each word from the chip's timing
+# table at the PIO clock, so the 8910's 1800ns write pulse doesn't hold
+# up a YM2149 or 8930.
+#
+# The 96kHz chips, HardAY, use sync_io instead, timed by the chip's
+# clock rather than a count.  Their words carry two bytes, so a write
+# to a new address is a single word.
+
+from array import array
+
+# Timings in ns, from the table in interface.py.  The 8930 has no
+# minimum write pulse, but its write setup runs to the end of the pulse.
+CHIPS = {
+    "8910": {
+        "address_setup": 400, "address_hold": 100, "write_setup": 50,
+        "write_pulse": 1800, "write_hold": 100, "read_access": 350,
+    },
+    "YM2149": {
+        "address_setup": 300, "address_hold": 80, "write_setup": 0,
+        "write_pulse": 300, "write_hold": 80, "read_access": 400,
+    },
+    "8930": {
+        "address_setup": 300, "address_hold": 65, "write_setup": 300,
+        "write_pulse": 0, "write_hold": 65, "read_access": 200,
+    },
+}
+SETUP_TO_END = ("8930",)
+SYNC_CHIPS = ("HardAY",)
+
+# Entry points of latched_io, from the start of the program.  These
+# must stay in step with the program in interface.py.
+SET_ADDRESS = 3
+SET_DATA = 7
+GET_DATA = 11
+
+# Entry points of sync_io
+SYNC_WRITE_REGISTER = 3
+SYNC_SET_DATA = 12
+SYNC_SET_ADDRESS = 16
+SYNC_GET_DATA = 22
+
+COUNT_BITS = 4
+PULL_THRESHOLD = 25
+SYNC_PULL_THRESHOLD = 29
+
+# Registers written even when the shadow matches
+_ALWAYS = (13, 14, 15)
+
+def pack(pindirs: int, target: int, data: int = 0, count: int = 0) -> int:
+    """OSR word for latched_io"""
+    return ((pindirs & 0xff) | ((target & 0x1f) << 8)
+            | ((data & 0xff) << 13)
+            | ((count & ((1 << COUNT_BITS) - 1)) << 21))
+
+def pack_sync(pindirs: int, target: int, first: int = 0,
+              second: int = 0) -> int:
+    """OSR word for sync_io"""
+    return ((pindirs & 0xff) | ((target & 0x1f) << 8)
+            | ((first & 0xff) << 13) | ((second & 0xff) << 21))
+
+def unpack(word: int) -> tuple:
+    """(pindirs, target, data, count) of an OSR word"""
+    return (word & 0xff, (word >> 8) & 0x1f, (word >> 13) & 0xff,
+            (word >> 21) & ((1 << COUNT_BITS) - 1))
+
+def _ticks(ns: int, pio_freq: int) -> int:
+    # PIO clock ticks covering (ns), rounded up
+    return -(-ns * pio_freq // 10**9)
+
+def _count(ticks: int) -> int:
+    # Loop count for a delay loop of two ticks per pass
+    count = max(0, -(-ticks // 2))
+    assert count < 1 << COUNT_BITS, "timing too long for the PIO clock"
+    return count
+
+class BusTiming:
+    """Count fields of the OSR words for one chip at one PIO clock
+    address:  Latch held for 2*address + 4 ticks with the address on
+       the bus.
+    write:  Write pulse of 2*write + 3 ticks, after one tick of data
+       setup.
+    read:  Read strobe for 2*read + 4 ticks before the data bus is
+       sampled, a tick past the read access time to cover the input
+       synchronizer.
+    sync:  The chip uses sync_io, and the counts are unused.
+    """
+    def __init__(self, chip: str = "8910", pio_freq: int = 10_000_000):
+        assert chip in CHIPS or chip in SYNC_CHIPS, \
+            "chip must be one of " + ", ".join(tuple(CHIPS) + SYNC_CHIPS)
+        self.chip = chip
+        self.pio_freq = pio_freq
+        self.sync = chip in SYNC_CHIPS
+        self.address = self.write = self.read = 0
+        if self.sync:
+            return
+        timing = CHIPS[chip]
+        pulse = timing["write_pulse"]
+        if chip in SETUP_TO_END:
+            pulse = max(pulse, timing["write_setup"])
+        else:
+            # Data goes out one tick before the write strobe
+            assert _ticks(timing["write_setup"], pio_freq) <= 1, \
+                "PIO clock too fast for the write setup"
+        # The bus holds its last value for three ticks after the strobe
+        assert _ticks(max(timing["address_hold"], timing["write_hold"]),
+                      pio_freq) <= 3, "PIO clock too slow for the hold time"
+        self.address = _count(_ticks(timing["address_setup"], pio_freq) - 4)
+        self.write = _count(_ticks(pulse, pio_freq) - 3)
+        self.read = _count(_ticks(timing["read_access"], pio_freq) - 3)
+
+class WriteBatch:
+    """Register write coalescing and OSR encoding
+    timing:  BusTiming for the chip.
+    origin:  Where latched_io is loaded in instruction memory.
+    words:  The OSR words batched since the last flush.
+    written, dropped, latches_skipped:  Counts of register writes
+       encoded, dropped as redundant, and encoded without an address
+       word.
+    """
+    def __init__(self, timing: BusTiming, origin: int = 0):
+        self.timing = timing
+        self.origin = origin
+        self.words = array("I")
+        self.written = 0
+        self.dropped = 0
+        self.latches_skipped = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget what the chip holds, e.g. after a reset"""
+        self._shadow = {}
+        self._latched = None
+        self._page = 0
+
+    def latch(self, address: int):
+        """Batch an address word, unless (address) is already latched"""
+        if address == self._latched:
+            self.latches_skipped += 1
+            return
+        if self.timing.sync:
+            self.words.append(pack_sync(0xff, self.origin + SYNC_SET_ADDRESS,
+                                        address))
+        else:
+            self.words.append(pack(0xff, self.origin + SET_ADDRESS, address,
+                                   self.timing.address))
+        self._latched = address
+
+    def _select(self, address: int, value: int):
+        # Follow the bank or page select, if (address) is one
+        chip = self.timing.chip
+        if chip == "8930" and address == 13:
+            # B7-B4 of 101x select expanded mode and bank x
+            select = value >> 4
+            self._page = select & 1 if select >> 1 == 0b101 else 0
+        elif chip in SYNC_CHIPS and address == 15:
+            select = value >> 5
+            if select == 0b101:
+                self._page = (value >> 4) & 1
+            elif select == 0b111:
+                self._page = 2
+            else:
+                self._page = 0
+
+    def write(self, address: int, value: int):
+        """Batch a write to DA7-DA0 (address), unless it changes nothing"""
+        address &= 0xff
+        value &= 0xff
+        key = (self._page, address)
+        if (address & 0x0f) not in _ALWAYS and self._shadow.get(key) == value:
+            self.dropped += 1
+            return
+        if self.timing.sync:
+            if address == self._latched:
+                self.latches_skipped += 1
+                self.words.append(pack_sync(0xff, self.origin + SYNC_SET_DATA,
+                                            value))
+            else:
+                self.words.append(pack_sync(
+                    0xff, self.origin + SYNC_WRITE_REGISTER, address, value))
+                self._latched = address
+        else:
+            self.latch(address)
+            self.words.append(pack(0xff, self.origin + SET_DATA, value,
+                                   self.timing.write))
+        self._shadow[key] = value
+        self.written += 1
+        self._select(address, value)
+
+    def read(self, address: int):
+        """Batch a read of (address); its value comes back in the RX
+        FIFO
+        """
+        self.latch(address & 0xff)
+        if self.timing.sync:
+            self.words.append(pack_sync(0x00, self.origin + SYNC_GET_DATA))
+        else:
+            self.words.append(pack(0x00, self.origin + GET_DATA, 0,
+                                   self.timing.read))
+
+    def flush(self, sm):
+        """Put the batch to the state machine, and start a new one"""
+        if len(self.words):
+            sm.put(self.words)
+            self.words = array("I")
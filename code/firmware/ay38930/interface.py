@@ -1,47 +1,63 @@
 # Interface to the AY-3-8930 and YM2149F
 #
-# 
+#
 
 from machine import Pin, freq
 import rp2
+from .encoder import (BusTiming, WriteBatch, SYNC_CHIPS, PULL_THRESHOLD,
+                      SYNC_PULL_THRESHOLD)
 
 class RegisterInterface:
-    __init__(self):
+    def __init__(self):
         pass
 
 class PIOInterface:
-    __init__(self, da_base: Pin, bc1: Pin, clock: Pin, reset: Pin):
-        assert freq() % (2*10**6) == 0, "machine.freq must be divisible by 2MHz"
-
-        self.pio_req = freq() / 2000000
-
-        self.da_pins = da_pins
+    def __init__(self, da_base: Pin, bc1: Pin, clock: Pin, reset: Pin,
+                 chip: str = "8910", pio_freq: int = None,
+                 clock_freq: int = None):
+        self.sync = chip in SYNC_CHIPS
+        # sync_io runs at the system clock to follow the chip's clock;
+        # latched_io needs ticks of at least 100ns
+        if pio_freq is None:
+            pio_freq = freq() if self.sync else 10_000_000
+        if clock_freq is None:
+            clock_freq = 9_216_000 if self.sync else 2_000_000
+        self.pio_freq = pio_freq
+        self.clock_freq = clock_freq
+
+        self.da_pins = da_base
         self.bc1_pin = bc1
         self.clock_pin = clock
         self.reset_pin = reset
+        self.timing = BusTiming(chip, pio_freq)
+        self.batch = WriteBatch(self.timing,
+                                self._SYNC_IO_ORIGIN if self.sync
+                                else self._LATCHED_IO_ORIGIN)
         self._program_pio()
 
-    @rp2.asm_pio()
-    def run_clock(self):
+    @rp2.asm_pio(set_init=rp2.PIO.OUT_LOW)
+    def run_clock():
         wrap_target()
-        # Rising edge
-        irq(0)
+        # Rising edge, then IRQ 1 a quarter clock later for sync_io
         set(pins,1)
 
         irq(1)
-        set(pins,0)
+        set(pins,0) [1]
 
     # OSR format:
-    #   |31-21        |20-13    |12-8  |7-0     |
-    #   |0000 0000 000|data     |fnc   |pindirs |
+    #   |31-25    |24-21 |20-13    |12-8  |7-0     |
+    #   |0000 000 |count |data     |fnc   |pindirs |
+    #
+    # fnc is the entry point to jump to, and count sets how long the
+    # entry point holds the control bus; encoder.py packs these words.
 
     # The latched I/O interface is for the 5V AY-3-89xx and YM2149 and
     # is divorced from the clock.  Timings in ns are:
-    # 
+    #
     #                8910  YM2149  8930
     # Address setup   400     300   300
     # Address hold    100      80    65
-    # Write setup      50       0   300      
+    # Write setup      50       0   300
     # Write pulse    1800     300     *
     # Write hold      100      80    65
     # Read access     350     400   200
@@ -53,8 +69,10 @@ class PIOInterface:
     # the same as the 8930 data "setup."
     #
     # Each clock tick must be more than 100ns (10MHz) to meet the above
-    # timing.  Writes are stretched out a lot because of the long write
-    # pulse of the 8910.
+    # timing.  Each entry point spins two ticks per count, so the 8910's
+    # long write pulse only stretches out writes to the 8910.  The bus
+    # keeps its last value for three ticks after the control bus drops,
+    # which covers every hold time.
     #
     # OSR       *
     # bc1/bdir  ___----_
@@ -62,11 +80,15 @@ class PIOInterface:
     # pindir     *
     # delay         +++
 
-    @rp2.asm_pio()
-    def latched_io(self):
+    @rp2.asm_pio(out_init=(rp2.PIO.IN_LOW,)*8,
+                 sideset_init=(rp2.PIO.OUT_LOW,)*2,
+                 out_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                 autopull=True, pull_thresh=PULL_THRESHOLD,
+                 autopush=True, push_thresh=8)
+    def latched_io():
         label("reenter")
         # Close all latches while spinning
-        .wrap_target()
+        wrap_target()
         jmp(not_osre, "handle") .side(0b00)
         wrap()
 
@@ -76,48 +98,156 @@ class PIOInterface:
         out(pc, 5)
 
         label("set address")
-        out(pins, 8) .side(0b11) [3]
+        out(pins, 8) .side(0b11)
+        out(x, 4) .side(0b11)
+        label("address setup")
+        jmp(x_dec, "address setup") .side(0b11) [1]
         jmp("reenter")
 
         # Long write pulse for the original 8910
         label("set data")
         out(pins, 8)
-        set(x, 3) .side(0b10) [3]
+        out(x, 4) .side(0b10)
         label("write pulse")
-        jmp(dec_x, "write pulse") [3]
+        jmp(x_dec, "write pulse") .side(0b10) [1]
         jmp("reenter")
 
         # Data is read on the falling edge in the original AY-3
         label("get data")
-        # Reading, so discard the last 8 bits of OSR
-        # Data READ access time is max 350ns, so delay to 400ns
-        out(null, 8) .side(0b01) [3]
-        in(pins, 8)
+        # Reading, so discard the data bits of OSR
+        out(null, 8) .side(0b01)
+        out(x, 4) .side(0b01)
+        label("read access")
+        jmp(x_dec, "read access") .side(0b01) [1]
         # Reset the control bus ASAP because it may take 400ns to
         # settle after reading
-        jmp("reenter") .side(0b00)
+        in_(pins, 8) .side(0b00)
+        jmp("reenter")
+
+    # The SDK loads the first program at the top of instruction memory
+    _LATCHED_IO_ORIGIN = 32 - len(latched_io[0])
 
     # The sync_io() interface is designed for 96kHz sample rate chips
     # running at 9.216MHz or 24.576MHz.
-    @rp2.asm_pio()
-    def sync_io(self):
+    #
+    # OSR format:
+    #   |31-29 |28-21    |20-13    |12-8  |7-0     |
+    #   |000   |second   |first    |fnc   |pindirs |
+    #
+    # The chip samples the bus on the rising edge of its clock, which
+    # run_clock drives.  run_clock raises IRQ 1 a quarter clock after
+    # each rising edge, and each bus phase starts there:  the bus then
+    # holds for a quarter clock after the edge that takes it, and sets
+    # up for three quarters of a clock before.  Each entry point clears
+    # the IRQ just before its first wait, so a phase never starts on an
+    # edge that went by while the word was unpacked.
+    #
+    # Each phase lasts one clock:  a latch (bc1/bdir 11) of the first
+    # byte, or a write (10) of the second byte or of the first.  A write
+    # to a new address is one word, latch then write, in two clocks.  A
+    # read (01) lasts two, and is sampled a clock and a quarter after
+    # the chip sees it, to cover its output delay.
+    #
+    # The program is 29 instructions, with run_clock the rest of
+    # instruction memory.
+    @rp2.asm_pio(out_init=(rp2.PIO.IN_LOW,)*8,
+                 sideset_init=(rp2.PIO.OUT_LOW,)*2,
+                 out_shiftdir=rp2.PIO.SHIFT_RIGHT,
+                 autopull=True, pull_thresh=SYNC_PULL_THRESHOLD,
+                 autopush=True, push_thresh=8)
+    def sync_io():
         label("reenter")
-        # Loop until a rising edge occurs with something in the OSR
-        .wrap_target()
-        wait(1, irq, 0)
-        jmp(not_osre, "handle")
+        # Close all latches while spinning
+        wrap_target()
+        jmp(not_osre, "handle") .side(0b00)
         wrap()
 
         # Handle i/o, jump to location given on input.
         label("handle")
         out(pindirs, 8)
         out(pc, 5)
-        # FIXME:  Implement this
+
+        # Address, then data
+        label("write register")
+        out(y, 8)
+        out(x, 8)
+        irq(clear, 1)
+        wait(1, irq, 1)
+        mov(pins, y) .side(0b11)
+        wait(1, irq, 1) .side(0b11)
+        label("write")
+        mov(pins, x) .side(0b10)
+        wait(1, irq, 1) .side(0b10)
+        jmp("reenter")
+
+        # Data to the address already latched.  Only eight bits of x
+        # reach the pins, so the unused byte goes along with it.
+        label("set data")
+        out(x, 16)
+        irq(clear, 1)
+        wait(1, irq, 1)
+        jmp("write")
+
+        label("set address")
+        out(y, 16)
+        irq(clear, 1)
+        wait(1, irq, 1)
+        mov(pins, y) .side(0b11)
+        wait(1, irq, 1) .side(0b11)
+        jmp("reenter")
+
+        label("get data")
+        out(null, 16)
+        irq(clear, 1)
+        wait(1, irq, 1)
+        wait(1, irq, 1) .side(0b01)
+        wait(1, irq, 1) .side(0b01)
+        in_(pins, 8) .side(0b01)
+        jmp("reenter")
+
+    _SYNC_IO_ORIGIN = 32 - len(sync_io[0])
+
+    def _program_pio(self):
+        # The bus program goes in first, at the top of instruction
+        # memory; BDIR is the pin after BC1.  run_clock takes four
+        # cycles per chip clock.
+        #
+        # The encoder's entry points are absolute addresses worked out
+        # from _LATCHED_IO_ORIGIN and _SYNC_IO_ORIGIN, which hold only
+        # if nothing else is loaded in PIO0 first.  MicroPython can't
+        # say where a program was loaded, so nothing here checks it:
+        # other programs in PIO0 must be loaded after this one, as
+        # run_clock is.
+        self.pio_sm = rp2.StateMachine(0, self.sync_io if self.sync
+                                       else self.latched_io,
+                                       freq=self.pio_freq,
+                                       out_base=self.da_pins,
+                                       in_base=self.da_pins,
+                                       sideset_base=self.bc1_pin)
+        self.clock_sm = rp2.StateMachine(1, self.run_clock,
+                                         freq=4*self.clock_freq,
+                                         set_base=self.clock_pin)
+        self.clock_sm.active(1)
+        self.pio_sm.active(1)
 
     def _write_address(self, address:int):
-        # FIXME:  Send the address and the 5-bit jump target
-        self.pio_sm.put()
+        self.batch.latch(address)
 
     def _write_register(self, address: int, value: int, page: int = 0):
-        self.pio_sm.put((address & 0xff) | ((value & 0xff) << 8))
-
+        self.batch.write(address, value)
+
+    def write_registers(self, writes):
+        """Write (address, value) pairs, dropping redundant writes, in
+        one batch
+        """
+        for address, value in writes:
+            self.batch.write(address, value)
+        self.flush()
+
+    def read_register(self, address: int) -> int:
+        self.batch.read(address)
+        self.flush()
+        return self.pio_sm.get() & 0xff
+
+    def flush(self):
+        self.batch.flush(self.pio_sm)
@@ -1,28 +1,144 @@
 from amaranth import *
-from amaranth.lib import coding
-import numpy as np
-from numpy import log2, sin, uint32, float64, power, pi
-tau = 2*pi
+from amaranth.lib import data
+from amaranth.lib.memory import Memory
+from .register_files import RegisterFiles, BankDecoder, decode
 
 # Bitcrusher for 24-bit audio, blanks out the bottom bits of the audio
+#
+# The crush value is decoded into an AND mask by a thermometer decoder,
+# the same as the envelope mask:  bit i of the mask is set when i is at
+# or above crush, so crush=5 clears the lower 5 bits.  Each bit is one
+# compare against a constant, so there is no barrel shifter.
+#
+# Quantization error compensation feeds each channel's quantization
+# error into its next sample (first-order error feedback):
+#
+#   v = sample + error
+#   out = v & mask
+#   error = v - out
+#
+# This keeps the average level of the crushed signal where it was and
+# moves the quantization noise up in frequency, where the output filter
+# removes part of it.
+#
+# Channels are time-multiplexed, one sample per clock, with each
+# channel's crush, compensation, and error in memory.  A channel
+# must not be presented again within latency cycles, as its error is
+# still in flight; one sample per channel per pass is always fine.
+#
+# Cost, synthesized with Yosys synth_ecp5; the registers map to
+# distributed RAM (DPR16X4):
+#
+#   channels   LUT4   CCU2C   FF   DPR16X4   latency
+#      3        111     74    85       8        2
+#     48        179     74    93      24        2
+
+BitcrusherRegisterLayout = data.StructLayout({
+    "crush": 6,
+    "compensate": 1,
+})
 
 class Bitcrusher(Elaboratable):
+    """Bitcrusher
+    sample:  Signed 24-bit input for channel, taken while valid is
+       high.
+    out:  Crushed sample for out_channel, latency cycles later, valid
+       while out_valid is high.
+    crush:  Number of low bits to clear, written to channel_select
+       with write_enable.
+    compensate:  Enable quantization error compensation, written with
+       crush.
+    files:  RegisterFiles, or None.  With register files,
+       channel_select is a BankAddressLayout, and writes to files that
+       aren't implemented are dropped; see register_files.py.
     """
+    def __init__(self, channels: int = 3, files: RegisterFiles = None):
+        assert (channels > 0), "channels must be greater than zero"
+        assert (files is None or files.channels == channels), \
+            "channels must be three per register file"
+        self.channels = channels
+        # Read the registers, then quantize
+        self.latency = 2
 
-    """
-    def __init__(self):,
         self.clk = Signal(1)
-        self.sample = Signal(24)
+        self.sample = Signal(signed(24))
+        self.channel = Signal(range(channels))
+        self.valid = Signal(1)
+        self.out = Signal(signed(24))
+        self.out_channel = Signal(range(channels))
+        self.out_valid = Signal(1)
+
+        self.decoder = BankDecoder(files) if files is not None else None
+        self.channel_select = (self.decoder.address if self.decoder
+                               else Signal(range(channels)))
         self.crush = Signal(6)
-        self.out = Signal(24)
+        self.compensate = Signal(1)
+        self.write_enable = Signal(1)
+
+        self.config = Memory(shape=BitcrusherRegisterLayout, depth=channels,
+                             init=[])
+        self.error = Memory(shape=unsigned(24), depth=channels, init=[])
+        self._config_write = self.config.write_port()
+        self._config_read = self.config.read_port()
+        self._error_write = self.error.write_port()
+        self._error_read = self.error.read_port()
 
     def elaborate(self, platform) -> Module:
         m = Module()
+        m.submodules.config = self.config
+        m.submodules.error = self.error
 
+        select, write_enable = decode(m, self.decoder, self.channel_select,
+                                      self.write_enable)
         m.d.comb += [
-                self.out[23:self.crush].eq(self.sample[23:self.crush])
-                ]
-        with m.If(self.crush != 0):
-            m.d.comb += self.out[crush-1:0].eq(0)
-        return m
+            self._config_write.addr.eq(select),
+            self._config_write.data.crush.eq(self.crush),
+            self._config_write.data.compensate.eq(self.compensate),
+            self._config_write.en.eq(write_enable),
+        ]
+
+        # Read the channel's registers
+        m.d.comb += [
+            self._config_read.addr.eq(self.channel),
+            self._error_read.addr.eq(self.channel),
+        ]
+        sample = Signal(signed(24))
+        channel = Signal(range(self.channels))
+        valid = Signal(1)
+        m.d.sync += [
+            sample.eq(self.sample),
+            channel.eq(self.channel),
+            valid.eq(self.valid),
+        ]
+
+        # Quantize
+        config = self._config_read.data
+        mask = Signal(24)
+        m.d.comb += mask.eq(Cat(config.crush <= i for i in range(0, 24)))
+
+        v = Signal(signed(26))
+        saturated = Signal(signed(24))
+        quantized = Signal(signed(24))
+        m.d.comb += [
+            v.eq(sample + Mux(config.compensate, self._error_read.data, 0)),
+            saturated.eq(v),
+            quantized.eq(saturated & mask),
+        ]
+        with m.If(v > 2**23 - 1):
+            m.d.comb += saturated.eq(2**23 - 1)
+        with m.Elif(v < -2**23):
+            m.d.comb += saturated.eq(-2**23)
 
+        # Everything cleared has no error to carry
+        m.d.comb += [
+            self._error_write.addr.eq(channel),
+            self._error_write.data.eq(
+                Mux(config.compensate & (mask != 0), saturated - quantized, 0)),
+            self._error_write.en.eq(valid),
+        ]
+        m.d.sync += [
+            self.out.eq(quantized),
+            self.out_channel.eq(channel),
+            self.out_valid.eq(valid),
+        ]
+        return m
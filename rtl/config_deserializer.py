@@ -0,0 +1,84 @@
+from amaranth import *
+from amaranth.lib import data
+from .generators.tone_generator import ToneGeneratorRegisterLayout
+
+# Serial configuration deserializer
+#
+# Collects configuration frames from a serial link (width) bits per
+# clock and writes each frame to the units' wide configuration ports,
+# configuring a whole channel in one cycle.  A frame carries:
+#
+#   tone_write, lfo_write:  Which of the two entries to write.
+#   channel:  Channel, which is also the LFO number.
+#   tone:  Every tone generator register, ToneGeneratorRegisterLayout.
+#   lfo_phase_increment, lfo_wfdr, lfo_wfdr_mask:  The LFO's phase
+#      increment and WFDR command; see LFO.config_write.
+#
+# The frame is sent least significant chunk first, padded with zeroes
+# to a whole number of chunks, and takes frame_cycles chunks.  start
+# marks the first chunk of a frame, so a link that loses a chunk
+# realigns on the next frame.  Chunks are taken only while valid.
+#
+# A full reconfiguration takes reconfigure_cycles clocks:  one frame
+# per channel, back to back.  At 9.216MHz and 96kHz there are 96 clocks
+# per sample, so a 48-bit link reconfigures 48 channels every sample.
+
+def config_frame_layout(channels: int) -> data.StructLayout:
+    """Configuration frame for (channels) channels"""
+    return data.StructLayout({
+        "tone_write": 1,
+        "lfo_write": 1,
+        "channel": range(channels),
+        "tone": ToneGeneratorRegisterLayout,
+        "lfo_phase_increment": 16,
+        "lfo_wfdr": 4,
+        "lfo_wfdr_mask": 4,
+    })
+
+class ConfigDeserializer(Elaboratable):
+    """Configuration deserializer
+    data:  (width) bits of the frame, taken while valid is high.
+    start:  High with the first chunk of a frame.
+    frame:  The last complete frame, config_frame_layout(channels),
+       valid while frame_valid is high.
+    frame_cycles:  Chunks per frame.
+    reconfigure_cycles:  Clock cycles to send one frame per channel.
+    """
+    def __init__(self, channels: int = 3, width: int = 8):
+        assert (width > 0), "width must be greater than zero"
+        self.channels = channels
+        self.width = width
+        self.layout = config_frame_layout(channels)
+        self.frame_cycles = -(-self.layout.size // width)
+        self.reconfigure_cycles = channels * self.frame_cycles
+
+        self.data = Signal(width)
+        self.valid = Signal(1)
+        self.start = Signal(1)
+        self.frame = Signal(self.layout)
+        self.frame_valid = Signal(1)
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+
+        # Each chunk enters at the top, so the first chunk ends up at
+        # the bottom after frame_cycles chunks
+        shift = Signal(self.frame_cycles * self.width)
+        count = Signal(range(self.frame_cycles))
+        position = Signal(range(self.frame_cycles))
+        m.d.comb += [
+            position.eq(Mux(self.start, 0, count)),
+            self.frame.eq(shift[:self.layout.size]),
+        ]
+        m.d.sync += self.frame_valid.eq(0)
+        with m.If(self.valid):
+            m.d.sync += [
+                count.eq(position + 1),
+                shift.eq(Cat(shift[self.width:], self.data)),
+            ]
+            with m.If(position == self.frame_cycles - 1):
+                m.d.sync += [
+                    count.eq(0),
+                    self.frame_valid.eq(1),
+                ]
+        return m
@@ -0,0 +1,318 @@
+from amaranth import *
+from .generators.lfo import LFO
+from .generators.tone_generator import ToneGenerator
+from .svf import StateVariableFilter
+from .bitcrusher import Bitcrusher
+from .output_filter import HalfBandFilter
+from .schedule import Stage, Schedule, Sequencer
+from .multiplier import MultiplierPool
+from .performance_counters import PerformanceCounters, pipeline_busy
+from .config_deserializer import ConfigDeserializer
+from .register_files import RegisterFiles, CHANNELS_PER_FILE
+
+# Control unit
+#
+# Runs every unit on a static per-sample schedule (see schedule.py).
+# Each unit declares its timing as a Stage, the schedule is computed
+# for the channel count and clock, and a Sequencer starts each unit
+# on its cycle of every sample period:
+#
+#   lfo:  All LFOs update in parallel with tone generation.  The
+#      tone generator reads the values without waiting for the update,
+#      so they're schedule.lag["tone"]["lfo"] samples old:  (1, 0),
+#      as channels the LFO has stepped this sample are read after it.
+#   tone:  One sample for every channel, streamed out channel by
+#      channel.
+#   svf:  Streamed from the tone generator.  The filter takes a sample
+#      every two cycles, so the tone generator needs at most two
+#      interpolators.
+#   bitcrusher:  Streamed from the filter.
+#   output_filter_0, post_bitcrusher, output_filter_1:  With
+#      output_filter_taps, the two passes of the half-band output
+#      filter, streamed from the bitcrusher with a second bitcrusher
+#      between them.  Each pass gets the fewest multipliers that keep
+#      up with the tone generator.  With decimate, the second pass
+#      puts out every other sample of each channel, for 48kHz output.
+#
+# The schedule overlaps samples:  each unit starts the next sample while
+# the units after it finish this one, so a configuration only fails,
+# when the ControlUnit is constructed, before synthesis, if some unit
+# can't take every channel within clock/sample_rate cycles.  At 48
+# channels, the tone generator and filter each take 96, so 9.216MHz
+# is enough.
+#
+# The units are exposed as attributes so their register files can be
+# connected to the host interface.  The host reads through address,
+# which is the LFO's, and data_out.  With counters, a PerformanceCounters block
+# counts the LFO's and tone generator's passes, and watches every stage
+# of the schedule for headroom.  Its registers are mapped into the host
+# register space on channel 3 of each register file, which is never a
+# channel:  reading file n, channel 3 puts counter register n on
+# data_out, so counters need files.  Writes there are dropped by the
+# LFO, as for any channel that isn't implemented, and a write to file
+# zero, channel 3 restarts the counters.
+#
+# With serial_width, a ConfigDeserializer takes configuration frames on
+# serial_data, serial_valid, and serial_start, and writes each to the
+# tone generator's and LFO's wide configuration ports.
+#
+# With multipliers, the units' multipliers are served from a
+# MultiplierPool of that many physical multipliers, shared by the
+# windows of the schedule.  The tone generator and filter overlap, so
+# the pool needs at least their multipliers together; the LFO is
+# declared last, so it moves to wherever the pool is free, and its
+# values are still read a sample after they're produced.  Every unit
+# must then have the same multiplier_delay, which it does here.
+#
+# With files, the build implements those register files (see
+# register_files.py), three channels each, and every unit's host port
+# is addressed by file and channel, so a 3-channel part and a
+# 48-channel part come from the same RTL.  The wide configuration
+# ports, and the deserializer's frames, still take the dense channel.
+
+def tone_stage(tone: ToneGenerator) -> Stage:
+    """The tone generator's Stage
+    The first channel is out one slot after the pipeline latency, and
+    the rest follow one per channel.
+    """
+    return Stage("tone", latency=tone.latency + tone.slots,
+                 interval=tone.slots, items=tone.channels, reads=("lfo",),
+                 multipliers=len(tone.multipliers))
+
+def filter_stage(name: str, unit, after=()) -> Stage:
+    """The Stage of a StateVariableFilter or HalfBandFilter"""
+    return Stage(name, latency=unit.latency,
+                 interval=unit.initiation_interval, items=unit.channels,
+                 after=after, multipliers=len(unit.multipliers))
+
+def lfo_stage(lfo: LFO) -> Stage:
+    """The LFO's Stage
+    It's busy until its last write-back, so the next update is a cycle
+    after.
+    """
+    return Stage("lfo", latency=lfo.update_cycles,
+                 interval=lfo.update_cycles + 1,
+                 multipliers=len(lfo.multipliers))
+
+class ControlUnit(Elaboratable):
+    """Control unit
+    channels:  Number of channels; there is one LFO per channel.
+    files:  RegisterFiles, a number of files from file zero, or None for
+       plain channel numbers on the host ports.  Sets channels.
+    clock:  Core clock in Hz.
+    sample_rate:  Output sample rate in Hz.
+    schedule:  The per-sample Schedule.
+    out:  Signed 24-bit sample for out_channel, valid while out_valid
+       is high.
+    sample:  High on the first cycle of every sample period.
+    counters:  PerformanceCounters, or None if not instrumented.  An
+       LFO write to file zero, channel 3 clears them.
+    address:  Host address, the LFO's address.
+    data_out:  Host read data for address, the next cycle:  the LFO's
+       data_out, or a counter register.
+    deserializer:  ConfigDeserializer, or None without a serial_width.
+    pool:  MultiplierPool, or None if each unit has its own
+       multipliers.
+    output_filter:  The two HalfBandFilter passes, or empty without
+       output_filter_taps.
+    post_bitcrusher:  Bitcrusher between the output filter passes, or
+       None without output_filter_taps.
+    """
+    def __init__(self, channels: int = 3, clock: int = 24_576_000,
+                 sample_rate: int = 96000, multiplier_delay: int = 1,
+                 interpolators: int = 2, counters: bool = False,
+                 serial_width: int = None, multipliers: int = None,
+                 output_filter_taps: int = None, decimate: bool = False,
+                 files=None):
+        if counters and files is None:
+            raise ValueError(
+                "the counters are read on channel 3 of each register "
+                "file, so they need files")
+        if files is not None and not isinstance(files, RegisterFiles):
+            files = RegisterFiles(files)
+        if files is not None:
+            channels = files.channels
+        self.files = files
+        self.channels = channels
+        self.lfo = LFO(channels, multiplier_delay, files=files)
+        self.tone = ToneGenerator(channels, sample_rate, multiplier_delay,
+                                  interpolators, files)
+        self.svf = StateVariableFilter(channels, multiplier_delay, files)
+        self.bitcrusher = Bitcrusher(channels, files)
+
+        tone = self.tone
+        if tone.slots % self.svf.initiation_interval:
+            raise ValueError(
+                f"the tone generator puts out a channel every "
+                f"{tone.slots} cycles with {interpolators} interpolators, "
+                f"faster than the state variable filter takes them")
+        self.output_filter = []
+        self.post_bitcrusher = None
+        if output_filter_taps:
+            products = (output_filter_taps + 1) // 4
+            self.output_filter = [
+                HalfBandFilter(channels, output_filter_taps,
+                               -(-products // tone.slots), multiplier_delay,
+                               decimate=decimate and x == 1, files=files)
+                for x in range(0, 2)]
+            self.post_bitcrusher = Bitcrusher(channels, files)
+        self.stages = [
+            tone_stage(tone),
+            filter_stage("svf", self.svf, after=("tone",)),
+            Stage("bitcrusher", latency=self.bitcrusher.latency,
+                  items=channels, after=("svf",)),
+        ]
+        if self.output_filter:
+            first, second = self.output_filter
+            self.stages += [
+                filter_stage("output_filter_0", first,
+                             after=("bitcrusher",)),
+                Stage("post_bitcrusher",
+                      latency=self.post_bitcrusher.latency,
+                      items=channels, after=("output_filter_0",)),
+                filter_stage("output_filter_1", second,
+                             after=("post_bitcrusher",)),
+            ]
+        # Declared last, so the LFO goes wherever the pool is free
+        self.stages.append(lfo_stage(self.lfo))
+        self.schedule = Schedule(self.stages, clock, sample_rate,
+                                 multipliers)
+        self.sequencer = Sequencer(self.schedule)
+        self.pool = None
+        if multipliers is not None:
+            clients = {
+                "lfo": self.lfo.multipliers,
+                "tone": tone.multipliers,
+                "svf": self.svf.multipliers,
+            }
+            for i, output_filter in enumerate(self.output_filter):
+                clients[f"output_filter_{i}"] = output_filter.multipliers
+            self.pool = MultiplierPool(self.schedule, self.sequencer.cycle,
+                                       clients)
+        self.counters = None
+        self.address = self.lfo.address
+        self.data_out = self.lfo.data_out
+        if counters:
+            self.counters = PerformanceCounters(
+                ("lfo", "tone"), self.schedule.budget,
+                [x.name for x in self.stages
+                 if x.name not in ("tone", "lfo")])
+            self.data_out = Signal(16)
+        self.deserializer = None
+        if serial_width:
+            self.deserializer = ConfigDeserializer(channels, serial_width)
+            self.serial_data = self.deserializer.data
+            self.serial_valid = self.deserializer.valid
+            self.serial_start = self.deserializer.start
+
+        self.out = Signal(signed(24))
+        self.out_channel = Signal(range(channels))
+        self.out_valid = Signal(1)
+        self.sample = Signal(1)
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        m.submodules.sequencer = sequencer = self.sequencer
+        m.submodules.lfo = self.lfo
+        m.submodules.tone = self.tone
+        m.submodules.svf = self.svf
+        m.submodules.bitcrusher = self.bitcrusher
+        if self.pool is not None:
+            m.submodules.pool = self.pool
+        for i, output_filter in enumerate(self.output_filter):
+            m.submodules[f"output_filter_{i}"] = output_filter
+        if self.post_bitcrusher is not None:
+            m.submodules.post_bitcrusher = self.post_bitcrusher
+
+        m.d.comb += [
+            self.sample.eq(sequencer.sample),
+            self.lfo.update.eq(sequencer.start["lfo"]),
+            self.tone.update.eq(sequencer.start["tone"]),
+        ]
+
+        # Stream the tone generator through the filter into the
+        # bitcrusher, then through the output filter passes
+        chain = [self.tone, self.svf, self.bitcrusher]
+        if self.output_filter:
+            chain += [self.output_filter[0], self.post_bitcrusher,
+                      self.output_filter[1]]
+        m.d.comb += [
+            self.svf.sample.eq(self.tone.output),
+            self.svf.channel.eq(self.tone.output_channel),
+            self.svf.valid.eq(self.tone.output_valid),
+        ]
+        for producer, consumer in zip(chain[1:], chain[2:]):
+            m.d.comb += [
+                consumer.sample.eq(producer.out),
+                consumer.channel.eq(producer.out_channel),
+                consumer.valid.eq(producer.out_valid),
+            ]
+        m.d.comb += [
+            self.out.eq(chain[-1].out),
+            self.out_channel.eq(chain[-1].out_channel),
+            self.out_valid.eq(chain[-1].out_valid),
+        ]
+
+        if self.counters is not None:
+            counters = self.counters
+            m.submodules.counters = counters
+            m.d.comb += [
+                counters.sample.eq(sequencer.sample),
+                counters.dropped.eq(self.lfo.wfdr_dropped),
+            ]
+            for name, unit in (("lfo", self.lfo), ("tone", self.tone)):
+                m.d.comb += [
+                    counters.start[name].eq(sequencer.start[name]),
+                    counters.busy[name].eq(unit.busy),
+                    counters.overrun[name].eq(unit.overrun),
+                ]
+            streamed = dict(zip(("svf", "bitcrusher", "output_filter_0",
+                                 "post_bitcrusher", "output_filter_1"),
+                                chain[1:]))
+            for name in counters.stages:
+                unit = streamed[name]
+                m.d.comb += counters.busy[name].eq(
+                    pipeline_busy(m, unit.valid, unit.latency))
+
+            # Counter register n is on file n, channel 3, and writing
+            # file zero, channel 3 clears them
+            address = self.address
+            selected = Signal(1)
+            m.d.comb += [
+                counters.address.eq(address.file),
+                counters.clear.eq(self.lfo.write_enable
+                                  & (address.file == 0)
+                                  & (address.channel == CHANNELS_PER_FILE)),
+            ]
+            m.d.sync += selected.eq(
+                (address.channel == CHANNELS_PER_FILE)
+                & (address.file < len(counters.names)))
+            m.d.comb += self.data_out.eq(
+                Mux(selected, counters.data_out, self.lfo.data_out))
+
+        if self.deserializer is not None:
+            m.submodules.deserializer = self.deserializer
+            frame = self.deserializer.frame
+            valid = self.deserializer.frame_valid
+            m.d.comb += [
+                self.tone.config_write.eq(valid & frame.tone_write),
+                self.tone.config_channel.eq(frame.channel),
+                self.tone.config.eq(frame.tone),
+                self.lfo.config_write.eq(valid & frame.lfo_write),
+                self.lfo.config_address.eq(frame.channel),
+                self.lfo.config_phase_increment.eq(frame.lfo_phase_increment),
+                self.lfo.config_wfdr.eq(frame.lfo_wfdr),
+                self.lfo.config_wfdr_mask.eq(frame.lfo_wfdr_mask),
+            ]
+        return m
+
+async def read_counters(ctx, dut: ControlUnit) -> dict:
+    """Read every performance counter through the host read port, by
+    name
+    """
+    values = {}
+    for i, name in enumerate(dut.counters.names):
+        ctx.set(dut.address, {"file": i, "channel": CHANNELS_PER_FILE})
+        await ctx.tick()
+        values[name] = ctx.get(dut.data_out)
+    return values
@@ -0,0 +1,210 @@
+from amaranth import *
+from amaranth.lib.memory import Memory
+import numpy as np
+from ..multiplier import Multiplier
+from .wavetable import ramp_tables
+
+# Wavetable ROM with linear interpolator
+#
+# The ROM holds only the first half-period of each ramp table.  A
+# 24-bit phase is split as:
+#
+#   |23  |22-13   |12-0     |
+#   |half|index   |fraction |
+#
+# for 1024-entry tables.  In the second half-period the sample is the
+# first half played back in reverse and negated, so the ROM address is
+# the index inverted and the sign is taken from the half bit:
+#
+#   half=0:  +table[index]
+#   half=1:  -table[~index]
+#
+# The two adjacent samples are at adjacent ROM addresses, one even and
+# one odd, so the ROM is split into even and odd samples, and each
+# interpolator reads both in one cycle with one read port on each.  At
+# the middle and end of the period both samples are the same entry,
+# mirrored.  One subtract and one multiply then interpolate between
+# them:
+#
+#   sample = s0 + (((s1 - s0) * fraction) >> 13)
+#
+# The multiply is delayed multiplier_delay cycles for the synthesizer
+# to pipeline it.  A new phase can be presented every cycle.
+#
+# When blend is set, the samples are the mean of the level's table and
+# the one below it (see mipmap.py).  Even and odd levels are kept in
+# separate ROMs, so the two tables are always in different ROMs and
+# all four samples are read in the same cycle.  Interpolation is
+# linear, so the two tables are averaged before interpolating and only
+# one multiply is needed.
+#
+# Every interpolator reads the same tables, so they can share one
+# WavetableROM; each takes one read port on each of its memories, and
+# block RAM has two, so two interpolators share one copy of the tables.
+
+class WavetableROM(Elaboratable):
+    """Wavetable ROM
+    The ramp tables, split by the parity of the level, then by the
+    parity of the sample.
+    tables:  (levels, length) array of the half-period tables.
+    rom:  For even then odd levels, the memories of even then odd
+       samples.
+    """
+    def __init__(self, tables: np.ndarray = None):
+        if tables is None:
+            tables = ramp_tables()
+        self.levels, self.length = tables.shape
+        assert (self.length > 1 and self.length & (self.length - 1) == 0), \
+            "table length must be a power of two"
+        self.rom = [[Memory(shape=unsigned(23), depth=half.size,
+                            init=half.ravel().tolist())
+                     for half in (bank[:, 0::2], bank[:, 1::2])]
+                    for bank in (tables[0::2], tables[1::2]) if len(bank)]
+
+    def read_ports(self) -> list:
+        """A read port on every memory, laid out as rom"""
+        return [[rom.read_port() for rom in bank] for bank in self.rom]
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        for i, bank in enumerate(self.rom):
+            for j, rom in enumerate(bank):
+                m.submodules[f"rom_{i}_{j}"] = rom
+        return m
+
+class Interpolator(Elaboratable):
+    """Interpolator
+    Returns the interpolated wavetable sample for a phase.
+    phase:  24-bit phase, one full period.
+    level:  Mipmap level, i.e. the ramp table to read.
+    blend:  Average the level's table with the table below it.
+    read:  Start a lookup for phase and level.
+    sample:  Signed 24-bit interpolated sample, latency cycles after
+       read.
+    valid:  sample holds the result of a read.
+    latency:  Clock cycles from read to valid.
+    multipliers:  The interpolating multiplier.
+    rom:  The WavetableROM read.  Pass one to share it; else the
+       interpolator builds its own from tables, and elaborates it.
+    """
+    def __init__(self, tables: np.ndarray = None,
+                 multiplier_delay: int = 1, rom: WavetableROM = None):
+        assert (multiplier_delay > 0), "multiplier_delay must be greater than zero"
+        self._own_rom = rom is None
+        self.rom = WavetableROM(tables) if rom is None else rom
+        self.levels, self.length = self.rom.levels, self.rom.length
+        self.multiplier_delay = multiplier_delay
+        self.index_bits = self.length.bit_length() - 1
+        self.fraction_bits = 24 - 1 - self.index_bits
+        # ROM read, then the multiply
+        self.latency = 1 + multiplier_delay
+
+        self.phase = Signal(24)
+        self.level = Signal(range(self.levels))
+        self.blend = Signal(1)
+        self.read = Signal(1)
+        self.sample = Signal(signed(24))
+        self.valid = Signal(1)
+        self.multipliers = [
+            Multiplier(signed(25), self.fraction_bits, multiplier_delay),
+        ]
+
+        self._port = self.rom.read_ports()
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        if self._own_rom:
+            m.submodules.rom = self.rom
+        for i, multiplier in enumerate(self.multipliers):
+            m.submodules[f"multiplier_{i}"] = multiplier
+
+        # Position of the two samples within the full period
+        position = [Signal(self.index_bits + 1) for x in range(0, 2)]
+        m.d.comb += [
+            position[0].eq(self.phase[self.fraction_bits:]),
+            position[1].eq(position[0] + 1),
+        ]
+
+        # Each ROM reads the selected level if it holds that parity,
+        # else the level below it
+        level_below = Signal(range(self.levels))
+        m.d.comb += level_below.eq(self.level - 1)
+        row = []
+        for bank in range(0, len(self._port)):
+            r = Signal(range(max(1, (self.levels + 1) // 2)))
+            m.d.comb += r.eq(Mux(self.level[0] == bank,
+                                 self.level >> 1, level_below >> 1))
+            row.append(r)
+
+        # Mirror the second half-period
+        address = [Signal(self.index_bits) for x in range(0, 2)]
+        negate = [Signal(1) for x in range(0, 2)]
+        for p, a, n in zip(position, address, negate):
+            index = p[:self.index_bits]
+            half = p[self.index_bits]
+            m.d.comb += [
+                a.eq(Mux(half, ~index, index)),
+                n.eq(half),
+            ]
+        # Each sample from the memory of its parity; when both are the
+        # same entry, the other memory's read goes unused
+        even = Mux(address[0][0], address[1], address[0])
+        odd = Mux(address[0][0], address[0], address[1])
+        for (even_port, odd_port), r in zip(self._port, row):
+            m.d.comb += [
+                even_port.addr.eq(Cat(even[1:], r)),
+                odd_port.addr.eq(Cat(odd[1:], r)),
+            ]
+
+        # Samples arrive from the ROM
+        read_valid = Signal(1)
+        read_negate = [Signal(1) for x in range(0, 2)]
+        read_odd = [Signal(1) for x in range(0, 2)]
+        read_fraction = Signal(self.fraction_bits)
+        read_parity = Signal(1)
+        read_blend = Signal(1)
+        m.d.sync += [
+            read_valid.eq(self.read),
+            read_fraction.eq(self.phase[:self.fraction_bits]),
+            read_negate[0].eq(negate[0]),
+            read_negate[1].eq(negate[1]),
+            read_odd[0].eq(address[0][0]),
+            read_odd[1].eq(address[1][0]),
+            read_parity.eq(self.level[0]),
+            read_blend.eq(self.blend & (self.level != 0)),
+        ]
+        s = [Signal(signed(24)) for x in range(0, 2)]
+        for n, o, x in zip(read_negate, read_odd, s):
+            level = [Mux(o, ports[1].data, ports[0].data)
+                     for ports in self._port]
+            mean = level[0]
+            if len(level) > 1:
+                selected = Mux(read_parity, level[1], level[0])
+                mean = Mux(read_blend, (level[0] + level[1]) >> 1,
+                           selected)
+            m.d.comb += x.eq(Mux(n, -mean, mean))
+
+        # Subtract and multiply, delayed for pipelining
+        valid = [Signal(1) for x in range(0, self.multiplier_delay)]
+        base = [Signal(signed(24)) for x in range(0, self.multiplier_delay)]
+        multiplier = self.multipliers[0]
+        m.d.sync += [
+            valid[0].eq(read_valid),
+            base[0].eq(s[0]),
+        ]
+        m.d.comb += [
+            multiplier.a.eq(s[1] - s[0]),
+            multiplier.b.eq(read_fraction),
+        ]
+        for i in range(1, self.multiplier_delay):
+            m.d.sync += [
+                valid[i].eq(valid[i-1]),
+                base[i].eq(base[i-1]),
+            ]
+
+        m.d.comb += [
+            self.sample.eq(base[-1]
+                           + (multiplier.product >> self.fraction_bits)),
+            self.valid.eq(valid[-1]),
+        ]
+        return m
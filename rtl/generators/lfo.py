@@ -1,27 +1,42 @@
 from amaranth import *
-from amaranth.lib.coding import *
-from numpy import log2, ceil
+from amaranth.lib import data
+from amaranth.lib.memory import Memory
+from ..multiplier import Multiplier
+from ..register_files import RegisterFiles, BankDecoder, decode
 
 # low-frequency oscillator
 #
 # The LFO produces an output between -1 and 1; however, it tracks phase
 # internally normalized to [0,tau), where PhaseAccumulator rolls over
-# at 1, unsigned.  Calculating the output is slightly involved:
+# at 1, unsigned.  Outputs are 16-bit:
 #
 # Ramps:
-#   Subtract 0.5 from the PhaseAccumulator and multiplying by 2.
+#   The phase accumulator, negated if Direction=1.
 #
 # Square:
-#   The MSB indicates 1 or -1.
+#   The MSB XOR Direction, placed in the MSB.
 #
 # Triangle:
 #   Calculate a ramp.  Multiply the ramp by -1 if Direction=1.
 #
-# Sine is handled completely differently.
-#
-# FIXME:  correct the outputs as per above.  This requires
-# figuring out how the chip will handle data internally (i.e.
-# integer [0,2^n), fixed point?)
+# Sine is handled completely differently:  the sine delay element of
+# the resonating SVF, signed Q1.15.
+
+# Per-oscillator state written only by the update engine
+LFOStateLayout = data.StructLayout({
+    "phase_accumulator": 16,
+    "waveform": 2,
+    "direction": 1,
+})
+
+# Sine oscillator delay elements, signed Q1.15
+LFOSineLayout = data.StructLayout({
+    "sine_delay": signed(16),
+    "cosine_delay": signed(16),
+})
+
+# Value of the cosine delay after reset, i.e. 1 in Q1.15
+SINE_AMPLITUDE = 2**15 - 1
 
 class LFO(Elaboratable):
     """LFO
@@ -35,32 +50,84 @@ class LFO(Elaboratable):
     write_mask:  When write_select=1, the new values written to
        Waveform, Direction, and Reset as WFDR=Signal(4) is
        (data_in[3:0] & write_mask) | (wfdr_buffer & ~write_mask).
+    config_write:  Write a whole oscillator at config_address in one
+       cycle:  phase_increment from config_phase_increment, and the
+       WFDR command config_wfdr under config_wfdr_mask, the same as
+       write_mask.  Takes priority over write_enable.
+    lanes:  Number of oscillators stepped in parallel.  Each lane has
+       its own register file bank and sine multipliers; oscillator n
+       lives in lane n % lanes.
+    update_cycles:  Clock cycles from the update pulse until every
+       oscillator has been written back.
+    busy:  High from the cycle after the update pulse until every
+       oscillator has been written back.
+    overrun:  High when update is pulsed while busy.  The pulse is
+       ignored, or corrupts the oscillators still in flight.
+    wfdr_dropped:  High the cycle after a WFDR write replaces bits of
+       a WFDR command that was never applied.
+    Writes reach the register file the cycle after they're presented;
+    an update pulsed on that cycle sees them.
+    multipliers:  Each lane's sine and cosine multipliers.
+    files:  RegisterFiles, or None.  With register files, address is a
+       BankAddressLayout, writes to files that aren't implemented are
+       dropped, and reading one puts zero on data_out; see
+       register_files.py.  config_address stays a plain LFO number.
     """
-    def __init__(self, count: int, multiplier_delay: int = 1):
+    def __init__(self, count: int, multiplier_delay: int = 1,
+                 lanes: int = 1, files: RegisterFiles = None):
         assert (count > 0), "count must be greater than zero"
+        assert (multiplier_delay > 0), "multiplier_delay must be greater than zero"
+        assert (0 < lanes <= count), "lanes must be between 1 and count"
+        assert (files is None or files.channels == count), \
+            "count must be three per register file"
         self.count = count
         self.multiplier_delay = multiplier_delay
+        self.lanes = lanes
+        # Each lane updates one row per cycle
+        self.rows = -(-count // lanes)
+        # Issue every row, one cycle to read, two multiplies for sine
+        self.update_cycles = self.rows + 2*multiplier_delay + 1
         self.clk = Signal(1)
         # When update becomes high, an internal state machine
         # updates each counter in sequence.
         self.update = Signal(1)
-        self.address = Signal(ceil(log2(count)))
+        self.decoder = BankDecoder(files) if files is not None else None
+        self.address = (self.decoder.address if self.decoder
+                        else Signal(range(count)))
         self.data_out = Signal(16)
         self.data_in = Signal(16)
         self.write_enable = Signal(1)
         self.write_select = Signal(1)
         self.write_mask = Signal(4)
-        # Create register file
-        self.register_file = [LFORegisterFile() for x in range(0,count)]
-        # Updating state tracks which oscillator is being updated 
-        self.updating = Signal(count)
+        # Wide configuration port
+        self.config_write = Signal(1)
+        self.config_address = Signal(range(count))
+        self.config_phase_increment = Signal(16)
+        self.config_wfdr = Signal(4)
+        self.config_wfdr_mask = Signal(4)
+        # Instrumentation
+        self.busy = Signal(1)
+        self.overrun = Signal(1)
+        self.wfdr_dropped = Signal(1)
+        # Create register file, one bank per lane
+        self.register_file = [LFORegisterFile(self.rows)
+                              for x in range(0, lanes)]
+        # Sine multipliers, f * cosine then f * sine, for each lane
+        self._lane_multipliers = [
+            [Multiplier(16, signed(16), multiplier_delay)
+             for x in range(0, 2)]
+            for y in range(0, lanes)]
+        self.multipliers = [x for lane in self._lane_multipliers
+                            for x in lane]
 
     def elaborate(self, platform) -> Module:
         m = Module()
 
-        m.d.comb += m.d.sync.clk.eq(self.clk)
+        for lane, rf in enumerate(self.register_file):
+            m.submodules[f"register_file_{lane}"] = rf
+            for i, multiplier in enumerate(self._lane_multipliers[lane]):
+                m.submodules[f"multiplier_{lane}_{i}"] = multiplier
 
-        osc = self.register_file
         ##################
         # Update routine #
         ##################
@@ -70,192 +137,425 @@ class LFO(Elaboratable):
         #   - If triangle, set Direction to PhaseAccumulator overflow
         # Updating has a deterministic time cost; poke it exactly once
         # between generating a single sample on all tone generators.
-        
-        # Data for sine and cosine update, the index of the register to
-        # update, and whether to update.  For pipelining updates.
-        sine_update = [Signal(16) for x in range(0,self.multiplier_delay)]
-        cosine_update = [Signal(16) for x in range(0,self.multiplier_delay)]
-        sine_update_index = [Signal(ceil(log2(self.count))) for x in range (0,self.multiplier_delay)]
-        sine_update_enable = [Signal(1) for x in range (0,self.multiplier_delay)]
-
-        # Update state machine
+        #
+        # The register file is in block RAM, so each oscillator passes
+        # through a short pipeline:
+        #
+        # Issue:
+        #   Place the row index on the update read ports.
+        # Step:
+        #   Read data arrives.  Step the phase accumulator, apply the
+        #   pending WFDR bits and mark them applied, write the state
+        #   back, and start the sine multiply.
+        # Sine:
+        #   2*multiplier_delay cycles later, write the sine and cosine
+        #   delay elements back.
+        #
+        # Each stage works on a different row each cycle, so there are
+        # never two accesses to one oscillator in flight.  Every lane
+        # runs the same pipeline on its own bank in lockstep.
+        index = Signal(range(self.rows))
+        issue = Signal(1)
         with m.FSM():
             with m.State("Start"):
                 with m.If(self.update):
-                    m.d.sync += self.updating.eq(1)
+                    m.d.sync += index.eq(0)
                     m.next = "Updating"
-                # When not updating, we need to clear the sine oscillator
-                # update pipeline or it will continuously carry out the
-                # final addition.
-                #
-                # Only the enable signal matters, leave the rest alone.
-                m.d.sync += [
-                    #SineUpdate[0].eq(0),
-                    #CosineUpdate[0].eq(0),
-                    #SineUpdateIndex[0].eq(0),
-                    sine_update_enable[0].eq(0)
-                ]
             with m.State("Updating"):
-                # Get the index of the oscillator to update
-                x = Signal(ceil(log2(self.count)))
-                m.d.comb += x.eq(PriorityEncoder(self.count, self.updating).o)
-                # Increment the target oscillator
-                m.d.sync += self.updating.eq(self.updating << 1)
-                with m.If(self.updating[-1] == 1):
+                m.d.comb += issue.eq(1)
+                m.d.sync += index.eq(index + 1)
+                with m.If(index == self.rows - 1):
+                    # Park on a row that exists
+                    m.d.sync += index.eq(0)
                     m.next = "Start"
 
-                # Decode Waveform
-                PA = Signal(17)
-                OutputPhase = Signal(16)
-                NewDirection = Signal(1)
-                # Sum to PA in the combinational domain, with the extra bit
-                # for overflow
-                m.d.comb += [
-                    PA.eq(osc[x].phase_accumulator +
-                        mux(osc[x].is_triangle(),
-                            osc[x].phase_increment << 1,
-                            osc[x].phase_increment
-                        )
-                    ),
-                    # Flip on overflow if triangle
-                    NewDirection.eq(osc[x].direction ^ (PA[16] & osc[x].is_triangle()))
-                ]
-                m.d.sync += [
-                    # Store new sum in phase accumulator
-                    osc[x].phase_accumulator.eq(PA[0:15]),
-                    osc[x].direction.eq(NewDirection)
-                ]
-
-                ##########################
-                # Update sine oscillator #
-                ##########################
-                # The sine oscillator is much simpler:  it's a resonating
-                # state variable filter.
-
-                # Put the multiplication, index, and enable in the pipeline.
-                # Does not cause an update if reset signal has been sent
-                m.d.sync += [
-                    sine_update[0].eq(osc[x].cosine_delay * osc[x].phase_increment),
-                    cosine_update[0].eq(osc[x].cosine_delay * -osc[x].phase_increment),
-                    sine_update_index[0].eq(x),
-                    sine_update_enable[0].eq(~self._is_resetting(x))
-                ]
-                # Also execute the WFDR buffer.
-                m.d.sync += [
-                    osc[x].waveform.eq(
-                        (osc[x].waveform & ~osc[x].wfdr_mask[3:2])
-                        | (osc[x].wfdr_buffer[3:2] & osc[x].wfdr_mask[3:2])
-                    ),
-                    # Clear the mask so these commands won't be executed
-                    # again next update
-                    osc[x].wfdr_mask.eq(0)
-                ]
-                with m.If(osc[x].wfdr_mask[1]):
-                    m.d.sync += osc[x].direction.eq(osc[x].wfdr_buffer[1])
-                # Reset signal
-                with m.If(osc[x]._is_resetting()):
-                    m.d.sync += self.phase_accumulator[x].eq(0)
-                    # Clear the sine wave.  Move tau/2 forward if
-                    # direction is 1 (i.e. reverse sine).
-                    #
-                    # If we're setting Direction, then use the
-                    # incoming value; else use the registered value
-                    m.d.sync += osc[x].sine_delay.eq(0)
-                    with m.Switch(mux(osc[x].wfdr_mask[1], osc[x].wfdr_buffer[1],
-                                      osc[x].direction)):
-                        with m.Case(0):
-                            m.d.sync += osc[x].cosine_delay.eq(1)
-                        with m.Case(1):
-                            m.d.sync += osc[x].cosine_delay.eq(-1)
-
-        # Delay the multiplication a number of cycles for the
-        # synthesizer to pipeline the multiplier
-        for i in range(1,self.multiplier_delay):
+        address, write_enable = decode(m, self.decoder, self.address,
+                                       self.write_enable)
+        host_lane, host_row = self._split_address(m, address)
+        config_lane, config_row = self._split_address(m, self.config_address)
+
+        # Host writes, from either the wide port or the narrow one
+        write_layout = data.StructLayout({
+            "lane": range(self.lanes),
+            "row": range(self.rows),
+            "phase_increment_write": 1,
+            "phase_increment": 16,
+            "wfdr_write": 1,
+            "wfdr": 4,
+            "wfdr_mask": 4,
+        })
+        write = Signal(write_layout)
+        with m.If(self.config_write):
+            m.d.comb += [
+                write.lane.eq(config_lane),
+                write.row.eq(config_row),
+                write.phase_increment_write.eq(1),
+                write.phase_increment.eq(self.config_phase_increment),
+                write.wfdr_write.eq(1),
+                write.wfdr.eq(self.config_wfdr),
+                write.wfdr_mask.eq(self.config_wfdr_mask),
+            ]
+        with m.Else():
+            m.d.comb += [
+                write.lane.eq(host_lane),
+                write.row.eq(host_row),
+                write.phase_increment_write.eq(
+                    write_enable & ~self.write_select),
+                write.phase_increment.eq(self.data_in),
+                write.wfdr_write.eq(write_enable & self.write_select),
+                write.wfdr.eq(self.data_in[0:4]),
+                write.wfdr_mask.eq(self.write_mask),
+            ]
+
+        # Writes land a cycle after they're presented, once the WFDR
+        # command's pending bits have been read
+        written = Signal(write_layout)
+        m.d.sync += written.eq(write)
+
+        lane_out = [Signal(16) for x in range(0, self.lanes)]
+        lane_dropped = [Signal(1) for x in range(0, self.lanes)]
+        for lane, rf in enumerate(self.register_file):
+            self._elaborate_lane(m, rf, self._lane_multipliers[lane],
+                                 index, issue, host_row, write, written,
+                                 written.lane == lane, lane_out[lane],
+                                 lane_dropped[lane])
+
+        # Instrumentation.  Each row is written back at most
+        # update_cycles - rows cycles after it's issued.
+        drain = Signal(self.update_cycles - self.rows)
+        m.d.sync += drain.eq(Cat(issue, drain[:-1]))
+        m.d.comb += [
+            self.busy.eq(issue | drain.any()),
+            self.overrun.eq(self.update & self.busy),
+            self.wfdr_dropped.eq(Cat(lane_dropped).any()),
+        ]
+
+        # The read ports register the address, so the value appears the
+        # cycle after the address is presented.
+        read_lane = Signal(range(self.lanes))
+        m.d.sync += read_lane.eq(host_lane)
+        if self.decoder is None:
+            m.d.comb += self.data_out.eq(Array(lane_out)[read_lane])
+        else:
+            m.d.comb += [
+                self.decoder.read_data.eq(Array(lane_out)[read_lane]),
+                self.data_out.eq(self.decoder.data_out),
+            ]
+
+        return m
+
+    def _split_address(self, m: Module, address):
+        # Oscillator n is row n // lanes of lane n % lanes
+        lane = Signal(range(self.lanes))
+        row = Signal(range(self.rows))
+        if self.lanes & (self.lanes - 1) == 0:
+            lane_bits = self.lanes.bit_length() - 1
+            m.d.comb += [
+                lane.eq(address[:lane_bits]),
+                row.eq(address[lane_bits:]),
+            ]
+        else:
+            with m.Switch(address):
+                for n in range(0, self.count):
+                    with m.Case(n):
+                        m.d.comb += [
+                            lane.eq(n % self.lanes),
+                            row.eq(n // self.lanes),
+                        ]
+        return lane, row
+
+    def _elaborate_lane(self, m: Module, rf, multipliers, index, issue,
+                        host_row, write, written, write_selected, data_out,
+                        dropped):
+        # Issue
+        m.d.comb += [
+            rf.update_phase_increment.addr.eq(index),
+            rf.update_state_read.addr.eq(index),
+            rf.update_sine_read.addr.eq(index),
+            rf.update_wfdr.addr.eq(index),
+            rf.update_applied.addr.eq(index),
+        ]
+
+        # Step
+        step_valid = Signal(1)
+        step_index = Signal(range(self.rows))
+        m.d.sync += [
+            step_valid.eq(issue),
+            step_index.eq(index),
+        ]
+
+        f = rf.update_phase_increment.data
+        st = rf.update_state_read.data
+        sn = rf.update_sine_read.data
+        wfdr_buffer = rf.update_wfdr.data[0:4]
+        # A WFDR bit is pending while the host's toggle differs from
+        # the one update last applied; applying it copies the toggle
+        toggles = rf.update_wfdr.data[4:8]
+        wfdr_mask = Signal(4)
+        m.d.comb += [
+            wfdr_mask.eq(toggles ^ rf.update_applied.data),
+            rf.update_applied_write.addr.eq(step_index),
+            rf.update_applied_write.data.eq(toggles),
+            rf.update_applied_write.en.eq(step_valid),
+        ]
+
+        triangle = Signal(1)
+        resetting = Signal(1)
+        pa = Signal(17)
+        new_direction = Signal(1)
+        reset_direction = Signal(1)
+        new_state = Signal(LFOStateLayout)
+        m.d.comb += [
+            triangle.eq(is_triangle(st)),
+            resetting.eq(wfdr_buffer[0] & wfdr_mask[0]),
+            # Sum to PA with the extra bit for overflow
+            pa.eq(st.phase_accumulator +
+                  Mux(triangle, f << 1, f)),
+            # Flip on overflow if triangle
+            new_direction.eq(st.direction ^ (pa[16] & triangle)),
+            # If we're setting Direction, then use the incoming value;
+            # else use the registered value
+            reset_direction.eq(Mux(wfdr_mask[1], wfdr_buffer[1],
+                                   st.direction)),
+            # Also execute the WFDR buffer.
+            new_state.waveform.eq(
+                (st.waveform & ~wfdr_mask[2:4])
+                | (wfdr_buffer[2:4] & wfdr_mask[2:4])
+            ),
+        ]
+        with m.If(resetting):
+            m.d.comb += [
+                new_state.phase_accumulator.eq(0),
+                new_state.direction.eq(reset_direction),
+            ]
+        with m.Else():
+            m.d.comb += [
+                new_state.phase_accumulator.eq(pa[0:16]),
+                new_state.direction.eq(
+                    Mux(wfdr_mask[1], wfdr_buffer[1], new_direction)),
+            ]
+        m.d.comb += [
+            rf.update_state_write.addr.eq(step_index),
+            rf.update_state_write.data.eq(new_state),
+            rf.update_state_write.en.eq(step_valid),
+        ]
+
+        ##########################
+        # Update sine oscillator #
+        ##########################
+        # The sine oscillator is much simpler:  it's a resonating
+        # state variable filter.
+        #
+        #   sine   += f * cosine
+        #   cosine -= f * sine
+        #
+        # The second multiply needs the new sine, so the two multiplies
+        # are run back to back, each delayed a number of cycles for the
+        # synthesizer to pipeline the multiplier.
+        #
+        # Reset does not cause an update; the reset values are carried
+        # down the pipeline and written in place of the result.
+        sine_layout = data.StructLayout({
+            "valid": 1,
+            "index": range(self.rows),
+            "reset": 1,
+            "f": 16,
+            "sine": signed(16),
+            "cosine": signed(16),
+        })
+        sine_update = [Signal(sine_layout)
+                       for x in range(0, self.multiplier_delay)]
+        cosine_update = [Signal(sine_layout)
+                         for x in range(0, self.multiplier_delay)]
+
+        m.d.sync += [
+            sine_update[0].valid.eq(step_valid),
+            sine_update[0].index.eq(step_index),
+            sine_update[0].reset.eq(resetting),
+            sine_update[0].f.eq(f),
+        ]
+        m.d.comb += [
+            multipliers[0].a.eq(f),
+            multipliers[0].b.eq(sn.cosine_delay),
+        ]
+        with m.If(resetting):
+            # Clear the sine wave.  Move tau/2 forward if direction is 1
+            # (i.e. reverse sine).
             m.d.sync += [
-                sine_update[i].eq(sine_update[i-1]),
-                cosine_update[i].eq(cosine_update[i-1]),
-                sine_update_index[i].eq(sine_update_index[i-1]),
-                sine_update_enable[i].eq(sine_update_enable[i-1])
+                sine_update[0].sine.eq(0),
+                sine_update[0].cosine.eq(
+                    Mux(reset_direction, -SINE_AMPLITUDE, SINE_AMPLITUDE)),
             ]
-        
-        # If an update is at the end of the pipeline, add the results
-        # to z^-1 for sine and cosine
-        with m.If(sine_update_enable[self.multiplier_delay-1]):
-            i = self.multiplier_delay-1
-            idx = (sine_update_index[i])
+        with m.Else():
             m.d.sync += [
-                osc[idx].sine_delay.eq(sine_update[i] + osc[idx].sine_delay),
-                osc[idx].cosine_delay.eq(cosine_update[i] + osc[idx].cosine_dealy)
+                sine_update[0].sine.eq(sn.sine_delay),
+                sine_update[0].cosine.eq(sn.cosine_delay),
             ]
 
+        # Second multiply takes the sum from the first
+        a = sine_update[-1]
+        new_sine = Signal(signed(16))
+        m.d.comb += new_sine.eq(Mux(a.reset, a.sine,
+                                    a.sine + (multipliers[0].product >> 16)))
+        m.d.sync += [
+            cosine_update[0].eq(a),
+            cosine_update[0].sine.eq(new_sine),
+        ]
+        m.d.comb += [
+            multipliers[1].a.eq(a.f),
+            multipliers[1].b.eq(new_sine),
+        ]
+
+        for pipeline in (sine_update, cosine_update):
+            for i in range(1, self.multiplier_delay):
+                m.d.sync += pipeline[i].eq(pipeline[i-1])
+
+        # If an update is at the end of the pipeline, write the results
+        # to z^-1 for sine and cosine
+        b = cosine_update[-1]
+        m.d.comb += [
+            rf.update_sine_write.addr.eq(b.index),
+            rf.update_sine_write.data.sine_delay.eq(b.sine),
+            rf.update_sine_write.data.cosine_delay.eq(
+                Mux(b.reset, b.cosine, b.cosine - (multipliers[1].product >> 16))),
+            rf.update_sine_write.en.eq(b.valid),
+        ]
+
         #######
         # I/O #
         #######
-        # FIXME:  Deuglify these long lines
         # Always put the waveform for the current address on DataOut
         #   - Store PhaseAccumulator on DataOut, as:
         #     Direction   0   1
         #     Ramp:       +   +
         #     Triangle:   +   -
         #     Square:     MSB ~MSB
-        with m.If(osc[self.address].is_sine()):
-            m.d.sync += self.data_out.eq(osc[self.address].sine_delay)
-        with m.Elif(osc[self.address].is_square()):
+        m.d.comb += [
+            rf.host_state.addr.eq(host_row),
+            rf.host_sine.addr.eq(host_row),
+        ]
+        out = rf.host_state.data
+        with m.If(is_sine(out)):
+            m.d.comb += data_out.eq(rf.host_sine.data.sine_delay)
+        with m.Elif(is_square(out)):
             # Square, take the MSB, XOR with direction, and shift to
             # MSB.  Direction inverts duty cycle.
-            m.d.sync += self.data_out.eq(
-                        (osc[self.address].phase_accumulator[15] ^ osc[self.address].direction) << 15
-                    )
+            m.d.comb += data_out.eq(
+                Cat(C(0, 15), out.phase_accumulator[15] ^ out.direction))
         with m.Else():
-            # Ramps and triangles invert if Direction is 1; triangles
-            # invert Direction when they overflow, ramps can slope up
-            # or down
-            m.d.sync += self.data_out.eq(
-                            (osc[self.address].phase_accumulator ^ osc[self.address].direction.replicate(16))
-                            + osc[self.address].direction
-                        )
-        with m.If(self.write_enable):
-            # Select either the PhaseIncrement register or the
-            # Waveform, Direction, and Reset command
-            with m.Switch(self.write_select):
-                with m.Case(0):
-                    m.d.sync += osc[self.address].phase_increment.eq(self.data_in)
-                # Buffer WFDR for application during update
-                with m.Case(1):
-                    m.d.sync += [
-                        osc[self.address].wfdr_buffer.eq(
-                            osc[self.address].wfdr_buffer
-                            | (self.data_in[3:0] & self.write_mask)
-                        ),
-                        osc[self.address].wfdr_mask.eq(
-                            osc[self.address].wfdr_mask | self.write_mask
-                        )
-                    ]
+            # Ramps and triangles invert if Direction is 1;
+            # triangles invert Direction when they overflow, ramps
+            # can slope up or down
+            m.d.comb += data_out.eq(
+                (out.phase_accumulator ^ out.direction.replicate(16))
+                + out.direction)
 
-        return m
+        # Select either the PhaseIncrement register or the Waveform,
+        # Direction, and Reset command.  WFDR is buffered for
+        # application during update; the write enables on each bit
+        # replace only the masked bits of the buffer, and set their
+        # toggles opposite to what update will have applied, so they're
+        # pending.  That's known a cycle ahead, from the applied toggles
+        # and the host's own, unless update is applying this row now:
+        # if it's issued this cycle it takes the host's old toggles, and
+        # if it's stepped this cycle it writes the ones it read.
+        m.d.comb += [
+            rf.host_wfdr_read.addr.eq(write.row),
+            rf.host_applied.addr.eq(write.row),
+        ]
+        step_valid_row = step_valid & (step_index == written.row)
+        old = rf.host_wfdr_read.data[4:8]
+        applied = Signal(4)
+        with m.If(issue & (index == written.row)):
+            m.d.comb += applied.eq(old)
+        with m.Elif(step_valid_row):
+            m.d.comb += applied.eq(toggles)
+        with m.Else():
+            m.d.comb += applied.eq(rf.host_applied.data)
+        m.d.comb += [
+            rf.host_phase_increment.addr.eq(written.row),
+            rf.host_phase_increment.data.eq(written.phase_increment),
+            rf.host_phase_increment.en.eq(
+                written.phase_increment_write & write_selected),
+            rf.host_wfdr.addr.eq(written.row),
+            rf.host_wfdr.data.eq(Cat(written.wfdr, ~applied)),
+        ]
+        # A WFDR write drops the earlier command if any of its bits were
+        # still pending
+        with m.If(written.wfdr_write & write_selected):
+            m.d.comb += [
+                rf.host_wfdr.en.eq(
+                    Cat(written.wfdr_mask, written.wfdr_mask)),
+                dropped.eq(((old ^ applied) & written.wfdr_mask).any()),
+            ]
+
+class LFORegisterFile(Elaboratable):
+    """LFO register file
+    Holds (depth) oscillators in block RAM.  Each memory has one
+    writer, so the update engine and the host never contend for a
+    port, and synthesis can map every memory to RAM:
+       phase_increment:  Written by the host, read by update.
+       wfdr:  WFDR buffer (bits 3-0) and toggles (bits 7-4).  Written
+          by the host, read by update and the host.
+       applied:  The toggles update last applied.  Written by update,
+          read by update and the host.  A WFDR bit is pending while
+          its two toggles differ.
+       state:  Phase accumulator, waveform, and direction.  Written by
+          update, read by update and the host.
+       sine:  Sine and cosine delay.  Written by update, read by update
+          and the host.
+    """
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.phase_increment = Memory(shape=16, depth=depth, init=[])
+        self.wfdr = Memory(shape=8, depth=depth, init=[])
+        self.applied = Memory(shape=4, depth=depth, init=[])
+        self.state = Memory(shape=LFOStateLayout, depth=depth, init=[])
+        # Power on as if reset with Direction=0
+        self.sine = Memory(shape=LFOSineLayout, depth=depth,
+                           init=[{"sine_delay": 0,
+                                  "cosine_delay": SINE_AMPLITUDE}] * depth)
+
+        self.host_phase_increment = self.phase_increment.write_port()
+        self.update_phase_increment = self.phase_increment.read_port()
+
+        self.host_wfdr = self.wfdr.write_port(granularity=1)
+        self.update_wfdr = self.wfdr.read_port()
+        # The host reads a cycle ahead of its writes, so it sees the
+        # write before
+        self.host_wfdr_read = self.wfdr.read_port(
+            transparent_for=(self.host_wfdr,))
 
-class LFORegisterFile:
-    def __init__(self):
-        self.phase_increment = Signal(16)
-        self.phase_accumulator = Signal(16)
-        self.waveform = Signal(2)
-        self.direction = Signal(1)
-        self.sine_delay = Signal(16)
-        self.cosine_delay = Signal(16)
-        self.wfdr_buffer = Signal(4)
-        self.wfdr_mask = Signal(4)
+        self.update_applied_write = self.applied.write_port()
+        self.update_applied = self.applied.read_port()
+        self.host_applied = self.applied.read_port(
+            transparent_for=(self.update_applied_write,))
 
-    def is_ramp(self):
-        return (self.waveform == 0)
+        self.update_state_write = self.state.write_port()
+        self.update_state_read = self.state.read_port()
+        self.host_state = self.state.read_port()
+
+        self.update_sine_write = self.sine.write_port()
+        self.update_sine_read = self.sine.read_port()
+        self.host_sine = self.sine.read_port()
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        m.submodules.phase_increment = self.phase_increment
+        m.submodules.wfdr = self.wfdr
+        m.submodules.applied = self.applied
+        m.submodules.state = self.state
+        m.submodules.sine = self.sine
+        return m
 
-    def is_square(self):
-        return (self.waveform == 1)
+def is_ramp(state):
+    return (state.waveform == 0)
 
-    def is_triangle(self):
-        return (self.waveform == 2)
+def is_square(state):
+    return (state.waveform == 1)
 
-    def is_sine(self):
-        return (self.waveform == 3)
+def is_triangle(state):
+    return (state.waveform == 2)
 
-    def is_resetting(self):
-        return (self.wfdr_buffer[0] & self.wfdr_mask[0])
+def is_sine(state):
+    return (state.waveform == 3)
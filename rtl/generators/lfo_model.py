@@ -0,0 +1,167 @@
+import numpy as np
+
+# Bit-exact NumPy model of the LFO bank
+#
+# Reproduces what LFO in lfo.py leaves in its register file after each
+# update, and what it puts on data_out for each address.  The RTL
+# takes update_cycles clocks to do what update() does here; reading
+# any oscillator after that must match read().
+#
+# All arithmetic is 16-bit:
+#
+# Ramp, square, triangle:
+#   phase_accumulator += phase_increment (doubled for triangle),
+#   wrapping at 2^16.  Triangle XORs bit 16 of the 17-bit sum into
+#   Direction.
+#
+# Sine:
+#   Chamberlin resonator in signed Q1.15, with f the phase increment
+#   in unsigned Q0.16 and products floored:
+#     sine   += (f * cosine) >> 16
+#     cosine -= (f * sine) >> 16
+#
+# Because the phase accumulator is a plain counter, ramp, square, and
+# triangle have a closed form over any number of updates; render()
+# uses that, and only loops over samples for the sine delay elements.
+
+# Value of the cosine delay after reset, i.e. 1 in Q1.15
+SINE_AMPLITUDE = 2**15 - 1
+
+RAMP = 0
+SQUARE = 1
+TRIANGLE = 2
+SINE = 3
+
+def _wrap16(x):
+    # Wrap to signed 16-bit
+    return ((x + 2**15) & 0xffff) - 2**15
+
+class LFOModel:
+    """LFO reference model
+    count:  Number of oscillators.
+    All registers are arrays of (count) entries, in int64 so sums can
+    be formed without overflow:
+       phase_increment, phase_accumulator, waveform, direction,
+       sine_delay, cosine_delay, wfdr_buffer, wfdr_mask
+    """
+    def __init__(self, count: int):
+        assert (count > 0), "count must be greater than zero"
+        self.count = count
+        self.phase_increment = np.zeros(count, dtype=np.int64)
+        self.phase_accumulator = np.zeros(count, dtype=np.int64)
+        self.waveform = np.zeros(count, dtype=np.int64)
+        self.direction = np.zeros(count, dtype=np.int64)
+        self.sine_delay = np.zeros(count, dtype=np.int64)
+        # Power on as if reset with Direction=0
+        self.cosine_delay = np.full(count, SINE_AMPLITUDE, dtype=np.int64)
+        self.wfdr_buffer = np.zeros(count, dtype=np.int64)
+        self.wfdr_mask = np.zeros(count, dtype=np.int64)
+
+    def write_phase_increment(self, address, value):
+        self.phase_increment[address] = np.asarray(value) & 0xffff
+
+    def write_wfdr(self, address, data, mask):
+        """Buffer a Waveform, Direction, and Reset command
+        Same as write_select=1:  the masked bits of data replace the
+        buffer and are applied at the next update.
+        """
+        data = np.asarray(data) & 0xf
+        mask = np.asarray(mask) & 0xf
+        self.wfdr_buffer[address] = ((data & mask)
+                                     | (self.wfdr_buffer[address] & ~mask))
+        self.wfdr_mask[address] |= mask
+
+    def update(self):
+        """Step every oscillator once, applying buffered WFDR"""
+        f = self.phase_increment
+        triangle = self.waveform == TRIANGLE
+        buf = self.wfdr_buffer
+        mask = self.wfdr_mask
+
+        pa = (self.phase_accumulator + np.where(triangle, f << 1, f)) & 0x1ffff
+        new_direction = self.direction ^ ((pa >> 16) & triangle)
+        set_direction = (mask >> 1) & 1
+        buf_direction = (buf >> 1) & 1
+        resetting = (buf & mask & 1).astype(bool)
+        reset_direction = np.where(set_direction, buf_direction,
+                                   self.direction)
+
+        # Sine steps on the old values unless resetting
+        sine = _wrap16(self.sine_delay + ((f * self.cosine_delay) >> 16))
+        cosine = _wrap16(self.cosine_delay - ((f * sine) >> 16))
+        self.sine_delay = np.where(resetting, 0, sine)
+        self.cosine_delay = np.where(
+            resetting,
+            np.where(reset_direction, -SINE_AMPLITUDE, SINE_AMPLITUDE),
+            cosine)
+
+        self.waveform = (self.waveform & ~(mask >> 2)) | ((buf >> 2) & (mask >> 2))
+        self.phase_accumulator = np.where(resetting, 0, pa & 0xffff)
+        self.direction = np.where(
+            resetting, reset_direction,
+            np.where(set_direction, buf_direction, new_direction))
+        self.wfdr_mask = np.zeros_like(mask)
+
+    def read(self, address=slice(None)):
+        """data_out for the given address(es)"""
+        return self._output(self.waveform[address],
+                            self.phase_accumulator[address],
+                            self.direction[address],
+                            self.sine_delay[address])
+
+    @staticmethod
+    def _output(waveform, phase_accumulator, direction, sine_delay):
+        # Ramps and triangles invert if Direction is 1; square takes the
+        # MSB XOR Direction; sine is the sine delay
+        ramp = ((phase_accumulator ^ (direction * 0xffff)) + direction) & 0xffff
+        square = ((phase_accumulator >> 15) ^ direction) << 15
+        return np.select([waveform == SQUARE, waveform == SINE],
+                         [square, sine_delay & 0xffff],
+                         ramp).astype(np.uint16)
+
+    def render(self, samples: int) -> np.ndarray:
+        """Run (samples) updates
+        Returns data_out for every oscillator after each update, as a
+        (samples, count) array of uint16, and leaves the model in the
+        state after the last update.
+        """
+        out = np.empty((samples, self.count), dtype=np.uint16)
+        if samples == 0:
+            return out
+        # The first update applies the WFDR buffer; after that nothing
+        # changes the waveform, so the counters have a closed form.
+        self.update()
+        out[0] = self.read()
+        if samples == 1:
+            return out
+
+        k = np.arange(1, samples, dtype=np.int64)[:, None]
+        triangle = self.waveform == TRIANGLE
+        step = np.where(triangle, self.phase_increment << 1,
+                        self.phase_increment)
+        total = self.phase_accumulator + k*step
+        phase_accumulator = total & 0xffff
+        direction = self.direction ^ ((total >> 16) & 1 & triangle)
+
+        sine_delay = self._render_sine(samples - 1)
+
+        out[1:] = self._output(self.waveform, phase_accumulator,
+                               direction, sine_delay)
+        self.phase_accumulator = phase_accumulator[-1].copy()
+        self.direction = direction[-1].copy()
+        return out
+
+    def _render_sine(self, samples: int) -> np.ndarray:
+        # The resonator has no closed form in fixed point, so step
+        # every oscillator's delay elements together, once per sample.
+        f = self.phase_increment
+        s = self.sine_delay
+        c = self.cosine_delay
+        history = np.empty((samples, self.count), dtype=np.int64)
+        for i in range(0, samples):
+            s = _wrap16(s + ((f * c) >> 16))
+            c = _wrap16(c - ((f * s) >> 16))
+            history[i] = s
+        self.sine_delay = s
+        self.cosine_delay = c
+        return history
@@ -0,0 +1,77 @@
+from amaranth import *
+from .wavetable import base_frequencies
+
+# Mipmap level selection
+#
+# Picks the ramp table for a phase increment:  the first table whose
+# base frequency is at or above the tone, so no harmonic in the table
+# passes the harmonic limit.
+#
+# When a pitch bend or vibrato crosses a table boundary, the jump to a
+# table with fewer harmonics is audible.  Just above each boundary the
+# tone is instead rendered as the mean of the selected table and the
+# one below it, which was used just under the boundary.  The window
+# is 1/2^blend_window of the lower base frequency.
+#
+# Every boundary is a constant phase increment, so the selector is a
+# row of comparators into a priority encoder:  no divider and no
+# logarithm, and the result is ready in the same cycle.
+
+class MipmapSelector(Elaboratable):
+    """Mipmap level selector
+    increment:  24-bit phase increment, i.e. the tone's frequency.
+    level:  Ramp table to read.
+    blend:  Average level with level-1.
+    """
+    def __init__(self, sample_rate: int = 96000,
+                 frequencies: tuple = None,
+                 blend_window: int = 3):
+        if frequencies is None:
+            frequencies = base_frequencies()
+        self.frequencies = tuple(frequencies)
+        self.levels = len(self.frequencies)
+        self.sample_rate = sample_rate
+        self.blend_window = blend_window
+
+        # Highest increment rendered by each table but the last
+        self.thresholds = [self._increment(f) for f in self.frequencies[:-1]]
+        # Highest increment blended with the table below
+        self.blend_thresholds = [
+            self._increment(f * (1 + 2**-blend_window))
+            for f in self.frequencies[:-1]
+        ]
+
+        self.increment = Signal(24)
+        self.level = Signal(range(self.levels))
+        self.blend = Signal(1)
+
+    def _increment(self, frequency: float) -> int:
+        return int(frequency / self.sample_rate * 2**24)
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+
+        # Thermometer code:  above[i] is set for every table boundary
+        # the tone is above
+        above = Signal(len(self.thresholds))
+        window = Signal(len(self.thresholds))
+        m.d.comb += [
+            above.eq(Cat(self.increment > x for x in self.thresholds)),
+            window.eq(Cat(self.increment <= x for x in self.blend_thresholds)),
+        ]
+
+        # Priority encode from the top boundary down
+        with m.If(above == 0):
+            m.d.comb += [
+                self.level.eq(0),
+                self.blend.eq(0),
+            ]
+        for i in range(0, len(self.thresholds)):
+            with m.Elif(above[len(self.thresholds) - 1 - i]):
+                level = len(self.thresholds) - i
+                m.d.comb += [
+                    self.level.eq(level),
+                    self.blend.eq(window[level - 1]),
+                ]
+
+        return m
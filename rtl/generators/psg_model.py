@@ -0,0 +1,220 @@
+from functools import lru_cache
+import numpy as np
+
+# NumPy model of one register file's tone, noise, and envelope
+#
+# The AY-3-8910 compatible sound of one register file:  three square
+# wave tones, the noise generator, the envelope, the mixer, and the
+# amplitude controls, in the register layout of the mode selected by
+# R15 on file zero (see overview.tex):
+#
+#   8910:  12-bit tone periods, 5-bit noise period, 4-bit amplitudes
+#      with B4 selecting the envelope, and a 16-step envelope.
+#   YM2149:  As 8910, with a 32-step envelope; a fixed amplitude L is
+#      envelope step 2L+1.
+#   Expanded and Enhanced:  16-bit tone periods, 8-bit noise period,
+#      5-bit amplitudes with B5 selecting the envelope, and a 32-step
+#      envelope.  Only bank 0 is modeled; writes to bank 1 and to pages
+#      3-4 are counted as ignored.
+#
+# Time is in ticks of the master clock / 8.  Each tone toggles every
+# (period) ticks, the noise LFSR steps every 2*(period) ticks, and the
+# envelope steps every 2*(period) ticks with 16 steps, or every
+# (period) with 32.  A period of zero acts as one.
+#
+# The noise generator is a 17-bit LFSR taking bit 0 XOR bit 3 into bit
+# 16; its output is bit 0.  Between writes every generator is a
+# counter, so render() evaluates them in closed form for any set of
+# ticks, indexing a table of the LFSR's output sequence for noise.
+#
+# Output levels are integers, from a table of 3dB steps for 16 levels
+# and 1.5dB steps for 32, with full scale at AMPLITUDE and level zero
+# silent, so three channels sum to no more than 2^23 - 1.
+
+AMPLITUDE = (2**23 - 1) // 3
+
+MODE_8910 = 0
+MODE_YM2149 = 1
+MODE_EXPANDED = 2
+MODE_ENHANCED = 3
+MODE_ENHANCED_PAGE = 4
+
+NOISE_PERIOD = 2**17 - 1
+
+def mode_select(value: int) -> tuple:
+    """Decode an R15 write on file zero
+    Returns (mode, bank), where bank is None unless the write selects
+    one.
+    """
+    select = value >> 5
+    if select == 0b101:
+        return MODE_EXPANDED, (value >> 4) & 1
+    if select == 0b110:
+        return MODE_ENHANCED, None
+    if select == 0b111:
+        return MODE_ENHANCED_PAGE, None
+    if select == 0b000 and value & 0x10:
+        return MODE_YM2149, None
+    return MODE_8910, None
+
+@lru_cache(maxsize=None)
+def noise_sequence() -> np.ndarray:
+    """The LFSR's output bit at each step, over its whole period"""
+    out = np.empty(NOISE_PERIOD, dtype=np.uint8)
+    state = 1
+    for i in range(0, NOISE_PERIOD):
+        out[i] = state & 1
+        state = (state >> 1) | (((state ^ (state >> 3)) & 1) << 16)
+    return out
+
+@lru_cache(maxsize=None)
+def amplitude_table(steps: int) -> np.ndarray:
+    """Output level for each of (steps) amplitude steps"""
+    level = np.arange(0, steps)
+    decibels = (3 if steps == 16 else 1.5) * (level - (steps - 1))
+    table = np.round(AMPLITUDE * 10**(decibels / 20)).astype(np.int64)
+    table[0] = 0
+    return table
+
+class PSGModel:
+    """Tone, noise, and envelope model for one register file
+    mode:  One of the MODE_ constants, set with set_mode().
+    registers:  R0-R13 as last written, in int64.
+    ignored:  Writes to registers the model doesn't implement.
+    """
+    def __init__(self, mode: int = MODE_8910):
+        self.mode = mode
+        self.bank = 0
+        self.registers = np.zeros(14, dtype=np.int64)
+        self.ignored = 0
+        # Ticks into the current period, and each tone's output
+        self.tone_count = np.zeros(3, dtype=np.int64)
+        self.tone_out = np.zeros(3, dtype=np.int64)
+        self.noise_count = 0
+        self.noise_position = 0
+        self.envelope_count = 0
+        # Envelope steps since R13 was written
+        self.envelope_step = 0
+
+    def set_mode(self, mode: int, bank: int = None):
+        self.mode = mode
+        if bank is not None:
+            self.bank = bank
+
+    @property
+    def _expanded(self) -> bool:
+        return self.mode >= MODE_EXPANDED
+
+    @property
+    def envelope_steps(self) -> int:
+        return 16 if self.mode == MODE_8910 else 32
+
+    def write(self, register: int, value: int):
+        """Write a register in the current mode and bank"""
+        if (register > 13 or (self._expanded and self.bank)
+                or self.mode == MODE_ENHANCED_PAGE):
+            self.ignored += 1
+            return
+        self.registers[register] = value & 0xff
+        if register == 13:
+            self.envelope_count = 0
+            self.envelope_step = 0
+
+    def _tone_period(self) -> np.ndarray:
+        r = self.registers
+        coarse = r[1:6:2] if self._expanded else r[1:6:2] & 0x0f
+        return np.maximum((coarse << 8) | r[0:6:2], 1)
+
+    def _noise_period(self) -> int:
+        period = self.registers[6] & (0xff if self._expanded else 0x1f)
+        return 2 * max(int(period), 1)
+
+    def _envelope_period(self) -> int:
+        period = max(int((self.registers[12] << 8) | self.registers[11]), 1)
+        return period * (2 if self.envelope_steps == 16 else 1)
+
+    def _envelope(self, step: np.ndarray) -> np.ndarray:
+        # Envelope level after (step) steps of the shape in R13
+        steps = self.envelope_steps
+        shape = int(self.registers[13])
+        hold = shape & 1
+        alternate = (shape >> 1) & 1
+        attack = (shape >> 2) & 1
+        repeat = (shape >> 3) & 1
+        cycle = step // steps
+        position = step % steps
+        if repeat and alternate and not hold:
+            up = attack ^ (cycle & 1)
+        else:
+            up = attack
+        level = np.where(up == 1, position, steps - 1 - position)
+        if not repeat:
+            after = 0
+        elif hold:
+            after = steps - 1 if attack ^ alternate else 0
+        else:
+            return level
+        return np.where(cycle == 0, level, after)
+
+    def render(self, ticks: np.ndarray, end: int) -> np.ndarray:
+        """Channel levels at each of (ticks), then advance (end) ticks
+        ticks:  Nondecreasing tick offsets from now, less than end.
+        Returns a (len(ticks), 3) array of output levels.
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        r = self.registers
+
+        # A counter past a period shortened since the last render ends
+        # the period on the next tick
+        tone_period = self._tone_period()
+        noise_period = self._noise_period()
+        envelope_period = self._envelope_period()
+        self.tone_count = np.minimum(self.tone_count, tone_period - 1)
+        self.noise_count = min(self.noise_count, noise_period - 1)
+        self.envelope_count = min(self.envelope_count, envelope_period - 1)
+
+        total = self.tone_count[None, :] + ticks[:, None]
+        tone = self.tone_out ^ ((total // tone_period) & 1)
+
+        noise = noise_sequence()[
+            (self.noise_position + (self.noise_count + ticks)
+             // noise_period) % NOISE_PERIOD].astype(np.int64)
+
+        envelope = self._envelope(
+            self.envelope_step
+            + (self.envelope_count + ticks) // envelope_period)
+
+        # The mixer disables tone and noise with B0-B2 and B3-B5 of R7
+        mixer = r[7]
+        tone_off = (mixer >> np.arange(0, 3)) & 1
+        noise_off = (mixer >> np.arange(3, 6)) & 1
+        gate = (tone | tone_off) & (noise[:, None] | noise_off)
+
+        amplitude = r[8:11]
+        if self._expanded:
+            use_envelope = (amplitude >> 5) & 1
+            fixed = amplitude & 0x1f
+        else:
+            use_envelope = (amplitude >> 4) & 1
+            fixed = amplitude & 0x0f
+            if self.mode == MODE_YM2149:
+                fixed = np.where(fixed > 0, 2*fixed + 1, 0)
+        level = np.where(use_envelope == 1, envelope[:, None], fixed)
+        out = gate * amplitude_table(self.envelope_steps)[level]
+
+        # Advance every counter to (end)
+        total = self.tone_count + end
+        self.tone_out ^= (total // tone_period) & 1
+        self.tone_count = total % tone_period
+        total = self.noise_count + end
+        self.noise_position = ((self.noise_position + total // noise_period)
+                               % NOISE_PERIOD)
+        self.noise_count = total % noise_period
+        total = self.envelope_count + end
+        step = self.envelope_step + total // envelope_period
+        # Keep the step bounded once the shape has settled
+        if step >= 2*self.envelope_steps:
+            step = 2*self.envelope_steps + step % (2*self.envelope_steps)
+        self.envelope_step = step
+        self.envelope_count = total % envelope_period
+        return out
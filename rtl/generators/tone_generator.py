@@ -1,12 +1,15 @@
 from amaranth import *
-from amaranth.lib.coding import *
-import numpy as np
-from numpy import log2, sin, uint32, float64, power
-tau = 2*np.pi
+from amaranth.lib import data
+from amaranth.lib.memory import Memory
+from .wavetable import ramp_tables
+from .interpolator import Interpolator, WavetableROM
+from .mipmap import MipmapSelector
+from ..register_files import RegisterFiles, BankDecoder, decode
 
 # Mipmapped tone generator
 #
-# Uses 8 tables of ramps, 24 bit.
+# Uses 8 tables of ramps from 16Hz to 2048Hz, plus one at 3072Hz,
+# 24 bit.  See wavetable.py.
 #
 # Triangle is generated using the naive generator.  With its high
 # rolloff rate, generation at 96kHz sample rate and filtering works
@@ -15,58 +18,97 @@ tau = 2*np.pi
 # The enable register sets either dry (1), vibrato (2), or both (3)
 # to emulate a chorus effect.  The corresponding LFO is read by the
 # control unit, then written into the lfo_offset register for the
-# specific channel.
+# specific channel.  The wet copy has its own phase, advanced by
+# phase_increment + lfo_offset.
 #
 # The envelope controller, not the tone generator, handles the
 # amplitude.
 
+# Waveform register
+RAMP = 0
+PULSE = 1
+TRIANGLE = 2
+
+# Configuration for one channel, packed into one block RAM word.  Every
+# field sits on a 2-bit boundary so the host can write any set of
+# fields with the write port's bit enables.
+ToneGeneratorRegisterLayout = data.StructLayout({
+    # Only bit 0 is used, and it isn't stored:  writing it requests a
+    # phase reset at the next update (see ToneGeneratorRegisterFile)
+    "phase_reset": 2,
+    "enable": 2,
+    "waveform": 2,
+    "lfo": 2,
+    "duty_cycle": 8,
+    "phase_increment": 24,
+    "lfo_offset": 24,
+})
+
+# Phase accumulators, written only by the update engine
+ToneGeneratorPhaseLayout = data.StructLayout({
+    "dry": 24,
+    "wet": 24,
+})
+
+REGISTER_GRANULARITY = 2
+
+def field_enable(name: str) -> int:
+    """Write port enables covering one register field"""
+    field = ToneGeneratorRegisterLayout[name]
+    first = field.offset // REGISTER_GRANULARITY
+    last = (field.offset + field.width) // REGISTER_GRANULARITY
+    return sum(1 << i for i in range(first, last))
+
 # FIXME:  The latest Amaranth documentation says to use Component
 # instead of Elaboratable directly.
 class ToneGenerator(Elaboratable):
+    """Tone generator
+    Generates one sample for each of (channels) channels per update.
+    channels:  Number of channels.
+    update:  Start generating one sample for every channel.
+    wr:  Write strobes, LSB to MSB:
+       phase_reset, enable, phase_increment, duty_cycle, lfo,
+       lfo_offset, waveform
+    channel_select:  Channel to write.
+    files:  RegisterFiles, or None.  With register files,
+       channel_select is a BankAddressLayout, and writes to files that
+       aren't implemented are dropped; see register_files.py.
+       config_channel stays a plain channel number.
+    config_write:  Write every register of config_channel from config,
+       a ToneGeneratorRegisterLayout, in one cycle.  Takes priority
+       over wr.
+    output:  Signed 24-bit sample for output_channel, valid while
+       output_valid is high.
+    interpolators:  Number of interpolators, 1, 2, or 4.  Each channel
+       needs up to four ramps per sample, so each channel takes
+       4/interpolators cycles.
+    sample_cycles:  Clock cycles from the update pulse until the last
+       channel's sample is on output.
+    initiation_interval:  Clock cycles from the update pulse until the
+       next update may be pulsed; the pipeline drains meanwhile.
+    busy:  High from the cycle after the update pulse until the last
+       channel's sample is on output.
+    overrun:  High when update is pulsed before initiation_interval
+       has passed.  The pulse is ignored.
+    multipliers:  The interpolators' multipliers.
+    rom:  The WavetableROM, shared by the interpolators.
+    Writes reach the register file the cycle after they're presented;
+    an update pulsed on that cycle sees them.
     """
-
-    """
-    # Build 8 look-up tables from 16Hz to 2048Hz
-    #
-    # XXX:  Turn this into a dual-port ROM module?  Integrate into a
-    # combined interpolator so the tone generator can request a 24-bit
-    # sample address and receive a value?
-    #
-    # Look-up tables are calculated in double-precision float64, then
-    # scaled to a maximum peak of 1.0 using the largest sample across all
-    # tables.  This keeps each specific harmonic component at the same
-    # amplitude.
-    #
-    # The finished tables are scaled to 24-bit integer and stored in an
-    # unsigned 32-bit integer.  Samples are one-half period and range
-    # entirely between 0 and 1; after completing a half-period, the same
-    # samples are played back in reverse and negated to make a full period.
-    temp_ramp_tables = np.empty((8,1024), dtype=float64)
-
-    for i in range(0,8):
-        base_f0 = power(2, i+4)
-        n_harmonics = np.floor(18000/base_f0)
-        # Generate 1024 samples normalized to 1/2 waveform (hence /2*tau))
-        # and including all harmonics up to 18kHz
-        h = np.arange(1, n_harmonics+1)
-        temp_ramp_tables[i] = np.sum(sin(h * base_f0 / (2*tau)) / h)
-
-    # compress peak-to-peak relative to the largest amplitude
-    temp_ramp_tables /= np.max(temp_ramp_tables)
-    # convert to positive half of unsigned 24-bit range
-    #ramp_tables = [Const(x, unsigned(23)) for x in temp_ramp_tables*(power(2,23) - 1).astype(uint32)]
-    ramp_tables = [
-                   [Const(x, unsigned(23)) for x in temp_ramp_tables[y]*(power(2,23) - 1).astype(uint32)]
-                   for y in range(0,8)
-                  ]
-    del temp_ramp_tables
-
     def __init__(self,
                  channels: int = 3,
                  sample_rate: int = 96000,
-                 multiplier_delay: int = 1):
+                 multiplier_delay: int = 1,
+                 interpolators: int = 2,
+                 files: RegisterFiles = None):
+        assert (channels > 0), "channels must be greater than zero"
+        assert (files is None or files.channels == channels), \
+            "channels must be three per register file"
+        assert (interpolators in (1, 2, 4)), "interpolators must be 1, 2, or 4"
         self._multiplier_delay = multiplier_delay
-        self._channels = channels
+        self.channels = channels
+        self._sample_rate = sample_rate
+        self._interpolators = interpolators
         self.clk = Signal(1)
         self.update = Signal(1)
         # LSB to MSB:
@@ -76,9 +118,12 @@ class ToneGenerator(Elaboratable):
         #   - duty_cycle
         #   - lfo
         #   - lfo_offset
+        #   - waveform
         # phase_increment and lfo_offset use the same data lines
-        self.wr = Signal(6)
-        self.channel_select = Signal(np.ceil(log2(channels)))
+        self.wr = Signal(7)
+        self.decoder = BankDecoder(files) if files is not None else None
+        self.channel_select = (self.decoder.address if self.decoder
+                               else Signal(range(channels)))
         self.phase_reset = Signal(1)
         # Register configuration
         self.enable = Signal(2)
@@ -86,75 +131,383 @@ class ToneGenerator(Elaboratable):
         self.lfo_offset = self.phase_increment
         self.duty_cycle = Signal(8)
         self.lfo = Signal(2)
+        self.waveform = Signal(2)
+        # Wide configuration port
+        self.config_write = Signal(1)
+        self.config_channel = Signal(range(channels))
+        self.config = Signal(ToneGeneratorRegisterLayout)
         # Configuration registers
-        self.register_file = [ToneGeneratorRegisterFile() for x in range(0, channels)]
+        self.register_file = ToneGeneratorRegisterFile(channels)
+        # Wavetable ROM, shared by the interpolators, one interpolated
+        # sample per clock each
+        self.rom = WavetableROM(ramp_tables())
+        self.interpolator = [Interpolator(multiplier_delay=multiplier_delay,
+                                          rom=self.rom)
+                             for x in range(0, interpolators)]
+        self.multipliers = [x for interpolator in self.interpolator
+                            for x in interpolator.multipliers]
+
+        # Interpolator lookups per channel
+        self.slots = 4 // interpolators
+        # Issue every slot, read the registers, interpolate, accumulate,
+        # register the output
+        self.latency = 1 + self.interpolator[0].latency + 1
+        # A channel's phases are written back the cycle after they're
+        # read, so a one-cycle pass can't follow itself back to back
+        self.initiation_interval = max(channels*self.slots, 2)
+        self.sample_cycles = self.initiation_interval + self.latency
 
         # Output is 24-bit signed integer
-        self.output = signed(24)
+        self.output = Signal(signed(24))
+        self.output_valid = Signal(1)
+        self.output_channel = Signal(range(channels))
+
+        # Instrumentation
+        self.busy = Signal(1)
+        self.overrun = Signal(1)
 
     def elaborate(self, platform) -> Module:
         m = Module()
 
-        m.d.comb += m.d.sync.clk.eq(self.clk)
+        rf = self.register_file
+        m.submodules.register_file = rf
+        m.submodules.rom = self.rom
+        for i, interpolator in enumerate(self.interpolator):
+            m.submodules[f"interpolator_{i}"] = interpolator
 
-        # Valid states and transitions
+        #################
+        # Sample engine #
+        #################
+        # Each channel needs four ramps per sample:
+        #
+        #   Dry:  phase, phase + duty cycle
+        #   Wet:  wet phase, wet phase + duty cycle
         #
-        # Start:
-        #   Waiting for update signal.
-        #   update == 1 -> Updating
-        # Updating:
-        #   Iterating through channels to update phase
-        #   (last channel) -> Start
+        # Ramp uses the first of each pair; pulse subtracts the second
+        # from the first; triangle bypasses the interpolator and uses
+        # the naive triangle at the first.  Each cycle issues one lookup
+        # to every interpolator, so a channel takes (slots) cycles, and
+        # channels follow each other back to back through the pipeline:
+        #
+        # Issue:
+        #   Place the channel on the register file read ports.
+        # Fetch:
+        #   Registers arrive.  On the channel's first slot, apply a
+        #   pending phase reset and mark it applied, and write back the
+        #   advanced phases.  Start the lookups for this slot.
+        # Accumulate:
+        #   Interpolated samples arrive.  Sum them into the channel's
+        #   accumulator, and put the result on output after the
+        #   channel's last slot.
+        channel = Signal(range(self.channels))
+        slot = Signal(range(self.slots))
+        issue = Signal(1)
+        # The last issue of a pass, which the next pass may follow
+        last_issue = Signal(1)
+        if self.initiation_interval == self.channels*self.slots:
+            m.d.comb += last_issue.eq(issue & (slot == self.slots - 1)
+                                      & (channel == self.channels - 1))
         with m.FSM():
             with m.State("Start"):
                 with m.If(self.update):
-                    pass
+                    m.d.sync += [
+                        channel.eq(0),
+                        slot.eq(0),
+                    ]
+                    m.next = "Updating"
+            with m.State("Updating"):
+                m.d.comb += issue.eq(1)
+                m.d.sync += slot.eq(slot + 1)
+                with m.If(slot == self.slots - 1):
+                    m.d.sync += [
+                        slot.eq(0),
+                        channel.eq(channel + 1),
+                    ]
+                    with m.If(channel == self.channels - 1):
+                        # Park on a channel that exists, or start the
+                        # next pass back to back
+                        m.d.sync += channel.eq(0)
+                        with m.If(~(self.update & last_issue)):
+                            m.next = "Start"
+
+        # Issue
+        m.d.comb += [
+            rf.engine_config.addr.eq(channel),
+            rf.engine_phase_read.addr.eq(channel),
+            rf.engine_reset.addr.eq(channel),
+            rf.engine_applied.addr.eq(channel),
+        ]
+
+        # Fetch
+        fetch_valid = Signal(1)
+        fetch_channel = Signal(range(self.channels))
+        fetch_slot = Signal(range(self.slots))
+        m.d.sync += [
+            fetch_valid.eq(issue),
+            fetch_channel.eq(channel),
+            fetch_slot.eq(slot),
+        ]
+        first = Signal(1)
+        last = Signal(1)
+        m.d.comb += [
+            first.eq(fetch_slot == 0),
+            last.eq(fetch_slot == self.slots - 1),
+        ]
+
+        # Later slots of a channel reuse what the first slot read, so
+        # the applied phase reset and advanced phase aren't seen
+        config_latched = Signal(ToneGeneratorRegisterLayout)
+        phase_latched = Signal(ToneGeneratorPhaseLayout)
+        config = Signal(ToneGeneratorRegisterLayout)
+        phase = Signal(ToneGeneratorPhaseLayout)
+        m.d.comb += [
+            config.eq(Mux(first, rf.engine_config.data, config_latched)),
+            config.phase_reset.eq(Mux(
+                first, rf.engine_reset.data ^ rf.engine_applied.data,
+                config_latched.phase_reset)),
+            phase.eq(Mux(first, rf.engine_phase_read.data, phase_latched)),
+            rf.engine_applied_write.addr.eq(fetch_channel),
+            rf.engine_applied_write.data.eq(rf.engine_reset.data),
+            rf.engine_applied_write.en.eq(fetch_valid & first),
+        ]
+        m.d.sync += [
+            config_latched.eq(config),
+            phase_latched.eq(phase),
+        ]
+
+        dry = Signal(24)
+        wet = Signal(24)
+        wet_increment = Signal(24)
+        m.d.comb += [
+            dry.eq(Mux(config.phase_reset[0], 0, phase.dry)),
+            wet.eq(Mux(config.phase_reset[0], 0, phase.wet)),
+            wet_increment.eq(config.phase_increment + config.lfo_offset),
+            rf.engine_phase_write.addr.eq(fetch_channel),
+            rf.engine_phase_write.data.dry.eq(dry + config.phase_increment),
+            rf.engine_phase_write.data.wet.eq(wet + wet_increment),
+            rf.engine_phase_write.en.eq(fetch_valid & first),
+        ]
+
+        # The four lookups, in slot order
+        duty = Cat(C(0, 16), config.duty_cycle)
+        pulse = config.waveform == PULSE
+        triangle = config.waveform == TRIANGLE
+        copies = [
+            (dry, config.phase_increment, config.enable[0]),
+            (wet, wet_increment, config.enable[1]),
+        ]
+        lookups = []
+        for p, increment, enabled in copies:
+            selector = MipmapSelector(self._sample_rate)
+            m.submodules += selector
+            m.d.comb += selector.increment.eq(increment)
+            lookups += [
+                # Phase, mipmap selector, use, negate, triangle
+                (p, selector, enabled, 0, triangle),
+                (p + duty, selector, enabled & pulse, 1, 0),
+            ]
+
+        # Pulse is the difference of two ramps, and dry + wet is the sum
+        # of two copies; scale the sum back to 24 bits
+        shift = Signal(2)
+        m.d.comb += shift.eq(pulse + (config.enable == 0b11))
+
+        term_layout = data.StructLayout({
+            "use": 1,
+            "negate": 1,
+            "triangle": 1,
+            "triangle_value": signed(24),
+        })
+        tag_layout = data.StructLayout({
+            "valid": 1,
+            "channel": range(self.channels),
+            "last": 1,
+            "shift": 2,
+            "terms": data.ArrayLayout(term_layout, self._interpolators),
+        })
+        tag = [Signal(tag_layout)
+               for x in range(0, self.interpolator[0].latency)]
+        m.d.sync += [
+            tag[0].valid.eq(fetch_valid),
+            tag[0].channel.eq(fetch_channel),
+            tag[0].last.eq(last),
+            tag[0].shift.eq(shift),
+        ]
+        for i, interpolator in enumerate(self.interpolator):
+            # Interpolator i takes lookup slot*interpolators + i
+            with m.Switch(fetch_slot):
+                for s in range(0, self.slots):
+                    p, selector, use, negate, is_triangle = \
+                        lookups[s*self._interpolators + i]
+                    with m.Case(s):
+                        m.d.comb += [
+                            interpolator.phase.eq(p),
+                            interpolator.level.eq(selector.level),
+                            interpolator.blend.eq(selector.blend),
+                        ]
+                        m.d.sync += [
+                            tag[0].terms[i].use.eq(use),
+                            tag[0].terms[i].negate.eq(negate),
+                            tag[0].terms[i].triangle.eq(is_triangle),
+                            tag[0].terms[i].triangle_value.eq(
+                                self._naive_triangle(p)),
+                        ]
+            m.d.comb += interpolator.read.eq(fetch_valid)
+        for i in range(1, len(tag)):
+            m.d.sync += tag[i].eq(tag[i-1])
+
+        # Accumulate
+        t = tag[-1]
+        accumulator = Signal(signed(26))
+        total = Signal(signed(26))
+        terms = []
+        for interpolator, term in zip(self.interpolator, t.terms):
+            value = Signal(signed(24))
+            m.d.comb += value.eq(Mux(term.triangle, term.triangle_value,
+                                     interpolator.sample))
+            terms.append(Mux(term.use, Mux(term.negate, -value, value), 0))
+        m.d.comb += total.eq(accumulator + sum(terms))
+
+        m.d.sync += self.output_valid.eq(0)
+        with m.If(t.valid):
+            m.d.sync += accumulator.eq(Mux(t.last, 0, total))
+            with m.If(t.last):
+                m.d.sync += [
+                    self.output.eq(total >> t.shift),
+                    self.output_valid.eq(1),
+                    self.output_channel.eq(t.channel),
+                ]
+
+        # Instrumentation
+        m.d.comb += [
+            self.busy.eq(issue | fetch_valid | Cat(x.valid for x in tag).any()
+                         | self.output_valid),
+            self.overrun.eq(self.update & issue & ~last_issue),
+        ]
+
+        #######
+        # I/O #
+        #######
+        # Each strobe in wr writes its field; the rest of the channel's
+        # registers are untouched.  The wide port writes them all.
+        select, wr = decode(m, self.decoder, self.channel_select, self.wr)
+        write_channel = Signal(range(self.channels))
+        write_data = Signal(ToneGeneratorRegisterLayout)
+        write_en = Signal(len(rf.host.en))
+        write_reset = Signal(1)
+        m.d.comb += [
+            write_channel.eq(select),
+            write_data.enable.eq(self.enable),
+            write_data.waveform.eq(self.waveform),
+            write_data.lfo.eq(self.lfo),
+            write_data.duty_cycle.eq(self.duty_cycle),
+            write_data.phase_increment.eq(self.phase_increment),
+            write_data.lfo_offset.eq(self.lfo_offset),
+            write_reset.eq(wr[0]),
+        ]
+        strobes = ["enable", "phase_increment", "duty_cycle", "lfo",
+                   "lfo_offset", "waveform"]
+        m.d.comb += write_en.eq(
+            sum(Mux(wr[i + 1], field_enable(name), 0)
+                for i, name in enumerate(strobes)))
+        with m.If(self.config_write):
+            m.d.comb += [
+                write_channel.eq(self.config_channel),
+                write_data.eq(self.config),
+                write_en.eq(-1 ^ field_enable("phase_reset")),
+                write_reset.eq(self.config.phase_reset[0]),
+            ]
+
+        # Writes land a cycle after they're presented.  A phase reset
+        # sets the channel's reset toggle opposite to what the engine
+        # will have applied, which is known a cycle ahead from the
+        # applied toggles and the host's own, unless the engine is
+        # applying this channel now:  if it's issued this cycle it takes
+        # the host's old toggle, and if it's fetched this cycle it
+        # writes the one it read.
+        written_channel = Signal(range(self.channels))
+        written_data = Signal(ToneGeneratorRegisterLayout)
+        written_en = Signal(len(rf.host.en))
+        written_reset = Signal(1)
+        m.d.sync += [
+            written_channel.eq(write_channel),
+            written_data.eq(write_data),
+            written_en.eq(write_en),
+            written_reset.eq(write_reset),
+        ]
+        m.d.comb += [
+            rf.host_reset_read.addr.eq(write_channel),
+            rf.host_applied.addr.eq(write_channel),
+        ]
+        applied = Signal(1)
+        with m.If(issue & (slot == 0) & (channel == written_channel)):
+            m.d.comb += applied.eq(rf.host_reset_read.data)
+        with m.Elif(fetch_valid & first & (fetch_channel == written_channel)):
+            m.d.comb += applied.eq(rf.engine_reset.data)
+        with m.Else():
+            m.d.comb += applied.eq(rf.host_applied.data)
+        m.d.comb += [
+            rf.host.addr.eq(written_channel),
+            rf.host.data.eq(written_data),
+            rf.host.en.eq(written_en),
+            rf.host_reset.addr.eq(written_channel),
+            rf.host_reset.data.eq(~applied),
+            rf.host_reset.en.eq(written_reset),
+        ]
 
-        # Sample update state machine
-        # f(b) = base sample from duty cycle offset, i.e. Dry 2 when
-        #        phase = 0
-        #
-        # Start:
-        #   Waiting for sample update signal.
-        #   sample_update[0] == 1 -> Dry 1
-        # Dry 1:
-        #   Channel dry enabled:
-        #     Fetch two adjacent samples from look-up table.
-        #     -> Dry 2
-        #   Else:
-        #     Clear dry sample register.
-        #     -> Wet 1
-        # Dry 2:
-        #   Interpolate between two samples, store to register.
-        #   Fetch two adjacent samples for f(b)
-        #   Duty cycle % 0.5 != 0 -> Dry 3
-        #   Wet enabled -> Wet 1
-        # Dry 3:
-        #   Interpolate between two samples, sum with register.
-        #   Fetch two adjacent samples for f(w+b)
-        #   -> Dry 4
-        # Dry 4:
-        #   Interpolate between two samples, sum with register.
-        #   -> Wet 1
-        # Wet 1:
-        #   Channel wet enabled:
-        #     Fetch two adjacent samples from look-up table for the
-        #     LFO-modulated waveform.
-        #     -> Wet 2
-        #   Else:
-        #     Increment channel
-        #     sample_update[-1] == 1 -> Start
-        #     -> Dry 1
-        # Wet 2:
-        #   
         return m
 
-class ToneGeneratorRegister:
+    @staticmethod
+    def _naive_triangle(phase: Value) -> Value:
+        # Fold the second half-period back down, then center on zero
+        folded = Mux(phase[23], ~phase[:23], phase[:23])
+        return (folded << 1) - (2**23 - 1)
 
-    def __init__(self):
-        self._enable = Signal(2)
-        self._phase = Signal(24)
-        self._phase_increment = Signal(24)
-        self._duty_cycle = Signal(8)
-        self._lfo = Signal(2)
-        self._lfo_offset = Signal(24)
+class ToneGeneratorRegisterFile(Elaboratable):
+    """Tone generator register file
+    Holds (depth) channels in block RAM.  Each memory has one writer,
+    so synthesis can map every memory to RAM:
+       config:  ToneGeneratorRegisterLayout, less phase_reset.  Written
+          by the host, read by the update engine.
+       reset:  Phase reset toggle.  Written by the host, read by the
+          update engine and the host.
+       applied:  The reset toggle the update engine last applied.
+          Written by the update engine, read by it and the host.  A
+          phase reset is pending while the two toggles differ.
+       phase:  Dry and wet phase accumulators.  Written and read by
+          the update engine.
+    """
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.config = Memory(shape=ToneGeneratorRegisterLayout.size,
+                             depth=depth, init=[])
+        self.reset = Memory(shape=1, depth=depth, init=[])
+        self.applied = Memory(shape=1, depth=depth, init=[])
+        self.phase = Memory(shape=ToneGeneratorPhaseLayout, depth=depth,
+                            init=[])
+
+        self.host = self.config.write_port(granularity=REGISTER_GRANULARITY)
+        self.engine_config = self.config.read_port()
+
+        self.host_reset = self.reset.write_port()
+        self.engine_reset = self.reset.read_port()
+        # The host reads a cycle ahead of its writes, so it sees the
+        # write before
+        self.host_reset_read = self.reset.read_port(
+            transparent_for=(self.host_reset,))
+
+        self.engine_applied_write = self.applied.write_port()
+        self.engine_applied = self.applied.read_port()
+        self.host_applied = self.applied.read_port(
+            transparent_for=(self.engine_applied_write,))
+
+        self.engine_phase_write = self.phase.write_port()
+        self.engine_phase_read = self.phase.read_port()
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        m.submodules.config = self.config
+        m.submodules.reset = self.reset
+        m.submodules.applied = self.applied
+        m.submodules.phase = self.phase
+        return m
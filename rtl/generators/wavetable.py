@@ -0,0 +1,107 @@
+import os
+from functools import lru_cache
+import numpy as np
+from numpy import sin, float64, pi
+
+# Mipmapped ramp wavetables
+#
+# One table per base frequency, 16Hz doubling up to 2048Hz, plus the
+# 3072Hz table from the design document.  Each table is the band
+# limited ramp:  the sum of sin(h*theta)/h for every harmonic h whose
+# frequency is below the harmonic limit.
+#
+# Only the first half-period is stored.  The ramp is odd about pi, so
+# the second half is the first half played back in reverse and
+# negated.  Samples are taken at the middle of each step so the
+# mirrored half lines up exactly:
+#
+#   theta(n) = pi * (n + 0.5) / length
+#
+# Look-up tables are calculated in double-precision float64, then
+# scaled to a maximum peak of 1.0 using the largest sample across all
+# tables.  This keeps each specific harmonic component at the same
+# amplitude.  The half-period is entirely positive, so the finished
+# tables are scaled to the positive half of a (bits)-bit signed
+# integer and stored in an unsigned 32-bit integer.
+#
+# Building the 16Hz table sums over a thousand harmonics, so tables are
+# memoized per parameter set and saved as .npy files in the cache
+# directory:  $HARDAY_CACHE_DIR, else $XDG_CACHE_HOME/harday, else
+# ~/.cache/harday.  File names carry VERSION, so changing how tables
+# are built leaves the old files behind rather than loading them; a
+# file of the wrong shape or type is rebuilt.
+
+# Bump when _build_ramp_tables() changes its output
+VERSION = 1
+
+def cache_dir() -> str:
+    path = os.environ.get("HARDAY_CACHE_DIR")
+    if path:
+        return path
+    xdg = os.environ.get("XDG_CACHE_HOME",
+                         os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(xdg, "harday")
+
+def base_frequencies(tables: int = 8,
+                     extra_frequencies: tuple = (3072,)) -> tuple:
+    """Base frequency of each table, in table order"""
+    return tuple(2**(i+4) for i in range(0, tables)) + tuple(extra_frequencies)
+
+def ramp_tables(harmonic_limit: int = 18000,
+                tables: int = 8,
+                length: int = 1024,
+                bits: int = 24,
+                extra_frequencies: tuple = (3072,)) -> np.ndarray:
+    """Half-period ramp tables
+    Returns a read-only (tables + len(extra_frequencies), length) array
+    of uint32.  Flatten it to initialize a ROM.
+    """
+    # Any sequence of frequencies will do; the memo needs a tuple
+    return _ramp_tables(harmonic_limit, tables, length, bits,
+                        tuple(extra_frequencies))
+
+@lru_cache(maxsize=None)
+def _ramp_tables(harmonic_limit: int, tables: int, length: int, bits: int,
+                 extra_frequencies: tuple) -> np.ndarray:
+    frequencies = base_frequencies(tables, extra_frequencies)
+    name = "ramp-v{}-{}Hz-{}x{}-{}bit-{}.npy".format(
+        VERSION, harmonic_limit, len(frequencies), length, bits,
+        "_".join(str(f) for f in frequencies))
+    path = os.path.join(cache_dir(), name)
+
+    try:
+        result = np.load(path)
+        if result.shape != (len(frequencies), length) \
+                or result.dtype != np.uint32:
+            raise ValueError(f"{path} has the wrong shape or type")
+    except (OSError, ValueError, EOFError):
+        result = _build_ramp_tables(harmonic_limit, frequencies,
+                                    length, bits)
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            # Write under a temporary name so a concurrent build never
+            # sees a partial file
+            temp = "{}.{}.tmp".format(path, os.getpid())
+            with open(temp, "wb") as file:
+                np.save(file, result)
+            os.replace(temp, path)
+        except OSError:
+            pass
+
+    result.setflags(write=False)
+    return result
+
+def _build_ramp_tables(harmonic_limit: int, frequencies: tuple,
+                       length: int, bits: int) -> np.ndarray:
+    theta = pi * (np.arange(0, length, dtype=float64) + 0.5) / length
+    temp_ramp_tables = np.empty((len(frequencies), length), dtype=float64)
+
+    for i, base_f0 in enumerate(frequencies):
+        n_harmonics = max(1, harmonic_limit // base_f0)
+        h = np.arange(1, n_harmonics+1, dtype=float64)
+        temp_ramp_tables[i] = sin(np.outer(theta, h)) @ (1/h)
+
+    # compress peak-to-peak relative to the largest amplitude
+    temp_ramp_tables /= np.max(temp_ramp_tables)
+    # convert to positive half of the signed (bits)-bit range
+    return np.round(temp_ramp_tables * (2**(bits-1) - 1)).astype(np.uint32)
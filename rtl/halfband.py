@@ -0,0 +1,119 @@
+import argparse
+from functools import lru_cache
+import numpy as np
+
+# Half-band filter design
+#
+# A half-band FIR has its cutoff at a quarter of the sample rate, and
+# every other tap is zero:  for (taps) = 4K-1 taps, centered on tap
+# D = 2K-1,
+#
+#   h[D] = 1/2
+#   h[D +/- 2j] = 0,           j = 1 .. K-1
+#   h[D +/- (2j+1)] = c[j],    j = 0 .. K-1
+#
+# so only K distinct multiplies are needed per output, by adding the
+# two samples that share each coefficient first.  The center tap is a
+# shift.  The response is symmetric about fs/4:  the passband ripple
+# is the stopband ripple, and a passband edge at fp puts the stopband
+# edge at fs/2 - fp.  At 96kHz, a 20kHz passband leaves everything
+# above 28kHz attenuated, and decimating to 48kHz folds that back no
+# lower than 20kHz.
+#
+# The coefficients are a Kaiser-windowed sinc, computed in float64 and
+# rounded to signed (bits)-bit integers scaled by 2^(bits-1); the
+# center tap is exactly 2^(bits-2).  Windowing a sinc keeps the zero
+# taps exactly zero.  The Kaiser beta is the one that gives the least
+# ripple for the quantized coefficients, the larger of the passband
+# deviation from unity and the stopband gain, searched in steps of
+# 0.05.
+#
+# Run as a script, this prints the attenuation for each filter length
+# against the multipliers needed to produce one output per channel in
+# a given number of cycles.
+
+def halfband_response(coefficients, bits: int = 18,
+                      points: int = 8192) -> np.ndarray:
+    """Magnitude response of quantized half-band coefficients
+    Returns |H| at points//2 + 1 frequencies from 0 to fs/2.
+    """
+    k = len(coefficients)
+    h = np.zeros(4*k - 1, dtype=np.float64)
+    h[2*k - 1] = 0.5
+    for j, c in enumerate(coefficients):
+        h[2*k - 1 - (2*j + 1)] = h[2*k - 1 + (2*j + 1)] = c / 2**(bits-1)
+    return np.abs(np.fft.rfft(h, points))
+
+def stopband_attenuation(coefficients, bits: int = 18,
+                         passband: float = 20000,
+                         sample_rate: float = 96000) -> float:
+    """Lowest attenuation in dB from fs/2 - passband to fs/2, against
+    unity gain
+    """
+    response = halfband_response(coefficients, bits)
+    frequency = np.linspace(0, sample_rate/2, len(response))
+    stopband = response[frequency >= sample_rate/2 - passband]
+    return float(-20*np.log10(max(stopband.max(), 1e-12)))
+
+def _ripple(coefficients, bits: int, passband: float,
+            sample_rate: float) -> float:
+    response = halfband_response(coefficients, bits)
+    frequency = np.linspace(0, sample_rate/2, len(response))
+    return max(np.abs(response[frequency <= passband] - 1).max(),
+               response[frequency >= sample_rate/2 - passband].max())
+
+def _quantize(taps: int, beta: float, bits: int) -> tuple:
+    k = (taps + 1) // 4
+    n = np.arange(0, taps) - (2*k - 1)
+    h = 0.5 * np.sinc(n / 2) * np.kaiser(taps, beta)
+    return tuple(int(x) for x in
+                 np.round(h[2*k:][0::2] * 2**(bits-1)).astype(np.int64))
+
+@lru_cache(maxsize=None)
+def halfband_coefficients(taps: int = 11, bits: int = 18,
+                          passband: float = 20000,
+                          sample_rate: float = 96000) -> tuple:
+    """Distinct half-band coefficients
+    Returns c[0] .. c[K-1] as integers, where c[j] is the tap (2j+1)
+    either side of the center.
+    """
+    assert (taps >= 3 and taps % 4 == 3), "taps must be 4K-1"
+    assert (bits > 2), "bits must be greater than two"
+    return min((_quantize(taps, beta, bits)
+                for beta in np.arange(0, 20, 0.05)),
+               key=lambda c: _ripple(c, bits, passband, sample_rate))
+
+def report(max_taps: int = 31, bits: int = 18, passband: float = 20000,
+           sample_rate: float = 96000, cycles=(1, 2, 4)) -> str:
+    """Stopband attenuation against multipliers, one filter per line
+    For each entry in cycles, the multipliers needed to produce one
+    output per channel in that many clock cycles.
+    """
+    lines = [f"{'taps':>4} {'multiplies':>10} {'stopband dB':>11}  "
+             + " ".join(f"{f'{n} cycles':>9}" for n in cycles)]
+    for taps in range(3, max_taps + 1, 4):
+        k = (taps + 1) // 4
+        c = halfband_coefficients(taps, bits, passband, sample_rate)
+        attenuation = stopband_attenuation(c, bits, passband, sample_rate)
+        lines.append(f"{taps:>4} {k:>10} {attenuation:>11.1f}  "
+                     + " ".join(f"{-(-k // n):>9}" for n in cycles))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Half-band output filter attenuation against "
+                    "multiplier count")
+    parser.add_argument("--max-taps", type=int, default=31)
+    parser.add_argument("--bits", type=int, default=18,
+                        help="coefficient bits (default 18)")
+    parser.add_argument("--passband", type=float, default=20000,
+                        help="passband edge in Hz (default 20000)")
+    parser.add_argument("--sample-rate", type=float, default=96000)
+    parser.add_argument("--cycles", type=int, nargs="+", default=[1, 2, 4],
+                        help="clock cycles per output per channel")
+    args = parser.parse_args()
+    print(report(args.max_taps, args.bits, args.passband,
+                 args.sample_rate, args.cycles))
+
+if __name__ == "__main__":
+    main()
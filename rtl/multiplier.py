@@ -0,0 +1,120 @@
+from amaranth import *
+
+# Shared multipliers
+#
+# Every multiply in the design goes through a Multiplier:  the client
+# puts operands on a and b, and the product comes out on product
+# (delay) cycles later.  Each unit lists its multipliers in its
+# multipliers attribute and elaborates them.  On its own, a Multiplier
+# is one multiplier with (delay) pipeline registers.
+#
+# A MultiplierPool instead serves many units' Multipliers from a fixed
+# number of physical multipliers.  The Schedule (see schedule.py) gives
+# each unit's stage a window of the sample period, and assigns each of
+# its Multipliers to a physical multiplier no other stage uses during
+# that window.  Each physical multiplier takes its operands from
+# whichever stage's window the sequencer is in, so the sharing is
+# static:  there are no requests to arbitrate, and a unit's products
+# arrive exactly as they would from its own multiplier.  Products are
+# returned to every Multiplier sharing the physical multiplier; each
+# client only looks at the product on the cycles it expects one.
+#
+# All Multipliers sharing a pool must have the same delay.
+
+class Multiplier(Elaboratable):
+    """Multiplier
+    a, b:  Operands.
+    product:  a * b, delay cycles after a and b are presented.
+    delay:  Pipeline registers after the multiply.
+    shared:  Set when a MultiplierPool drives product; the Multiplier
+       then elaborates to nothing.
+    """
+    def __init__(self, a_shape, b_shape, delay: int = 1):
+        assert (delay > 0), "delay must be greater than zero"
+        self.a = Signal(a_shape)
+        self.b = Signal(b_shape)
+        self.delay = delay
+        self.product = Signal((self.a * self.b).shape())
+        self.shared = False
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        if self.shared:
+            return m
+        stages = [Signal.like(self.product) for x in range(0, self.delay)]
+        m.d.sync += stages[0].eq(self.a * self.b)
+        for i in range(1, self.delay):
+            m.d.sync += stages[i].eq(stages[i-1])
+        m.d.comb += self.product.eq(stages[-1])
+        return m
+
+def _signed_width(shape) -> int:
+    # Bits needed to hold the shape as signed
+    shape = Shape.cast(shape)
+    return shape.width + (0 if shape.signed else 1)
+
+class MultiplierPool(Elaboratable):
+    """Multiplier pool
+    schedule:  Schedule built with a number of multipliers; its
+       multiplier attribute gives each stage's physical multipliers.
+    cycle:  The sequencer's cycle within the sample period.
+    clients:  Dict of stage name to its list of Multipliers, in the
+       order of the schedule's assignment.
+    count:  Physical multipliers.
+    """
+    def __init__(self, schedule, cycle: Signal, clients: dict):
+        assert (schedule.multipliers is not None), \
+            "schedule has no multiplier assignment"
+        self.schedule = schedule
+        self.cycle = cycle
+        self.count = schedule.multipliers
+        self.clients = clients
+
+        delays = set()
+        self._users = [[] for x in range(0, self.count)]
+        for name, multipliers in clients.items():
+            assigned = schedule.multiplier[name]
+            assert (len(multipliers) == len(assigned)), \
+                f"stage {name!r} has {len(multipliers)} multipliers, " \
+                f"scheduled for {len(assigned)}"
+            for multiplier, physical in zip(multipliers, assigned):
+                multiplier.shared = True
+                delays.add(multiplier.delay)
+                self._users[physical].append((name, multiplier))
+        assert (len(delays) <= 1), "multipliers in a pool need one delay"
+        self.delay = delays.pop() if delays else 1
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        for users in self._users:
+            if not users:
+                continue
+            a = Signal(signed(max(_signed_width(x.a.shape())
+                                  for name, x in users)))
+            b = Signal(signed(max(_signed_width(x.b.shape())
+                                  for name, x in users)))
+            physical = Multiplier(a.shape(), b.shape(), self.delay)
+            m.submodules += physical
+
+            # Take operands from the stage whose window this is; the
+            # last user takes every other cycle
+            for i, (name, multiplier) in enumerate(users):
+                window = self.schedule.window(name, self.cycle)
+                operands = [
+                    physical.a.eq(multiplier.a),
+                    physical.b.eq(multiplier.b),
+                ]
+                if len(users) == 1:
+                    m.d.comb += operands
+                elif i == 0:
+                    with m.If(window):
+                        m.d.comb += operands
+                elif i < len(users) - 1:
+                    with m.Elif(window):
+                        m.d.comb += operands
+                else:
+                    with m.Else():
+                        m.d.comb += operands
+            for name, multiplier in users:
+                m.d.comb += multiplier.product.eq(physical.product)
+        return m
@@ -0,0 +1,278 @@
+from amaranth import *
+from amaranth.lib import data
+from amaranth.lib.memory import Memory
+from .halfband import halfband_coefficients
+from .multiplier import Multiplier
+from .register_files import RegisterFiles, BankDecoder, decode
+
+# Half-band output filter
+#
+# A half-band FIR (see halfband.py) for every channel, time-multiplexed
+# through one pipeline.  Each output needs K multiplies, one for each
+# pair of taps sharing a coefficient:
+#
+#   y[n] = x[n-D]/2 + sum c[j] * (x[n-D+2j+1] + x[n-D-2j-1])
+#
+# for taps = 4K-1 and D = 2K-1.  The K multiplies are spread over
+# (multipliers) multipliers, so each output takes initiation_interval
+# = ceil(K/multipliers) cycles; multiplier i takes coefficient
+# t*multipliers + i on cycle t.  The center tap is a shift.  With one
+# multiplier, every tap of every channel goes through it.
+#
+# The coefficients are in ROM, one per multiplier, read on the same
+# cycle as the samples.  Each channel's last (taps) samples are in a
+# circular buffer in memory, written at the channel's pointer, which
+# advances by one each sample.  Two read ports per multiplier fetch
+# the pair of samples to pre-add, and one more fetches the center tap.
+#
+# Sums are exact, and the result is rounded to the nearest and
+# saturated to 24 bits.  With decimate, only every other sample of
+# each channel produces an output, starting with the second, halving
+# the output rate; every sample is still written to the buffer.
+#
+# A sample may be presented every initiation_interval cycles, or
+# slower.  Like the state variable filter, a channel must not be
+# presented again within latency cycles.  A disabled filter still
+# runs, so enabling it doesn't start from stale samples, but passes
+# its input through.
+#
+# The control unit uses two of these, one for each pass of the output
+# filter, on either side of the post-filter bitcrusher.
+
+class HalfBandFilter(Elaboratable):
+    """Half-band filter bank
+    sample:  Signed 24-bit input for channel, taken while valid is
+       high.
+    out:  Filtered sample for out_channel, latency cycles later, valid
+       while out_valid is high.
+    enable:  Filter the channel, else pass the input through; written
+       to channel_select with write_enable.
+    files:  RegisterFiles, or None.  With register files,
+       channel_select is a BankAddressLayout, and writes to files that
+       aren't implemented are dropped; see register_files.py.
+    taps:  Filter length, 4K-1.
+    coefficients:  The K distinct coefficients, from
+       halfband_coefficients(taps, coefficient_bits).
+    initiation_interval:  Clock cycles between samples.
+    latency:  Clock cycles from a sample to its output.
+    multipliers:  The filter's multipliers.
+    """
+    def __init__(self, channels: int = 3, taps: int = 11,
+                 multipliers: int = 1, multiplier_delay: int = 1,
+                 decimate: bool = False, coefficient_bits: int = 18,
+                 files: RegisterFiles = None):
+        assert (channels > 0), "channels must be greater than zero"
+        assert (files is None or files.channels == channels), \
+            "channels must be three per register file"
+        assert (taps >= 3 and taps % 4 == 3), "taps must be 4K-1"
+        assert (multipliers > 0), "multipliers must be greater than zero"
+        assert (multiplier_delay > 0), "multiplier_delay must be greater than zero"
+        self.channels = channels
+        self.taps = taps
+        self.decimate = decimate
+        self.coefficient_bits = coefficient_bits
+        self.coefficients = halfband_coefficients(taps, coefficient_bits)
+        self._k = len(self.coefficients)
+        self.initiation_interval = -(-self._k // multipliers)
+        # Read the pointer, write the sample, then (initiation_interval)
+        # fetches, the multiply, and register the output
+        self.latency = 3 + self.initiation_interval + multiplier_delay
+        # Samples kept per channel, a power of two for the circular
+        # buffer
+        self._pointer_bits = (taps - 1).bit_length()
+
+        self.clk = Signal(1)
+        self.sample = Signal(signed(24))
+        self.channel = Signal(range(channels))
+        self.valid = Signal(1)
+        self.out = Signal(signed(24))
+        self.out_channel = Signal(range(channels))
+        self.out_valid = Signal(1)
+
+        self.decoder = BankDecoder(files) if files is not None else None
+        self.channel_select = (self.decoder.address if self.decoder
+                               else Signal(range(channels)))
+        self.enable = Signal(1)
+        self.write_enable = Signal(1)
+
+        self.multipliers = [
+            Multiplier(signed(25), signed(coefficient_bits),
+                       multiplier_delay)
+            for x in range(0, multipliers)]
+
+        self.config = Memory(shape=unsigned(1), depth=channels, init=[])
+        self.pointer = Memory(shape=unsigned(self._pointer_bits),
+                              depth=channels, init=[])
+        self.history = Memory(shape=signed(24),
+                              depth=channels << self._pointer_bits, init=[])
+        # Coefficient t*multipliers + i for multiplier i on cycle t
+        self.rom = [Memory(shape=signed(coefficient_bits),
+                           depth=self.initiation_interval,
+                           init=[self._coefficient(t*multipliers + i)
+                                 for t in range(0, self.initiation_interval)])
+                    for i in range(0, multipliers)]
+        self._config_write = self.config.write_port()
+        self._config_read = self.config.read_port()
+        self._pointer_write = self.pointer.write_port()
+        self._pointer_read = self.pointer.read_port()
+        self._history_write = self.history.write_port()
+        # The center tap, then the near and far sample of each
+        # multiplier's pair
+        self._center = self.history.read_port()
+        self._near = [self.history.read_port() for x in self.multipliers]
+        self._far = [self.history.read_port() for x in self.multipliers]
+        self._coefficient_read = [rom.read_port() for rom in self.rom]
+
+    def _coefficient(self, j: int) -> int:
+        return self.coefficients[j] if j < self._k else 0
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        m.submodules.config = self.config
+        m.submodules.pointer = self.pointer
+        m.submodules.history = self.history
+        for i, rom in enumerate(self.rom):
+            m.submodules[f"rom_{i}"] = rom
+        for i, multiplier in enumerate(self.multipliers):
+            m.submodules[f"multiplier_{i}"] = multiplier
+        count = len(self.multipliers)
+        delay = self.multipliers[0].delay
+        bits = self.coefficient_bits
+        ii = self.initiation_interval
+
+        config_write = self._config_write
+        config_read = self._config_read
+        select, write_enable = decode(m, self.decoder, self.channel_select,
+                                      self.write_enable)
+        m.d.comb += [
+            config_write.addr.eq(select),
+            config_write.data.eq(self.enable),
+            config_write.en.eq(write_enable),
+        ]
+
+        # Read the channel's registers
+        pointer_read = self._pointer_read
+        pointer_write = self._pointer_write
+        m.d.comb += [
+            config_read.addr.eq(self.channel),
+            pointer_read.addr.eq(self.channel),
+        ]
+        item_layout = data.StructLayout({
+            "valid": 1,
+            "channel": range(self.channels),
+            "sample": signed(24),
+            "enable": 1,
+            "pointer": self._pointer_bits,
+        })
+        read = Signal(item_layout)
+        m.d.sync += [
+            read.valid.eq(self.valid),
+            read.channel.eq(self.channel),
+            read.sample.eq(self.sample),
+        ]
+
+        # Write the sample to the channel's buffer and advance its
+        # pointer.  With decimate, only samples at odd positions are
+        # filtered.
+        history_write = self._history_write
+        pointer = pointer_read.data
+        m.d.comb += [
+            history_write.addr.eq(Cat(pointer, read.channel)),
+            history_write.data.eq(read.sample),
+            history_write.en.eq(read.valid),
+            pointer_write.addr.eq(read.channel),
+            pointer_write.data.eq(pointer + 1),
+            pointer_write.en.eq(read.valid),
+        ]
+        current = Signal(item_layout)
+        cycle = Signal(range(ii))
+        with m.If(read.valid):
+            m.d.sync += [
+                current.eq(read),
+                current.valid.eq(pointer[0] if self.decimate else 1),
+                current.enable.eq(config_read.data),
+                current.pointer.eq(pointer),
+                cycle.eq(0),
+            ]
+        with m.Elif(cycle == ii - 1):
+            m.d.sync += current.valid.eq(0)
+        with m.Else():
+            m.d.sync += cycle.eq(cycle + 1)
+
+        # Fetch the pairs of samples for this cycle's coefficients, and
+        # the coefficients
+        tag_layout = data.StructLayout({
+            "valid": 1,
+            "first": 1,
+            "last": 1,
+            "channel": range(self.channels),
+            "sample": signed(24),
+            "enable": 1,
+        })
+        tag = [Signal(tag_layout) for x in range(0, delay + 1)]
+        m.d.sync += [
+            tag[0].valid.eq(current.valid),
+            tag[0].first.eq(cycle == 0),
+            tag[0].last.eq(cycle == ii - 1),
+            tag[0].channel.eq(current.channel),
+            tag[0].sample.eq(current.sample),
+            tag[0].enable.eq(current.enable),
+        ]
+
+        def address(offset):
+            # Sample n - offset of the current channel
+            position = Signal(self._pointer_bits)
+            m.d.comb += position.eq(current.pointer - offset)
+            return Cat(position, current.channel)
+
+        center = self._center
+        m.d.comb += center.addr.eq(address(2*self._k - 1))
+        for i, multiplier in enumerate(self.multipliers):
+            # Coefficient j is tap D - (2j+1) and D + (2j+1), i.e.
+            # samples n - (2K-2-2j) and n - (2K+2j)
+            j = cycle*count + i
+            near = self._near[i]
+            far = self._far[i]
+            coefficient = self._coefficient_read[i]
+            m.d.comb += [
+                near.addr.eq(address(2*self._k - 2 - 2*j)),
+                far.addr.eq(address(2*self._k + 2*j)),
+                coefficient.addr.eq(cycle),
+                multiplier.a.eq(near.data + far.data),
+                multiplier.b.eq(coefficient.data),
+            ]
+
+        # The center tap and the tags wait for the products
+        center_delay = [Signal(signed(24)) for x in range(0, delay)]
+        m.d.sync += center_delay[0].eq(center.data)
+        for i in range(1, delay):
+            m.d.sync += center_delay[i].eq(center_delay[i-1])
+        for i in range(1, delay + 1):
+            m.d.sync += tag[i].eq(tag[i-1])
+
+        # Accumulate, then round and saturate the last sum
+        a = tag[-1]
+        accumulator = Signal(signed(48))
+        total = Signal(signed(48))
+        m.d.comb += total.eq(
+            Mux(a.first, center_delay[-1] << (bits - 2), accumulator)
+            + sum(x.product for x in self.multipliers))
+        with m.If(a.valid):
+            m.d.sync += accumulator.eq(total)
+
+        rounded = Signal(signed(48 - bits + 1))
+        saturated = Signal(signed(24))
+        m.d.comb += [
+            rounded.eq((total + (1 << (bits - 2))) >> (bits - 1)),
+            saturated.eq(rounded),
+        ]
+        with m.If(rounded > 2**23 - 1):
+            m.d.comb += saturated.eq(2**23 - 1)
+        with m.Elif(rounded < -2**23):
+            m.d.comb += saturated.eq(-2**23)
+        m.d.sync += [
+            self.out.eq(Mux(a.enable, saturated, a.sample)),
+            self.out_channel.eq(a.channel),
+            self.out_valid.eq(a.valid & a.last),
+        ]
+        return m
@@ -0,0 +1,62 @@
+import numpy as np
+from .halfband import halfband_coefficients
+
+# Bit-exact NumPy model of the half-band output filter
+#
+# Reproduces the samples HalfBandFilter in output_filter.py puts on out
+# for each channel, given the same input samples:  the exact sum of
+# the center tap and each coefficient times its pair of samples, in
+# units of 2^-(coefficient_bits-1), rounded half up and saturated to
+# signed 24-bit.  Samples before the first are zero, as the buffer
+# powers on cleared.
+#
+# With decimate, there is an output for the second, fourth, and so on
+# sample of each channel, the same as the filter.
+
+class HalfBandModel:
+    """Half-band filter reference model
+    channels:  Number of channels.
+    enable:  Array of (channels) flags; a disabled channel passes its
+       input through.
+    history:  The last taps-1 samples of each channel, as a
+       (taps-1, channels) array, oldest first.
+    samples:  Samples taken per channel.
+    """
+    def __init__(self, channels: int = 3, taps: int = 11,
+                 decimate: bool = False, coefficient_bits: int = 18):
+        assert (channels > 0), "channels must be greater than zero"
+        self.channels = channels
+        self.taps = taps
+        self.decimate = decimate
+        self.coefficient_bits = coefficient_bits
+        self.coefficients = halfband_coefficients(taps, coefficient_bits)
+        self.enable = np.ones(channels, dtype=bool)
+        self.history = np.zeros((taps - 1, channels), dtype=np.int64)
+        self.samples = 0
+
+    def render(self, x) -> np.ndarray:
+        """Filter a (samples, channels) array of input samples
+        Returns the outputs as a (outputs, channels) array of int64, and
+        leaves the model ready for the samples that follow.
+        """
+        x = np.asarray(x, dtype=np.int64).reshape(-1, self.channels)
+        k = len(self.coefficients)
+        bits = self.coefficient_bits
+        padded = np.concatenate([self.history, x])
+        # Output n is centered on sample n - D, which is padded row
+        # n + taps-1 - D
+        n = np.arange(0, len(x)) + self.taps - 1
+        total = padded[n - (2*k - 1)] << (bits - 2)
+        for j, c in enumerate(self.coefficients):
+            total = total + c * (padded[n - (2*k - 2 - 2*j)]
+                                 + padded[n - (2*k + 2*j)])
+        y = np.clip((total + (1 << (bits - 2))) >> (bits - 1),
+                    -2**23, 2**23 - 1)
+        y = np.where(self.enable, y, x)
+
+        if self.decimate:
+            # Odd samples, counting from the first the filter took
+            y = y[(np.arange(0, len(x)) + self.samples) % 2 == 1]
+        self.history = padded[len(padded) - (self.taps - 1):]
+        self.samples += len(x)
+        return y
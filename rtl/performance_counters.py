@@ -0,0 +1,151 @@
+from amaranth import *
+
+# Performance counters
+#
+# Optional instrumentation for the control unit.  Each unit whose
+# passes it counts has a start, a busy, and an overrun signal (see LFO
+# and ToneGenerator); every other stage of the schedule is watched
+# through a busy signal too, from pipeline_busy() for a streamed unit.
+# The sequencer marks the start of each sample period.  The counters
+# are 16-bit registers, read the same way as the LFO:  present the
+# register number on address, and its value is on data_out the next
+# cycle.  The control unit maps them into the host's register space.
+#
+#   <unit>_cycles:  Busy cycles of the unit's last completed pass, from
+#      its start until busy falls or it's started again.
+#   headroom:  Fewest cycles of any sample period on which no unit or
+#      stage is busy; schedule.headroom, if the schedule is right.
+#      Starts at the sample period, so a design that never runs reads
+#      back budget.
+#   overruns:  Update pulses given to a busy unit.
+#   dropped:  WFDR commands replaced before an update applied them.
+#   samples:  Sample periods counted.
+#
+# Counters saturate rather than wrap.  clear restarts them all.  The
+# <unit>_cycles registers come first, in the order the units are given,
+# then the rest in the order of COUNTERS.  In simulation, the control
+# unit's read_counters() reads them all back by name through its host
+# port.
+
+COUNTERS = ("headroom", "overruns", "dropped", "samples")
+
+def counter_names(units) -> list:
+    """Register names, in register order, for the given units"""
+    return [f"{unit}_cycles" for unit in units] + list(COUNTERS)
+
+def pipeline_busy(m: Module, valid, latency: int) -> Signal:
+    """Busy signal of a streamed pipeline, added to m
+    High from the cycle after an item is taken on valid until its result
+    is out, latency cycles after, as LFO and ToneGenerator busy are.
+    """
+    left = Signal(range(latency + 1))
+    with m.If(valid):
+        m.d.sync += left.eq(latency)
+    with m.Elif(left != 0):
+        m.d.sync += left.eq(left - 1)
+    busy = Signal(1)
+    m.d.comb += busy.eq(left != 0)
+    return busy
+
+class PerformanceCounters(Elaboratable):
+    """Performance counters
+    units:  Names of the units whose passes are counted.
+    budget:  Clock cycles per sample period.
+    stages:  Names of the other stages watched for headroom.
+    start, overrun:  Signal for each unit, by name, to connect to the
+       unit's update pulse and overrun.
+    busy:  Signal for each unit and stage, by name, to connect to its
+       busy signal.
+    dropped:  Strobe for each dropped command.
+    sample:  High on the first cycle of every sample period.
+    clear:  Restart every counter.
+    address:  Select the register to read.
+    data_out:  Register selected by address on the prior cycle.
+    names:  Register names, in register order.
+    """
+    def __init__(self, units, budget: int, stages=()):
+        assert (budget > 0), "budget must be greater than zero"
+        self.units = tuple(units)
+        self.stages = tuple(stages)
+        self.budget = budget
+        self.names = counter_names(self.units)
+
+        self.start = {unit: Signal(1, name=f"{unit}_start")
+                      for unit in self.units}
+        self.busy = {name: Signal(1, name=f"{name}_busy")
+                     for name in self.units + self.stages}
+        self.overrun = {unit: Signal(1, name=f"{unit}_overrun")
+                        for unit in self.units}
+        self.dropped = Signal(1)
+        self.sample = Signal(1)
+        self.clear = Signal(1)
+
+        self.address = Signal(range(len(self.names)))
+        self.data_out = Signal(16)
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        limit = 2**16 - 1
+        registers = {name: Signal(16, name=name) for name in self.names}
+        registers["headroom"] = Signal(16, name="headroom", init=self.budget)
+
+        def saturating(counter, increment):
+            with m.If(increment & (counter != limit)):
+                m.d.sync += counter.eq(counter + 1)
+
+        # Cycles per pass:  count while busy, and latch the count when
+        # busy falls, or when the unit is started again first, as it is
+        # when samples overlap
+        for unit in self.units:
+            busy = self.busy[unit]
+            count = Signal(16, name=f"{unit}_count")
+            was_busy = Signal(1, name=f"{unit}_was_busy")
+            m.d.sync += was_busy.eq(busy)
+            with m.If(self.start[unit] & busy):
+                m.d.sync += [
+                    registers[f"{unit}_cycles"].eq(count),
+                    count.eq(1),
+                ]
+            with m.Elif(busy):
+                saturating(count, 1)
+            with m.Elif(was_busy):
+                m.d.sync += [
+                    registers[f"{unit}_cycles"].eq(count),
+                    count.eq(0),
+                ]
+
+        # Headroom:  count the idle cycles of each period, and take the
+        # least count of any complete period.  The first sample strobe
+        # ends no complete period.
+        any_busy = Signal(1)
+        idle = Signal(range(self.budget + 1))
+        started = Signal(1)
+        headroom = registers["headroom"]
+        m.d.comb += any_busy.eq(Cat(self.busy.values()).any())
+        with m.If(self.sample):
+            m.d.sync += [
+                started.eq(1),
+                idle.eq(~any_busy),
+            ]
+            with m.If(started & (idle < headroom)):
+                m.d.sync += headroom.eq(idle)
+        with m.Elif(~any_busy & (idle != self.budget)):
+            m.d.sync += idle.eq(idle + 1)
+
+        saturating(registers["overruns"], Cat(self.overrun.values()).any())
+        saturating(registers["dropped"], self.dropped)
+        saturating(registers["samples"], self.sample)
+
+        with m.If(self.clear):
+            for name, register in registers.items():
+                m.d.sync += register.eq(0)
+            m.d.sync += [
+                headroom.eq(self.budget),
+                started.eq(0),
+            ]
+
+        with m.Switch(self.address):
+            for i, name in enumerate(self.names):
+                with m.Case(i):
+                    m.d.sync += self.data_out.eq(registers[name])
+        return m
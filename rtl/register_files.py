@@ -0,0 +1,120 @@
+from amaranth import *
+from amaranth.lib import data
+
+# Banked register files
+#
+# DA7-DA4 select one of up to 16 register files, each of three
+# channels (see the overview).  A build implements any subset of the
+# files, always including file zero, which holds mode select; the units
+# only store the channels of the files implemented, packed densely in
+# file order, so an unimplemented file costs no memory.
+#
+# The units' host ports take a BankAddressLayout, the file and the
+# channel within it, and a BankDecoder turns it into the dense channel.
+# Writes to a file that isn't implemented are dropped, and reads of one
+# return zero, so software finds out which files a part has by writing
+# to each and reading it back.
+#
+# When the files implemented are 0 to n-1, the dense channel is
+# 3*file + channel, a shift and an add; otherwise it's a case per
+# implemented file.
+
+FILES = 16
+CHANNELS_PER_FILE = 3
+
+BankAddressLayout = data.StructLayout({
+    "channel": 2,
+    "file": 4,
+})
+
+class RegisterFiles:
+    """The register files a build implements
+    files:  The number of files, implementing files 0 to files-1, or
+       the file numbers to implement, which must include file zero.
+    implemented:  The file numbers implemented, in order.
+    channels:  Channels stored, three per file implemented.
+    contiguous:  The files implemented are 0 to len(implemented)-1.
+    """
+    def __init__(self, files=1):
+        if isinstance(files, int):
+            files = range(0, files)
+        self.implemented = tuple(sorted(set(files)))
+        assert (0 in self.implemented), "file zero must be implemented"
+        assert (self.implemented[-1] < FILES), \
+            f"files must be between 0 and {FILES - 1}"
+        self.channels = CHANNELS_PER_FILE * len(self.implemented)
+        self.contiguous = self.implemented[-1] == len(self.implemented) - 1
+
+    def channel(self, file: int, channel: int) -> int:
+        """Dense channel of (channel) in (file), or None if it isn't
+        implemented
+        """
+        if file not in self.implemented or channel >= CHANNELS_PER_FILE:
+            return None
+        return CHANNELS_PER_FILE * self.implemented.index(file) + channel
+
+    def __repr__(self):
+        return f"RegisterFiles({self.implemented!r})"
+
+class BankDecoder(Elaboratable):
+    """Register file bank decoder
+    address:  BankAddressLayout, from the host.
+    select:  Dense channel of address, for the unit's memories, or
+       zero if it isn't implemented, so reads stay in the memory.
+    implemented:  High when address is a channel of an implemented
+       file; the unit drops writes while it's low.
+    read_data:  The unit's read data, read_latency cycles after address.
+    data_out:  read_data, or zero if the address read wasn't
+       implemented.
+    """
+    def __init__(self, files: RegisterFiles, width: int = 16,
+                 read_latency: int = 1):
+        assert (read_latency >= 0), "read_latency must not be negative"
+        self.files = files
+        self.read_latency = read_latency
+        self.address = Signal(BankAddressLayout)
+        self.select = Signal(range(files.channels))
+        self.implemented = Signal(1)
+        self.read_data = Signal(width)
+        self.data_out = Signal(width)
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        files = self.files
+        address = self.address
+        valid = address.channel < CHANNELS_PER_FILE
+
+        if files.contiguous:
+            m.d.comb += self.implemented.eq(
+                valid & (address.file < len(files.implemented)))
+            with m.If(self.implemented):
+                m.d.comb += self.select.eq((address.file << 1)
+                                           + address.file + address.channel)
+        else:
+            with m.Switch(address.file):
+                for i, file in enumerate(files.implemented):
+                    with m.Case(file):
+                        m.d.comb += self.implemented.eq(valid)
+                        with m.If(valid):
+                            m.d.comb += self.select.eq(
+                                CHANNELS_PER_FILE*i + address.channel)
+
+        # Follow the read through the unit's read port
+        implemented = self.implemented
+        for i in range(0, self.read_latency):
+            delayed = Signal(1)
+            m.d.sync += delayed.eq(implemented)
+            implemented = delayed
+        m.d.comb += self.data_out.eq(Mux(implemented, self.read_data, 0))
+        return m
+
+def decode(m: Module, decoder, address, enable) -> tuple:
+    """(channel, enable) of a unit's host port
+    A unit without register files has no decoder, and takes address and
+    enable as they are; else the decoder is added to m, and enable,
+    any width, is dropped for files that aren't implemented.
+    """
+    if decoder is None:
+        return address, enable
+    m.submodules.decoder = decoder
+    return decoder.select, Mux(decoder.implemented, enable, 0)
@@ -0,0 +1,309 @@
+from amaranth import *
+
+# Static per-sample schedule for the control unit
+#
+# Every unit the control unit drives is a pipeline, described by a
+# Stage:
+#
+#   latency:  Clock cycles from an item's start until its result is
+#      ready.
+#   interval:  Clock cycles between successive items, and from the
+#      last item of one sample to the first of the next.
+#   items:  Items per sample, usually one per channel.
+#   after:  Stages whose results this stage consumes.
+#   reads:  Stages whose results from an earlier sample this stage
+#      reads, without waiting for them.
+#
+# The schedule is computed once, at elaboration.  Stages with nothing
+# to wait for start on cycle 0.  A stage taking as many items as the
+# stage it follows is streamed:  it starts when the first result is
+# ready, and takes items no faster than they're produced, so it never
+# waits in the middle.  Otherwise it starts when the last result is
+# ready.
+#
+# The schedule is a modulo schedule:  every stage starts a new sample
+# every sample period of clock/sample_rate cycles, so a stage only has
+# to take its items, items*interval cycles, within one period.  Its
+# start may be any number of cycles into the sample, and the pipelines
+# drain while the next sample starts; a sample takes length cycles
+# from the first start to the last finish, which may be more than a
+# period.  If a stage's items don't fit in a period, Schedule raises
+# ValueError, and the design won't build.
+#
+# Because the schedule is fixed, each stage starts on the same cycle of
+# every period, its start modulo the period, and the Sequencer only
+# compares a cycle counter against constants.  minimum_clock is the
+# lowest clock the stages keep up at.
+#
+# A stage reading another's results without waiting for them sees the
+# last update written before the read, so the values are some samples
+# old; lag gives how many.  When the reads overlap the writes in the
+# period, earlier reads are a sample older than later ones.
+#
+# Given a number of multipliers, the schedule also shares a pool of
+# physical multipliers between the stages (see multiplier.py).  A stage
+# holds its multipliers from its start to its finish, inclusive, on
+# those cycles of every period, and no two stages hold one multiplier
+# on any cycle of the period.  Stages are placed in the order they're
+# declared, each after the stages it follows.  A stage that isn't
+# streamed may be started late, at the first cycle enough multipliers
+# are free for its whole window; a streamed stage can't wait, so if
+# its multipliers are taken, Schedule raises ValueError.
+
+class Stage:
+    """Pipeline stage
+    name:  Stage name, unique in its schedule.
+    latency:  Cycles from an item's start until its result is ready.
+    interval:  Cycles between successive items, and between the last
+       item of one sample and the first of the next.
+    items:  Items per sample.
+    after:  Names of the stages whose results this stage consumes.
+    reads:  Names of the stages whose results from an earlier sample
+       this stage reads.
+    multipliers:  Multipliers the stage needs from a shared pool.
+    cycles:  Cycles of each sample period the stage takes items,
+       items*interval; it keeps up if this is within the period.
+    """
+    def __init__(self, name: str, latency: int, interval: int = 1,
+                 items: int = 1, after=(), reads=(), multipliers: int = 0):
+        assert (latency >= 0), "latency must not be negative"
+        assert (interval > 0), "interval must be greater than zero"
+        assert (items > 0), "items must be greater than zero"
+        assert (multipliers >= 0), "multipliers must not be negative"
+        self.name = name
+        self.latency = latency
+        self.interval = interval
+        self.items = items
+        self.after = tuple(after)
+        self.reads = tuple(reads)
+        self.multipliers = multipliers
+        self.cycles = items*interval
+
+    def __repr__(self):
+        return (f"Stage({self.name!r}, latency={self.latency}, "
+                f"interval={self.interval}, items={self.items}, "
+                f"after={self.after!r}, reads={self.reads!r}, "
+                f"multipliers={self.multipliers})")
+
+class Schedule:
+    """Per-sample schedule
+    stages:  Stages in any order.
+    clock:  Core clock in Hz.
+    sample_rate:  Output sample rate in Hz.
+    budget:  Clock cycles per sample.
+    start, finish:  Cycle of the sample each stage starts and finishes
+       it on, by name; may be past the end of the period.
+    offset:  Cycle of the period each stage starts on, by name.
+    interval:  Cycles between items of each stage as scheduled, by name.
+    length:  Cycles from the start of a sample until every stage is
+       finished with it.
+    headroom:  Cycles of each sample period no stage is working.
+    minimum_clock:  Lowest clock, in Hz, at which every stage keeps up.
+    lag:  For each stage that reads others, by name, the samples
+       between the update it reads and its own sample, (oldest,
+       newest) over the items of a sample, by the name of the stage
+       read.
+    multipliers:  Physical multipliers shared between the stages, or
+       None if each stage has its own.
+    multiplier:  Indices of the physical multipliers each stage holds,
+       by name.
+    """
+    def __init__(self, stages, clock: int, sample_rate: int = 96000,
+                 multipliers: int = None):
+        self.stages = {}
+        for stage in stages:
+            assert (stage.name not in self.stages), \
+                f"stage {stage.name!r} declared twice"
+            self.stages[stage.name] = stage
+        self.clock = clock
+        self.sample_rate = sample_rate
+        self.budget = clock // sample_rate
+        self.multipliers = multipliers
+
+        self.start = {}
+        self.finish = {}
+        self.interval = {}
+        self.multiplier = {}
+        # Each stage takes its items within one period
+        self.minimum_clock = max(
+            (s.cycles for s in self.stages.values()),
+            default=0) * sample_rate
+        for stage in self.stages.values():
+            if stage.cycles > self.budget:
+                raise ValueError(
+                    f"stage {stage.name!r} takes {stage.items} items "
+                    f"every {stage.interval} cycles, but {clock}Hz at "
+                    f"{sample_rate}Hz gives {self.budget} cycles per "
+                    f"sample; the clock must be at least "
+                    f"{self.minimum_clock}Hz")
+        # Windows each physical multiplier is held for
+        self._held = [[] for x in range(0, multipliers or 0)]
+        for name in self.stages:
+            self._place(name, ())
+        self.offset = {name: start % self.budget
+                       for name, start in self.start.items()}
+        self.length = max(self.finish.values(), default=0)
+
+        # Cycles of the period any stage is working
+        working = set()
+        for name in self.stages:
+            for cycle in range(self.start[name], min(
+                    self.finish[name], self.start[name] + self.budget)):
+                working.add(cycle % self.budget)
+        self.headroom = self.budget - len(working)
+
+        self.lag = {}
+        for name, stage in self.stages.items():
+            for read in stage.reads:
+                assert (read in self.stages), \
+                    f"stage {name!r} reads unknown stage {read!r}"
+                self.lag.setdefault(name, {})[read] = self._lag(name, read)
+
+    def _place(self, name: str, path: tuple):
+        if name in self.start:
+            return
+        assert (name not in path), \
+            f"stages depend on each other: {' -> '.join(path + (name,))}"
+        stage = self.stages[name]
+        start = 0
+        interval = stage.interval
+        streamed = False
+        for before in stage.after:
+            assert (before in self.stages), \
+                f"stage {name!r} follows unknown stage {before!r}"
+            self._place(before, path + (name,))
+            producer = self.stages[before]
+            if producer.items == stage.items:
+                # Streamed
+                start = max(start, self.start[before] + producer.latency)
+                interval = max(interval, self.interval[before])
+                streamed = True
+            else:
+                start = max(start, self.finish[before])
+        duration = (stage.items - 1)*interval + stage.latency
+        if self.multipliers is not None:
+            start = self._assign(name, start, duration, streamed)
+        self.start[name] = start
+        self.interval[name] = interval
+        self.finish[name] = start + duration
+
+    def _lag(self, name: str, read: str) -> tuple:
+        # Items are read as they start.  The update a read at (cycle) of
+        # sample 0 sees is the last to finish before it, from
+        # -floor((cycle - finish - 1)/budget) samples before; the last
+        # read may see the update after, if it has started writing.
+        budget = self.budget
+        first = self.start[name]
+        last = first + (self.stages[name].items - 1)*self.interval[name]
+        oldest = -((first - self.finish[read] - 1) // budget)
+        newest = -((last - self.start[read]) // budget)
+        return oldest, min(oldest, newest)
+
+    def _overlap(self, a: tuple, b: tuple) -> bool:
+        # Whether cycles a and b, each (first, last) inclusive, meet on
+        # any cycle of the period
+        budget = self.budget
+        (a0, a1), (b0, b1) = a, b
+        if a1 - a0 + 1 >= budget or b1 - b0 + 1 >= budget:
+            return True
+        # Move b to start within the period from a0
+        shift = (b0 - a0) // budget * budget
+        b0, b1 = b0 - shift, b1 - shift
+        return b0 <= a1 or b1 - budget >= a0
+
+    def _free(self, start: int, finish: int) -> list:
+        # Physical multipliers not held at any cycle of [start, finish]
+        # in the period
+        return [i for i, held in enumerate(self._held)
+                if not any(self._overlap((start, finish), window)
+                           for window in held)]
+
+    def _assign(self, name: str, ready: int, duration: int,
+                streamed: bool) -> int:
+        # Take the stage's multipliers at the first cycle from ready
+        # that has enough of them free, and return that cycle
+        needed = self.stages[name].multipliers
+        if needed > self.multipliers:
+            raise ValueError(
+                f"stage {name!r} needs {needed} multipliers, but only "
+                f"{self.multipliers} are shared")
+        # The stage can only start on time, or when a window ends,
+        # within a period of ready
+        candidates = [ready]
+        if not streamed:
+            candidates += sorted({ready + (f + 1 - ready) % self.budget
+                                  for held in self._held
+                                  for s, f in held})
+        for start in candidates:
+            free = self._free(start, start + duration)
+            if len(free) >= needed:
+                self.multiplier[name] = free[:needed]
+                for i in free[:needed]:
+                    self._held[i].append((start, start + duration))
+                return start
+        if not streamed:
+            raise ValueError(
+                f"stage {name!r} needs {needed} multipliers for "
+                f"{duration + 1} cycles, but no cycle of the period has "
+                f"them free that long\n" + self.describe())
+        raise ValueError(
+            f"stage {name!r} is streamed from cycle {ready}, but only "
+            f"{len(self._free(ready, ready + duration))} of its {needed} "
+            f"multipliers are free\n" + self.describe())
+
+    def describe(self) -> str:
+        """The schedule as a table, one stage per line"""
+        lines = [f"{'stage':16} {'start':>6} {'finish':>6} {'offset':>6}"]
+        # Stages placed so far, if the schedule failed part way
+        for name in sorted(self.start, key=lambda n: (self.start[n], n)):
+            line = (f"{name:16} {self.start[name]:>6} "
+                    f"{self.finish[name]:>6} "
+                    f"{self.start[name] % self.budget:>6}")
+            if self.multiplier.get(name):
+                line += "  multipliers " + ", ".join(
+                    str(i) for i in self.multiplier[name])
+            lines.append(line)
+        lines.append(f"{'budget':16} {'':>6} {self.budget:>6}")
+        return "\n".join(lines)
+
+    def window(self, name: str, cycle: Value) -> Value:
+        """High on the cycles of the period that stage (name) holds its
+        multipliers, given the cycle within the period
+        """
+        first = self.start[name] % self.budget
+        last = first + self.finish[name] - self.start[name]
+        if last >= first + self.budget - 1:
+            return C(1)
+        if last < self.budget:
+            return (cycle >= first) & (cycle <= last)
+        return (cycle >= first) | (cycle <= last - self.budget)
+
+class Sequencer(Elaboratable):
+    """Sample sequencer
+    Counts through one sample period and starts each stage on its
+    scheduled cycle of the period.
+    sample:  High on the first cycle of every sample period.
+    cycle:  Clock cycle within the sample period.
+    start:  Signal for each stage, by name, high for the one cycle the
+       stage starts on.
+    """
+    def __init__(self, schedule: Schedule):
+        self.schedule = schedule
+        self.sample = Signal(1)
+        self.cycle = Signal(range(schedule.budget))
+        self.start = {name: Signal(1, name=f"start_{name}")
+                      for name in schedule.stages}
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        budget = self.schedule.budget
+
+        with m.If(self.cycle == budget - 1):
+            m.d.sync += self.cycle.eq(0)
+        with m.Else():
+            m.d.sync += self.cycle.eq(self.cycle + 1)
+
+        m.d.comb += self.sample.eq(self.cycle == 0)
+        for name, start in self.start.items():
+            m.d.comb += start.eq(self.cycle == self.schedule.offset[name])
+        return m
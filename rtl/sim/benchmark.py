@@ -0,0 +1,354 @@
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import time
+from amaranth.hdl import Fragment
+from amaranth.back import rtlil, verilog
+from ..generators.lfo import LFO
+from ..generators.tone_generator import ToneGenerator
+from ..svf import StateVariableFilter
+from ..bitcrusher import Bitcrusher
+from ..output_filter import HalfBandFilter
+from ..control_unit import ControlUnit, read_counters
+from ..synth.resources import cell_counts
+from .simulator import Simulator, design_ports
+
+# Elaboration and simulation benchmarks for the RTL generators
+#
+#   python -m rtl.sim.benchmark -o results.json
+#   python -m rtl.sim.benchmark -o new.json --compare results.json
+#
+# Each generator is built over a parameter grid, and for each build
+# this records:
+#
+#   elaborate:  Seconds to elaborate the design.
+#   rtlil, verilog:  Seconds to emit RTLIL and Verilog.  Verilog needs
+#      Yosys; it's null if Yosys isn't found.
+#   lut, ff:  LUT4 and flip-flop counts after Yosys synth_ecp5, null
+#      if Yosys isn't found.  A register file that isn't mapped to RAM
+#      shows up here, whether as muxes indexing it or as flip-flops
+#      holding a memory Yosys mapped to them.
+#   ff_memories:  The memories Yosys mapped to flip-flops.
+#   cycles_per_second:  Simulated clock cycles per wall second for each
+#      backend, running a workload that keeps the generator busy.
+#   counters:  For the control unit, its performance counters at the end
+#      of the workload, for each backend.
+#
+# Three kinds of regression are flagged, and the exit status is 1 if
+# there are any:
+#
+#   Scaling:  lut or ff grows more than --scaling times from the
+#      smallest to the largest size in a sweep.  Storage belongs in
+#      RAM, so logic should stay nearly flat as count/channels grow;
+#      distributed RAM deeper than 16 still adds read muxes, which is
+#      why the LFO's LUTs double from 3 to 48.
+#   Overrun:  The control unit's counters show an overrun or a dropped
+#      command; the schedule is wrong.
+#   Slowdown:  With --compare, any time more than --tolerance slower,
+#      or any lut or ff larger, than the same build in the old results.
+
+# Generator, size parameter, and the parameter grid
+GENERATORS = {
+    "LFO": (LFO, "count", {
+        "count": [3, 12, 48],
+        "multiplier_delay": [1, 3],
+    }),
+    "ToneGenerator": (ToneGenerator, "channels", {
+        "channels": [3, 12, 48],
+        "multiplier_delay": [1, 3],
+    }),
+    "StateVariableFilter": (StateVariableFilter, "channels", {
+        "channels": [3, 12, 48],
+        "multiplier_delay": [1, 3],
+    }),
+    "Bitcrusher": (Bitcrusher, "channels", {
+        "channels": [3, 12, 48],
+    }),
+    "HalfBandFilter": (HalfBandFilter, "channels", {
+        "channels": [3, 12, 48],
+        "multipliers": [1, 2],
+    }),
+    "ControlUnit": (ControlUnit, "files", {
+        "files": [1, 4, 16],
+        "counters": [True],
+    }),
+}
+
+##############
+# Workloads  #
+##############
+# Each returns a testbench running for at least (cycles) cycles, which
+# may leave what it measures in report.
+
+def _lfo_workload(dut, cycles, report):
+    async def testbench(ctx):
+        for i in range(0, dut.count):
+            ctx.set(dut.address, i)
+            ctx.set(dut.data_in, 97*i + 1)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        for i in range(0, cycles // (dut.update_cycles + 1) + 1):
+            ctx.set(dut.update, 1)
+            await ctx.tick()
+            ctx.set(dut.update, 0)
+            await ctx.tick().repeat(dut.update_cycles)
+    return testbench
+
+def _tone_workload(dut, cycles, report):
+    async def testbench(ctx):
+        for i in range(0, dut._channels):
+            ctx.set(dut.channel_select, i)
+            ctx.set(dut.enable, 0b11)
+            ctx.set(dut.waveform, i % 3)
+            ctx.set(dut.duty_cycle, 64)
+            ctx.set(dut.phase_increment, 5000*i + 1000)
+            ctx.set(dut.wr, 0b1001111)
+            await ctx.tick()
+        ctx.set(dut.wr, 0)
+        for i in range(0, cycles // dut.sample_cycles + 1):
+            ctx.set(dut.update, 1)
+            await ctx.tick()
+            ctx.set(dut.update, 0)
+            await ctx.tick().repeat(dut.sample_cycles - 1)
+    return testbench
+
+def _bitcrusher_workload(dut, cycles, report):
+    async def testbench(ctx):
+        ctx.set(dut.crush, 8)
+        ctx.set(dut.compensate, 1)
+        ctx.set(dut.write_enable, 1)
+        await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        ctx.set(dut.valid, 1)
+        for i in range(0, cycles):
+            ctx.set(dut.sample, (i * 7919) % 2**23)
+            ctx.set(dut.channel, i % dut.channels)
+            await ctx.tick()
+    return testbench
+
+def _svf_workload(dut, cycles, report):
+    async def testbench(ctx):
+        for i in range(0, dut.channels):
+            ctx.set(dut.channel_select, i)
+            ctx.set(dut.f, 4000 + 1000*i)
+            ctx.set(dut.q, 20000)
+            ctx.set(dut.mode, i % 4)
+            ctx.set(dut.enable, 1)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        for i in range(0, cycles // dut.initiation_interval):
+            ctx.set(dut.sample, (i * 7919) % 2**23)
+            ctx.set(dut.channel, i % dut.channels)
+            ctx.set(dut.valid, 1)
+            await ctx.tick()
+            ctx.set(dut.valid, 0)
+            await ctx.tick().repeat(dut.initiation_interval - 1)
+    return testbench
+
+def _output_filter_workload(dut, cycles, report):
+    async def testbench(ctx):
+        for i in range(0, dut.channels):
+            ctx.set(dut.channel_select, i)
+            ctx.set(dut.enable, 1)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        for i in range(0, cycles // dut.initiation_interval):
+            ctx.set(dut.sample, (i * 7919) % 2**23)
+            ctx.set(dut.channel, i % dut.channels)
+            ctx.set(dut.valid, 1)
+            await ctx.tick()
+            ctx.set(dut.valid, 0)
+            for j in range(1, dut.initiation_interval):
+                await ctx.tick()
+    return testbench
+
+def _control_unit_workload(dut, cycles, report):
+    # Free running; the sequencer drives everything
+    async def testbench(ctx):
+        await ctx.tick().repeat(cycles)
+        report.update(await read_counters(ctx, dut))
+    return testbench
+
+WORKLOADS = {
+    "LFO": _lfo_workload,
+    "ToneGenerator": _tone_workload,
+    "StateVariableFilter": _svf_workload,
+    "Bitcrusher": _bitcrusher_workload,
+    "HalfBandFilter": _output_filter_workload,
+    "ControlUnit": _control_unit_workload,
+}
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def _simulate(name, params, backend, cycles, report):
+    cls = GENERATORS[name][0]
+    dut = cls(**params)
+    sim = Simulator(dut, backend)
+    sim.add_clock(1e-6)
+    sim.add_testbench(WORKLOADS[name](dut, cycles, report))
+    seconds, _ = _timed(sim.run)
+    return cycles / seconds
+
+def benchmark(name: str, params: dict, backends=("pysim",),
+              cycles: int = 2000) -> dict:
+    """Benchmark one build of one generator"""
+    cls = GENERATORS[name][0]
+    result = {"generator": name, "params": params}
+
+    dut = cls(**params)
+    result["elaborate"], _ = _timed(lambda: Fragment.get(dut, None))
+
+    dut = cls(**params)
+    result["rtlil"], _ = _timed(
+        lambda: rtlil.convert(dut, ports=design_ports(dut)))
+
+    dut = cls(**params)
+    try:
+        cells = cell_counts(dut)
+    except (RuntimeError, OSError, subprocess.CalledProcessError):
+        cells = {"lut": None, "ff": None, "ff_memories": None}
+    for metric in ("lut", "ff", "ff_memories"):
+        result[metric] = cells[metric]
+
+    dut = cls(**params)
+    try:
+        result["verilog"], _ = _timed(
+            lambda: verilog.convert(dut, ports=design_ports(dut)))
+    except Exception:
+        result["verilog"] = None
+
+    result["cycles_per_second"] = {}
+    result["counters"] = {}
+    for backend in backends:
+        report = {}
+        result["cycles_per_second"][backend] = _simulate(
+            name, params, backend, cycles, report)
+        if report:
+            result["counters"][backend] = report
+    return result
+
+def sweep(generators=None, backends=("pysim",), cycles: int = 2000) -> list:
+    """Benchmark every build in the parameter grid"""
+    results = []
+    for name in generators or GENERATORS:
+        cls, size, grid = GENERATORS[name]
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            params = dict(zip(keys, values))
+            print(f"{name} {params}", file=sys.stderr)
+            results.append(benchmark(name, params, backends, cycles))
+    return results
+
+def _key(result) -> tuple:
+    return (result["generator"], tuple(sorted(result["params"].items())))
+
+def regressions(results: list, baseline: list = None,
+                scaling: float = 2.5, tolerance: float = 0.5) -> list:
+    """Describe every regression in results"""
+    found = []
+
+    # Scaling within each sweep, other parameters held fixed
+    groups = {}
+    for r in results:
+        size = GENERATORS[r["generator"]][1]
+        rest = tuple(sorted((k, v) for k, v in r["params"].items()
+                            if k != size))
+        groups.setdefault((r["generator"], size, rest), []).append(r)
+    for (name, size, rest), group in groups.items():
+        group.sort(key=lambda r: r["params"][size])
+        small, large = group[0], group[-1]
+        if small is large:
+            continue
+        for metric in ("lut", "ff"):
+            if small[metric] is None or large[metric] is None:
+                continue
+            if large[metric] > scaling * max(small[metric], 1):
+                found.append(
+                    f"{name} {dict(rest)}: {metric} grows from "
+                    f"{small[metric]} at {size}={small['params'][size]} to "
+                    f"{large[metric]} at {size}={large['params'][size]}")
+
+    # Overruns
+    for r in results:
+        for backend, counters in r.get("counters", {}).items():
+            if counters["overruns"] or counters["dropped"]:
+                found.append(
+                    f"{r['generator']} {r['params']}: {backend} counted "
+                    f"{counters['overruns']} overruns and "
+                    f"{counters['dropped']} dropped commands")
+
+    # Slowdowns against the old results
+    old = {_key(r): r for r in baseline or []}
+    for r in results:
+        b = old.get(_key(r))
+        if b is None:
+            continue
+        label = f"{r['generator']} {r['params']}"
+        for metric in ("elaborate", "rtlil", "verilog"):
+            if r.get(metric) and b.get(metric) and \
+                    r[metric] > b[metric] * (1 + tolerance):
+                found.append(f"{label}: {metric} {b[metric]:.3f}s -> "
+                             f"{r[metric]:.3f}s")
+        for metric in ("lut", "ff"):
+            if r.get(metric) is not None and b.get(metric) is not None \
+                    and r[metric] > b[metric]:
+                found.append(f"{label}: {metric} {b[metric]} -> "
+                             f"{r[metric]}")
+        for backend, speed in r["cycles_per_second"].items():
+            before = b["cycles_per_second"].get(backend)
+            if before and speed * (1 + tolerance) < before:
+                found.append(f"{label}: {backend} {before:.0f} -> "
+                             f"{speed:.0f} cycles/s")
+    return found
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark elaboration and simulation of the RTL")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument("-g", "--generator", action="append",
+                        choices=list(GENERATORS))
+    parser.add_argument("-b", "--backend", action="append",
+                        choices=["pysim", "cxxrtl"])
+    parser.add_argument("--cycles", type=int, default=2000)
+    parser.add_argument("--scaling", type=float, default=2.5)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = sweep(args.generator, args.backend or ["pysim"], args.cycles)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+
+    report = {"commit": _commit(), "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    found = regressions(results, baseline, args.scaling, args.tolerance)
+    for line in found:
+        print(f"REGRESSION: {line}", file=sys.stderr)
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
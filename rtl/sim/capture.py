@@ -0,0 +1,277 @@
+import argparse
+import sys
+import wave
+import numpy as np
+from ..generators.lfo import LFO
+from ..generators.lfo_model import LFOModel
+from .simulator import Simulator, BACKENDS
+
+# Streaming sample capture
+#
+#   python -m rtl.sim.capture --count 3 --samples 96000 -o lfo.wav --check
+#
+# A render is a pipeline of async generators inside a testbench:
+#
+#   frames:  One frame per sample, an array with one entry per channel,
+#      from a sample stream (channel_frames) or by reading a register
+#      file through its address port (register_frames, lfo_frames).
+#   capture():  Gathers frames into blocks of (chunk) frames and writes
+#      each block to every sink.
+#
+# Sinks take blocks as they're made and keep nothing once a block is
+# written, so memory stays flat however long the render:
+#
+#   WavWriter:  PCM WAV, 16 or 24 bits, through the wave module.
+#   MemmapWriter:  A .npy file of known length, through a memory map.
+#   ReferenceCheck:  Compares each block against the same samples from
+#      a reference model, pulled a block at a time, and keeps only the
+#      first divergence.
+#
+# Every sink has write(block) and close(); capture() closes them when
+# the render ends, or fails.
+
+class WavWriter:
+    """PCM WAV sink
+    path:  File to write.
+    channels:  Samples per frame.
+    bits:  16 or 24; samples are written as the low (bits) bits, so
+       unsigned and signed values of that width come out the same.
+    """
+    def __init__(self, path: str, channels: int, sample_rate: int = 96000,
+                 bits: int = 24):
+        assert (bits in (16, 24)), "bits must be 16 or 24"
+        self.bits = bits
+        self._file = wave.open(path, "wb")
+        self._file.setnchannels(channels)
+        self._file.setsampwidth(bits // 8)
+        self._file.setframerate(sample_rate)
+
+    def write(self, block: np.ndarray):
+        # Little-endian, keeping the low bytes of each 32-bit sample
+        samples = (np.asarray(block, dtype=np.int64)
+                   & ((1 << self.bits) - 1)).astype("<u4")
+        data = samples.view(np.uint8).reshape(-1, 4)[:, :self.bits // 8]
+        self._file.writeframes(data.tobytes())
+
+    def close(self):
+        self._file.close()
+
+class MemmapWriter:
+    """NumPy .npy sink
+    path:  File to write, a (samples, channels) array of dtype.
+    Frames not written are left zero.  Each block is flushed to the
+    file as it's written.
+    """
+    def __init__(self, path: str, samples: int, channels: int,
+                 dtype=np.int32):
+        self._array = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(samples, channels))
+        self.samples = 0
+
+    def write(self, block: np.ndarray):
+        end = self.samples + len(block)
+        if end > len(self._array):
+            raise ValueError(f"{end} samples written to a file of "
+                             f"{len(self._array)}")
+        self._array[self.samples:end] = block
+        self._array.flush()
+        self.samples = end
+
+    def close(self):
+        self._array.flush()
+        del self._array
+
+class ReferenceCheck:
+    """Reference model comparison sink
+    reference:  Iterable of blocks of expected frames, of any length,
+       e.g. model_blocks(model.render).
+    samples:  Frames compared so far.
+    divergence:  None, or the first frame that differs, as a dict of
+       sample, channel, got, and expected.
+    """
+    def __init__(self, reference):
+        self._reference = iter(reference)
+        self._expected = np.empty((0, 0), dtype=np.int64)
+        self.samples = 0
+        self.divergence = None
+
+    def _take(self, count: int) -> np.ndarray:
+        # The next (count) expected frames, drawing blocks as needed
+        parts = []
+        while count > 0:
+            if len(self._expected) == 0:
+                self._expected = np.asarray(next(self._reference),
+                                            dtype=np.int64)
+            parts.append(self._expected[:count])
+            count -= len(parts[-1])
+            self._expected = self._expected[len(parts[-1]):]
+        return np.concatenate(parts)
+
+    def write(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.int64)
+        if self.divergence is None:
+            expected = self._take(len(block))
+            differs = np.argwhere(block != expected)
+            if len(differs):
+                row, channel = differs[0]
+                self.divergence = {
+                    "sample": self.samples + int(row),
+                    "channel": int(channel),
+                    "got": int(block[row, channel]),
+                    "expected": int(expected[row, channel]),
+                }
+        self.samples += len(block)
+
+    def close(self):
+        pass
+
+def model_blocks(render, chunk: int = 4096):
+    """Blocks from a model's render(samples), forever"""
+    while True:
+        yield render(chunk)
+
+async def channel_frames(ctx, data, channel, valid, channels: int):
+    """Frames from a sample stream
+    Takes data for channel on every cycle valid is high, and yields a
+    frame after each sample for the last channel.
+    """
+    frame = np.zeros(channels, dtype=np.int64)
+    while True:
+        # Taken at the edge that sees valid, before the next sample
+        # replaces them
+        c, value = await ctx.tick().sample(channel, data).until(valid)
+        frame[c] = value
+        if c == channels - 1:
+            yield frame.copy()
+
+async def register_frames(ctx, strobe, address, data, count: int):
+    """Frames read from a register file
+    After each cycle strobe is high, reads data for addresses 0 to
+    count-1, one per cycle, for read ports that register the address.
+    """
+    while True:
+        await ctx.tick().until(strobe)
+        yield await read_registers(ctx, address, data, count)
+
+async def read_registers(ctx, address, data, count: int) -> np.ndarray:
+    frame = np.empty(count, dtype=np.int64)
+    for i in range(0, count):
+        ctx.set(address, i)
+        await ctx.tick()
+        frame[i] = ctx.get(data)
+    return frame
+
+async def lfo_frames(ctx, lfo):
+    """Frames of every oscillator's data_out, updating the LFO for each"""
+    while True:
+        ctx.set(lfo.update, 1)
+        await ctx.tick()
+        ctx.set(lfo.update, 0)
+        await ctx.tick().repeat(lfo.update_cycles)
+        yield await read_registers(ctx, lfo.address, lfo.data_out, lfo.count)
+
+async def capture(frames, sinks, samples: int, chunk: int = 4096) -> int:
+    """Write (samples) frames to every sink, a block at a time
+    Returns the number of frames captured, which is less than samples
+    only if frames runs out.  Closes every sink.
+    """
+    block = None
+    taken = 0
+    filled = 0
+    try:
+        if samples <= 0:
+            return 0
+        async for frame in frames:
+            if block is None:
+                block = np.empty((chunk, len(frame)), dtype=np.int64)
+            block[filled] = frame
+            filled += 1
+            taken += 1
+            if filled == chunk or taken == samples:
+                for sink in sinks:
+                    sink.write(block[:filled])
+                filled = 0
+            if taken == samples:
+                break
+        if filled:
+            for sink in sinks:
+                sink.write(block[:filled])
+    finally:
+        await frames.aclose()
+        for sink in sinks:
+            sink.close()
+    return taken
+
+def _lfo_writes(model, seed: int) -> list:
+    # Random phase increments and waveforms, each reset, written to
+    # the model and returned as (address, write_select, data_in,
+    # write_mask) for the LFO
+    rng = np.random.default_rng(seed)
+    writes = []
+    for i in range(0, model.count):
+        increment = int(rng.integers(1, 2**12))
+        waveform = int(rng.integers(0, 4))
+        direction = int(rng.integers(0, 2))
+        wfdr = (waveform << 2) | (direction << 1) | 1
+        model.write_phase_increment(i, increment)
+        model.write_wfdr(i, wfdr, 0b1111)
+        writes += [(i, 0, increment, 0), (i, 1, wfdr, 0b1111)]
+    return writes
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render the LFO bank to WAV or .npy, streaming")
+    parser.add_argument("--count", type=int, default=3,
+                        help="oscillators (default 3)")
+    parser.add_argument("--samples", type=int, default=96000)
+    parser.add_argument("-o", "--output", help="WAV file to write")
+    parser.add_argument("--npy", help=".npy file to write")
+    parser.add_argument("--check", action="store_true",
+                        help="compare against LFOModel")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default=None)
+    parser.add_argument("--chunk", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lfo = LFO(args.count)
+    model = LFOModel(args.count)
+    writes = _lfo_writes(model, args.seed)
+    sinks = []
+    if args.output:
+        sinks.append(WavWriter(args.output, args.count, bits=16))
+    if args.npy:
+        sinks.append(MemmapWriter(args.npy, args.samples, args.count,
+                                  np.uint16))
+    check = None
+    if args.check:
+        check = ReferenceCheck(model_blocks(model.render, args.chunk))
+        sinks.append(check)
+
+    result = {}
+    async def testbench(ctx):
+        for address, select, value, mask in writes:
+            ctx.set(lfo.address, address)
+            ctx.set(lfo.write_select, select)
+            ctx.set(lfo.data_in, value)
+            ctx.set(lfo.write_mask, mask)
+            ctx.set(lfo.write_enable, 1)
+            await ctx.tick()
+        ctx.set(lfo.write_enable, 0)
+        result["samples"] = await capture(lfo_frames(ctx, lfo), sinks,
+                                          args.samples, args.chunk)
+
+    sim = Simulator(lfo, args.backend)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    print(f"{result['samples']} samples", file=sys.stderr)
+    if check is not None:
+        if check.divergence is not None:
+            print(f"diverges from LFOModel: {check.divergence}",
+                  file=sys.stderr)
+            sys.exit(1)
+        print(f"matches LFOModel for {check.samples} samples",
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
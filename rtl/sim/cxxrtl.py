@@ -0,0 +1,441 @@
+import ctypes
+import hashlib
+import operator
+import os
+import shutil
+import subprocess
+import tempfile
+from amaranth.back import rtlil
+from amaranth.hdl import Const, ShapeCastable, Value, ValueCastable
+# Amaranth doesn't export its expression nodes
+from amaranth.hdl._ast import Operator, Slice
+from ..generators.wavetable import cache_dir
+
+# Compiled simulation through Yosys CXXRTL
+#
+# The design is converted to RTLIL, lowered to C++ by write_cxxrtl,
+# and compiled into a shared library together with the CXXRTL C API.
+# The library is cached by the hash of the RTLIL, so a design is only
+# compiled once.
+#
+# CxxrtlSimulator runs the same testbenches as the Amaranth Python
+# simulator:
+#
+#   sim = CxxrtlSimulator(dut)
+#   sim.add_clock(1e-6)
+#   sim.add_testbench(testbench)
+#   sim.run()
+#
+# where testbench is an async function taking ctx.  The testbenches run
+# concurrently, as on pysim, and these work the same way:
+#
+#   ctx.get(), ctx.set():  On ports, views of ports such as
+#      Signal(layout), and slices of them, returning and taking the
+#      same values as pysim.  ctx.get() also evaluates constants and
+#      the arithmetic, logic, and comparison operators on them.
+#   await ctx.tick():  Returns (clk_edge, rst_active, *values), for
+#      ctx.tick().sample(*values) sampled just before the edge.
+#   await ctx.tick().repeat(n), await ctx.tick().until(condition):
+#      Return the values sampled at the last edge; the condition too is
+#      sampled just before each edge.
+#   async for ... in ctx.tick():  Each edge in turn.
+#   await ctx.delay(t):  Advances time by t seconds; the clock keeps
+#      running, with rising edges at period/2 + k*period.
+#
+# It differs from pysim in that:
+#
+#   Only one clock domain, sync, is simulated, and it has no reset.
+#   Only the design's ports can be read or written; any other signal,
+#      or an expression with other operators, raises KeyError.
+#   ctx.changed(), ctx.edge(), add_process(), background testbenches,
+#      and traces aren't supported, and raise AttributeError.
+#   Testbenches woken by the same edge, or the same instant, run in the
+#      order they were added.
+#
+# When every testbench is waiting out a number of ticks without
+# sampling, the ticks are run inside the library, so long renders
+# don't pay for a Python call per cycle.
+#
+# Yosys is $YOSYS, yosys, or yowasp-yosys, whichever is found first.
+# The C++ compiler is $CXX, else c++.
+
+# Steps the clock (cycles) times without returning to Python
+_SHIM = """
+#define CXXRTL_INCLUDE_CAPI_IMPL
+#include "design.cc"
+
+extern "C" void harday_cycles(cxxrtl_handle handle, cxxrtl_object *clk,
+                              size_t cycles) {
+    for (size_t i = 0; i < cycles; i++) {
+        clk->next[0] = 1;
+        cxxrtl_step(handle);
+        clk->next[0] = 0;
+        cxxrtl_step(handle);
+    }
+}
+"""
+
+class _CxxrtlObject(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("width", ctypes.c_size_t),
+        ("lsb_at", ctypes.c_size_t),
+        ("depth", ctypes.c_size_t),
+        ("zero_at", ctypes.c_size_t),
+        ("curr", ctypes.POINTER(ctypes.c_uint32)),
+        ("next", ctypes.POINTER(ctypes.c_uint32)),
+        ("outline", ctypes.c_void_p),
+        ("attrs", ctypes.c_void_p),
+    ]
+
+def _yosys() -> str:
+    for name in (os.environ.get("YOSYS"), "yosys", "yowasp-yosys"):
+        if name and shutil.which(name):
+            return name
+    raise RuntimeError("Yosys not found; install yosys or yowasp-yosys")
+
+def _runtime_include(yosys: str) -> str:
+    # Native Yosys knows its data directory; YoWASP ships it in the
+    # Python package
+    if yosys != "yowasp-yosys" and shutil.which("yosys-config"):
+        datdir = subprocess.run(["yosys-config", "--datdir"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    else:
+        import yowasp_yosys
+        datdir = os.path.join(os.path.dirname(yowasp_yosys.__file__), "share")
+    return os.path.join(datdir, "include", "backends", "cxxrtl", "runtime")
+
+def compile_design(design: str) -> str:
+    """Compile RTLIL text to a CXXRTL shared library, returning its path"""
+    key = hashlib.sha256(design.encode()).hexdigest()[:16]
+    library = os.path.join(cache_dir(), "cxxrtl", f"{key}.so")
+    if os.path.exists(library):
+        return library
+
+    yosys = _yosys()
+    with tempfile.TemporaryDirectory() as build:
+        with open(os.path.join(build, "design.il"), "w") as file:
+            file.write(design)
+        with open(os.path.join(build, "shim.cc"), "w") as file:
+            file.write(_SHIM)
+        subprocess.run([yosys, "-q", "-p",
+                        "read_rtlil design.il; write_cxxrtl design.cc"],
+                       cwd=build, check=True)
+        subprocess.run([os.environ.get("CXX", "c++"), "-std=c++14", "-O2",
+                        "-shared", "-fPIC", "-I", _runtime_include(yosys),
+                        "-o", "design.so", "shim.cc"],
+                       cwd=build, check=True)
+        os.makedirs(os.path.dirname(library), exist_ok=True)
+        temp = "{}.{}.tmp".format(library, os.getpid())
+        shutil.copyfile(os.path.join(build, "design.so"), temp)
+        os.replace(temp, library)
+    return library
+
+class _Tick:
+    def __init__(self, count: int = 1, until=None, sampled=(),
+                 bare: bool = True):
+        self.count = count
+        self._until = until
+        self._sampled = sampled
+        # Awaited as is, returning (clk_edge, rst_active, *values)
+        self._bare = bare
+
+    def sample(self, *signals):
+        return _Tick(self.count, self._until, self._sampled + signals,
+                     self._bare)
+
+    def repeat(self, count: int):
+        count = operator.index(count)
+        if count <= 0:
+            raise ValueError(
+                f"Repeat count must be a positive integer, not {count!r}")
+        return _Tick(self.count * count, None, self._sampled, False)
+
+    def until(self, condition):
+        return _Tick(1, condition, self._sampled, False)
+
+    def __await__(self):
+        return (yield self)
+
+    async def __aiter__(self):
+        while True:
+            yield await self
+
+class _Delay:
+    def __init__(self, interval):
+        self.interval = interval
+
+    def __await__(self):
+        return (yield self)
+
+class _Context:
+    def __init__(self, simulator):
+        self._sim = simulator
+
+    def get(self, expr):
+        value = self._sim._get(Value.cast(expr))
+        if isinstance(expr, ValueCastable):
+            shape = expr.shape()
+            if isinstance(shape, ShapeCastable):
+                return shape.from_bits(value)
+        return value
+
+    def set(self, expr, value):
+        if isinstance(expr, ValueCastable):
+            shape = expr.shape()
+            if isinstance(shape, ShapeCastable):
+                value = shape.const(value)
+        self._sim._set(Value.cast(expr), Const.cast(value).value)
+
+    def tick(self, domain: str = "sync"):
+        assert (domain == "sync"), "only the sync domain is simulated"
+        return _Tick()
+
+    def delay(self, interval):
+        return _Delay(interval)
+
+class _Testbench:
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+        self.done = False
+        # What the testbench is waiting for
+        self.tick = None
+        self.remaining = 0
+        self.deadline = None
+        self.values = ()
+        self.condition = True
+
+# Operators ctx.get() evaluates, on values already sign-extended; the
+# result is wrapped to the operator's shape
+_OPERATORS = {
+    "~": operator.invert,
+    "-": lambda a, b=None: -a if b is None else a - b,
+    "b": lambda a: int(a != 0),
+    "+": operator.add,
+    "&": operator.and_,
+    "|": operator.or_,
+    "^": operator.xor,
+    "==": lambda a, b: int(a == b),
+    "!=": lambda a, b: int(a != b),
+    "<": lambda a, b: int(a < b),
+    "<=": lambda a, b: int(a <= b),
+    ">": lambda a, b: int(a > b),
+    ">=": lambda a, b: int(a >= b),
+}
+
+def _femtoseconds(seconds) -> int:
+    return round(seconds * 1e15)
+
+class CxxrtlSimulator:
+    """CXXRTL simulator
+    dut:  Elaboratable to simulate.
+    ports:  Ports as (name, signal, direction) tuples, as for
+       rtlil.convert().  Defaults to design_ports(dut).
+    cycles:  Clock cycles simulated so far.
+    """
+    def __init__(self, dut, ports=None):
+        from .simulator import design_ports
+        if ports is None:
+            ports = design_ports(dut)
+        self._signals = {id(signal): (name, signal)
+                         for name, signal, direction in ports}
+        library = compile_design(rtlil.convert(dut, ports=ports))
+
+        self._lib = ctypes.CDLL(library)
+        self._lib.cxxrtl_design_create.restype = ctypes.c_void_p
+        self._lib.cxxrtl_create.restype = ctypes.c_void_p
+        self._lib.cxxrtl_create.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_destroy.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_step.argtypes = [ctypes.c_void_p]
+        self._lib.cxxrtl_get_parts.restype = ctypes.POINTER(_CxxrtlObject)
+        self._lib.cxxrtl_get_parts.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_size_t)]
+        self._lib.cxxrtl_outline_eval.argtypes = [ctypes.c_void_p]
+        self._lib.harday_cycles.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(_CxxrtlObject), ctypes.c_size_t]
+        self._handle = self._lib.cxxrtl_create(
+            self._lib.cxxrtl_design_create())
+
+        self._objects = {}
+        self._clk = self._object("clk")
+        self._dirty = True
+        self._testbenches = []
+        self.cycles = 0
+        # Simulated time and the next rising edge, in femtoseconds
+        self._now = 0
+        self._period = None
+        self._next_edge = None
+
+    def __del__(self):
+        if getattr(self, "_handle", None):
+            self._lib.cxxrtl_destroy(self._handle)
+
+    def _object(self, name: str):
+        parts = ctypes.c_size_t(0)
+        obj = self._lib.cxxrtl_get_parts(self._handle, name.encode(),
+                                         ctypes.byref(parts))
+        if not obj or parts.value != 1:
+            raise KeyError(f"{name} is not a port of the design")
+        return obj
+
+    def _lookup(self, signal):
+        key = id(signal)
+        if key not in self._objects:
+            if key not in self._signals:
+                raise KeyError(f"{signal!r} is not a port of the design")
+            name, signal = self._signals[key]
+            self._objects[key] = (self._object(name).contents, signal.shape())
+        return self._objects[key]
+
+    @staticmethod
+    def _read(words, width: int) -> int:
+        value = 0
+        for i in range((width + 31) // 32):
+            value |= words[i] << (32*i)
+        return value & ((1 << width) - 1)
+
+    @staticmethod
+    def _write(words, width: int, value: int):
+        for i in range((width + 31) // 32):
+            words[i] = (value >> (32*i)) & 0xffffffff
+
+    def _settle(self):
+        if self._dirty:
+            self._lib.cxxrtl_step(self._handle)
+            self._dirty = False
+
+    def _get(self, value: Value) -> int:
+        if isinstance(value, Const):
+            return value.value
+        if isinstance(value, Slice):
+            width = value.stop - value.start
+            return (self._get(value.value) >> value.start) \
+                & ((1 << width) - 1)
+        if isinstance(value, Operator) and value.operator in _OPERATORS:
+            result = _OPERATORS[value.operator](
+                *(self._get(x) for x in value.operands))
+            shape = value.shape()
+            result &= (1 << shape.width) - 1
+            if shape.signed and result >> (shape.width - 1):
+                result -= 1 << shape.width
+            return result
+        self._settle()
+        obj, shape = self._lookup(value)
+        if obj.outline:
+            self._lib.cxxrtl_outline_eval(obj.outline)
+        result = self._read(obj.curr, obj.width)
+        if shape.signed and result >> (obj.width - 1):
+            result -= 1 << obj.width
+        return result
+
+    def _set(self, value: Value, new: int):
+        start = 0
+        width = len(value)
+        while isinstance(value, Slice):
+            start += value.start
+            value = value.value
+        obj, shape = self._lookup(value)
+        mask = ((1 << width) - 1) << start
+        old = self._read(obj.next, obj.width)
+        self._write(obj.next, obj.width,
+                    (old & ~mask) | ((new << start) & mask))
+        self._dirty = True
+
+    def _tick(self, count: int):
+        # Inputs set since the last edge must be committed before the
+        # clock rises
+        self._settle()
+        self._lib.harday_cycles(self._handle, self._clk, count)
+        self.cycles += count
+
+    def add_clock(self, period, *, domain: str = "sync"):
+        assert (domain == "sync"), "only the sync domain is simulated"
+        self.period = period
+        self._period = _femtoseconds(period)
+        self._next_edge = self._now + self._period // 2
+
+    def add_testbench(self, constructor):
+        self._testbenches.append(constructor)
+
+    def _resume(self, testbench: _Testbench, value):
+        try:
+            command = testbench.coroutine.send(value)
+        except StopIteration:
+            testbench.done = True
+            return
+        testbench.tick = testbench.deadline = None
+        if isinstance(command, _Tick):
+            if self._period is None:
+                raise RuntimeError("a testbench awaits a tick, but the "
+                                   "simulation has no clock")
+            testbench.tick = command
+            testbench.remaining = command.count
+        elif isinstance(command, _Delay):
+            testbench.deadline = self._now + _femtoseconds(command.interval)
+        else:
+            raise TypeError(f"testbenches may only await ticks and delays "
+                            f"on the CXXRTL backend, not {command!r}")
+
+    def _edges(self, waiting: list, deadline) -> int:
+        # Edges to run at once:  as many as no testbench needs to see,
+        # before the next deadline
+        if any(x.tick._until is not None or x.tick._sampled
+               for x in waiting):
+            return 1
+        count = min(x.remaining for x in waiting)
+        if deadline is not None:
+            count = min(count, -(-(deadline - self._next_edge)
+                                 // self._period))
+        return count
+
+    def run(self):
+        ctx = _Context(self)
+        testbenches = [_Testbench(constructor(ctx))
+                       for constructor in self._testbenches]
+        self._testbenches = []
+        for testbench in testbenches:
+            self._resume(testbench, None)
+
+        while True:
+            active = [x for x in testbenches if not x.done]
+            if not active:
+                break
+            delays = [x.deadline for x in active if x.deadline is not None]
+            deadline = min(delays, default=None)
+            if deadline is not None and (self._period is None
+                                         or deadline <= self._next_edge):
+                self._now = deadline
+                for testbench in active:
+                    if testbench.deadline == deadline:
+                        self._resume(testbench, ())
+                continue
+
+            waiting = [x for x in active if x.tick is not None]
+            for testbench in waiting:
+                tick = testbench.tick
+                if tick._sampled or tick._until is not None:
+                    testbench.values = tuple(
+                        ctx.get(x) for x in tick._sampled)
+                    testbench.condition = (tick._until is None
+                                           or ctx.get(tick._until))
+            count = self._edges(waiting, deadline)
+            self._tick(count)
+            self._now = self._next_edge + (count - 1)*self._period
+            self._next_edge += count*self._period
+
+            for testbench in waiting:
+                tick = testbench.tick
+                if tick._until is not None:
+                    if testbench.condition:
+                        self._resume(testbench, testbench.values)
+                    continue
+                testbench.remaining -= count
+                if testbench.remaining:
+                    continue
+                if tick._bare:
+                    self._resume(testbench,
+                                 (True, False) + testbench.values)
+                else:
+                    self._resume(testbench, testbench.values)
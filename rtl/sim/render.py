@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ..generators.psg_model import PSGModel, mode_select, MODE_ENHANCED
+from .capture import WavWriter
+from .writelog import load
+
+# Offline renderer for write logs
+#
+#   python -m rtl.sim.render corpus/*.vgm corpus/*.ym -o wav/ -j 8
+#
+# Renders each tune (a write log, or a YM or VGM file; see writelog.py)
+# through PSGModel to a mono 24-bit WAV at 96kHz.  Each register file
+# of each tune is a job, so a multicore box renders many tunes at once
+# and a tune with many register files across several processes.
+#
+# A job replays the whole log:  R15 writes to file zero select the mode
+# and bank for every file, and the job's own file takes the rest.  A
+# write takes effect at the first output sample at or after it.  In
+# modes before enhanced, DA7-DA4 act as a chip select, so only file
+# zero is heard, and writes to other files are counted as ignored.
+# In a log of independent chips, as the importers make, each file is
+# heard and takes the mode selects written to its own R15.
+#
+# Between writes, the model renders a whole run of samples in closed
+# form.  Each job writes its file's channel sum to a .npy in a
+# temporary directory, and the tune's WAV is the sum of its files
+# divided by the number of files, so no tune is ever held in memory
+# whole.
+
+SAMPLE_RATE = 96000
+
+def _events(log, sample_rate: int):
+    # Output sample of each write
+    return (log.time * sample_rate) // log.rate
+
+def register_files(log) -> list:
+    """Register files a log writes to, always including file zero"""
+    return sorted({0} | set(int(x) for x in np.unique(log.address >> 4)))
+
+def render_file(log, index: int, out, sample_rate: int = SAMPLE_RATE,
+                chunk: int = 65536) -> dict:
+    """Render register file (index) of a log
+    out:  Array-like of (samples) entries to fill with the sum of the
+       file's channels; samples = log.length * sample_rate // log.rate.
+    Returns counts of the writes the file took, and ignored.
+    """
+    samples = (log.length * sample_rate) // log.rate
+    event = _events(log, sample_rate)
+    model = PSGModel()
+    # Tick of each output sample, from the master clock / 8
+    tick_rate = (log.clock, 8 * sample_rate)
+    select = (index << 4) | 15 if log.chips else 15
+    taken = 0
+    dropped = 0
+    now = 0
+    i = 0
+    while now < samples:
+        # Apply every write at or before this sample
+        while i < len(event) and event[i] <= now:
+            address = int(log.address[i])
+            value = int(log.data[i])
+            file, register = address >> 4, address & 0x0f
+            if address == select:
+                model.set_mode(*mode_select(value))
+            elif file != index:
+                pass
+            elif (index == 0 or log.chips
+                  or model.mode >= MODE_ENHANCED):
+                model.write(register, value)
+                taken += 1
+            else:
+                dropped += 1
+            i += 1
+        end = min(int(event[i]) if i < len(event) else samples,
+                  samples, now + chunk)
+        sample = np.arange(now, end, dtype=np.int64)
+        tick = (sample * tick_rate[0]) // tick_rate[1]
+        start = int(tick[0])
+        finish = (end * tick_rate[0]) // tick_rate[1]
+        out[now:end] = model.render(tick - start, finish - start).sum(axis=1)
+        now = end
+    return {"writes": taken, "ignored": model.ignored + dropped}
+
+def _job(path: str, index: int, scratch: str, sample_rate: int) -> dict:
+    log = load(path)
+    samples = (log.length * sample_rate) // log.rate
+    name = os.path.join(scratch, f"{os.getpid()}-{time.monotonic_ns()}.npy")
+    out = np.lib.format.open_memmap(name, mode="w+", dtype=np.int32,
+                                    shape=(samples,))
+    result = render_file(log, index, out, sample_rate)
+    out.flush()
+    del out
+    result["npy"] = name
+    return result
+
+def _mix(parts: list, path: str, sample_rate: int, chunk: int = 65536):
+    # Sum the files' renders into the tune's WAV
+    arrays = [np.load(x, mmap_mode="r") for x in parts]
+    samples = len(arrays[0])
+    wav = WavWriter(path, 1, sample_rate, 24)
+    try:
+        for start in range(0, samples, chunk):
+            block = sum(a[start:start + chunk].astype(np.int64)
+                        for a in arrays)
+            wav.write((block // len(arrays)).reshape(-1, 1))
+    finally:
+        wav.close()
+        del arrays
+        for x in parts:
+            os.remove(x)
+
+def render_corpus(paths, output: str, workers: int = None,
+                  sample_rate: int = SAMPLE_RATE) -> dict:
+    """Render every tune in paths to (output)/<file name>.wav
+    Returns, for each path, its write counts summed over its files.
+    """
+    os.makedirs(output, exist_ok=True)
+    jobs = {}
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch, \
+         ProcessPoolExecutor(workers) as pool:
+        for path in paths:
+            for index in register_files(load(path)):
+                jobs.setdefault(path, []).append(
+                    pool.submit(_job, path, index, scratch, sample_rate))
+        for path, futures in jobs.items():
+            parts = [x.result() for x in futures]
+            name = os.path.basename(path) + ".wav"
+            _mix([x["npy"] for x in parts], os.path.join(output, name),
+                 sample_rate)
+            results[path] = {
+                "files": len(parts),
+                "writes": sum(x["writes"] for x in parts),
+                "ignored": sum(x["ignored"] for x in parts),
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render write logs, YM, and VGM files to WAV")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-o", "--output", default=".",
+                        help="directory for the WAV files")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default one per CPU)")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = render_corpus(args.paths, args.output, args.jobs,
+                            args.sample_rate)
+    for path, result in results.items():
+        ignored = (f", {result['ignored']} ignored" if result["ignored"]
+                   else "")
+        print(f"{path}: {result['files']} register files, "
+              f"{result['writes']} writes{ignored}", file=sys.stderr)
+    print(f"{len(results)} tunes in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
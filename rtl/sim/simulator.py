@@ -0,0 +1,46 @@
+import os
+from amaranth.hdl import Signal, Value
+from amaranth.lib import data
+from amaranth.sim import Simulator as PySimulator
+
+# Simulation backends
+#
+#   pysim:  The Amaranth Python simulator.  No toolchain needed, and
+#      any signal can be read or written.
+#   cxxrtl:  The design compiled through Yosys CXXRTL (see cxxrtl.py).
+#      Only ports can be read or written, and many times faster.
+#
+# Simulator() picks the backend by name, else $HARDAY_SIM_BACKEND, else
+# pysim.  Both take the same testbenches, so a testbench written for
+# one runs on the other as long as it only touches ports and waits on
+# ticks and delays; cxxrtl.py lists what else differs.
+
+BACKENDS = ("pysim", "cxxrtl")
+
+def design_ports(dut) -> list:
+    """Every public Signal or View attribute of dut, as rtlil.convert()
+    ports
+    A View, such as Signal(layout), is its underlying Signal.  clk and
+    rst are left out; the converter adds the sync domain's.
+    """
+    ports = []
+    seen = set()
+    for name, value in vars(dut).items():
+        if isinstance(value, data.View):
+            value = Value.cast(value)
+        if (isinstance(value, Signal) and not name.startswith("_")
+                and name not in ("clk", "rst") and id(value) not in seen):
+            seen.add(id(value))
+            ports.append((name, value, None))
+    return ports
+
+def Simulator(dut, backend: str = None, ports=None):
+    """Simulator for dut on the given backend"""
+    if backend is None:
+        backend = os.environ.get("HARDAY_SIM_BACKEND", "pysim")
+    if backend == "pysim":
+        return PySimulator(dut)
+    elif backend == "cxxrtl":
+        from .cxxrtl import CxxrtlSimulator
+        return CxxrtlSimulator(dut, ports)
+    raise ValueError(f"backend must be one of {BACKENDS}, not {backend!r}")
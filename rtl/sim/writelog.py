@@ -0,0 +1,328 @@
+import gzip
+import struct
+import numpy as np
+
+# Register-write logs
+#
+# A write log is a tune as the stream of register writes a host makes:
+# the time of each write, the address on DA7-DA0, and the data.  The
+# address carries the register file in DA7-DA4, as in enhanced mode,
+# so one log drives every register file, and mode and bank selects are
+# just writes to R15 of file zero (see overview.tex).
+#
+# A log may instead be of independent chips, as recorded from a board
+# with a chip on each DA7-DA4 chip select:  each register file is a
+# chip of its own, and the mode and bank selects of each are writes to
+# its own R15.
+#
+# The file format is a 16-byte header:
+#
+#   magic     4 bytes   b"HWL1"
+#   clock     u32       PSG master clock in Hz
+#   rate      u32       Time units per second
+#   flags     u32       B0 set for a log of independent chips; the
+#                       rest zero
+#
+# then one record per write, and an end record:
+#
+#   write:  varint (delta << 1), u8 address, u8 data
+#   end:    varint (delta << 1) | 1
+#
+# where delta is the time since the last record, in time units, and a
+# varint is 7 bits per byte, least significant first, with the top bit
+# set on every byte but the last.  Writes a frame apart at 50Hz are
+# three bytes each.  All integers are little-endian.
+#
+# Importers:
+#
+#   import_ym:  YM3!, YM5!, and YM6! files, uncompressed; most are
+#      LHA-compressed and must be extracted first.  One frame of
+#      registers R0-R13 every player frame, with R13 written only when
+#      it isn't 0xFF.  The log starts by selecting YM2149 mode.
+#   import_vgm:  VGM and gzipped VGZ files, AY-3-8910 family writes
+#      only (command 0xA0), in 44100Hz time units.  The second chip of
+#      a dual-chip file goes to register file 1.  A YM2149 family chip
+#      selects YM2149 mode on each chip.  For the AY-3-8930, which
+#      selects modes and banks with the high nibble of R13, that nibble
+#      is moved to the chip's R15.
+#
+# Both importers make logs of independent chips.
+#
+# R14 and R15 are I/O ports on the original parts, so the importers
+# drop writes to them rather than let them select modes here.
+
+MAGIC = b"HWL1"
+_HEADER = struct.Struct("<4sIII")
+
+# R15 values for the mode selects
+MODE_8910 = 0x00
+MODE_YM2149 = 0x10
+
+# Header flags
+FLAG_CHIPS = 1
+
+class WriteLog:
+    """Register-write log
+    clock:  PSG master clock in Hz.
+    rate:  Time units per second.
+    time:  Time of each write, in time units, nondecreasing.
+    address, data:  Address and data of each write.
+    length:  Time the tune ends, at or after the last write.
+    chips:  Each register file is an independent chip, with its own
+       mode select; else the mode selects are R15 of file zero.
+    """
+    def __init__(self, clock: int, rate: int, time=(), address=(),
+                 data=(), length: int = None, chips: bool = False):
+        self.clock = clock
+        self.rate = rate
+        self.chips = chips
+        self.time = np.asarray(time, dtype=np.int64)
+        self.address = np.asarray(address, dtype=np.uint8)
+        self.data = np.asarray(data, dtype=np.uint8)
+        assert (len(self.time) == len(self.address) == len(self.data)), \
+            "time, address, and data must be the same length"
+        assert (np.all(np.diff(self.time) >= 0)), "time must not decrease"
+        if length is None:
+            length = int(self.time[-1]) if len(self.time) else 0
+        assert (not len(self.time) or length >= self.time[-1]), \
+            "length must be at or after the last write"
+        self.length = length
+
+    def __len__(self):
+        return len(self.time)
+
+    def seconds(self) -> float:
+        return self.length / self.rate
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _read_varint(buffer: bytes, offset: int) -> tuple:
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise ValueError("write log ends in the middle of a record")
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+def dumps(log: WriteLog) -> bytes:
+    """Encode a write log"""
+    flags = FLAG_CHIPS if log.chips else 0
+    out = bytearray(_HEADER.pack(MAGIC, log.clock, log.rate, flags))
+    last = 0
+    for time, address, data in zip(log.time.tolist(),
+                                   log.address.tolist(),
+                                   log.data.tolist()):
+        out += _varint((time - last) << 1)
+        out.append(address)
+        out.append(data)
+        last = time
+    out += _varint(((log.length - last) << 1) | 1)
+    return bytes(out)
+
+def loads(buffer: bytes) -> WriteLog:
+    """Decode a write log"""
+    if len(buffer) < _HEADER.size:
+        raise ValueError("not a write log")
+    magic, clock, rate, flags = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("not a write log")
+    if flags & ~FLAG_CHIPS:
+        raise ValueError(f"unknown write log flags 0x{flags:x}")
+    time, address, data = [], [], []
+    now = 0
+    offset = _HEADER.size
+    while True:
+        value, offset = _read_varint(buffer, offset)
+        now += value >> 1
+        if value & 1:
+            break
+        if offset + 2 > len(buffer):
+            raise ValueError("write log ends in the middle of a record")
+        time.append(now)
+        address.append(buffer[offset])
+        data.append(buffer[offset + 1])
+        offset += 2
+    return WriteLog(clock, rate, time, address, data, now,
+                    bool(flags & FLAG_CHIPS))
+
+def save(log: WriteLog, path: str):
+    with open(path, "wb") as file:
+        file.write(dumps(log))
+
+def load(path: str) -> WriteLog:
+    """Load a write log, or import a YM or VGM file"""
+    with open(path, "rb") as file:
+        buffer = file.read()
+    if buffer[:4] == MAGIC:
+        return loads(buffer)
+    if buffer[:2] == b"\x1f\x8b":
+        buffer = gzip.decompress(buffer)
+    if buffer[:4] == b"Vgm ":
+        return _import_vgm(buffer)
+    if buffer[:4] in (b"YM3!", b"YM5!", b"YM6!"):
+        return _import_ym(buffer)
+    if buffer[2:5] == b"-lh":
+        raise ValueError(f"{path} is LHA-compressed; extract it first")
+    raise ValueError(f"{path} is not a write log, YM, or VGM file")
+
+##############
+# Importers  #
+##############
+
+def import_ym(path: str) -> WriteLog:
+    """Import an uncompressed YM3!, YM5!, or YM6! file"""
+    with open(path, "rb") as file:
+        return _import_ym(file.read())
+
+def _import_ym(buffer: bytes) -> WriteLog:
+    kind = buffer[:4]
+    if kind == b"YM3!":
+        registers = 14
+        frames = (len(buffer) - 4) // registers
+        clock, rate, interleaved, offset = 2_000_000, 50, True, 4
+    elif kind in (b"YM5!", b"YM6!"):
+        if buffer[4:12] != b"LeOnArD!":
+            raise ValueError("bad YM header")
+        (frames, attributes, drums, clock, rate, loop,
+         extra) = struct.unpack_from(">IIHIHIH", buffer, 12)
+        registers = 16
+        interleaved = bool(attributes & 1)
+        offset = 34 + extra
+        for i in range(0, drums):
+            size, = struct.unpack_from(">I", buffer, offset)
+            offset += 4 + size
+        # Song name, author, and comment
+        for i in range(0, 3):
+            offset = buffer.index(b"\0", offset) + 1
+    else:
+        raise ValueError("not a YM file")
+
+    size = frames * registers
+    if offset + size > len(buffer):
+        raise ValueError("YM file is truncated")
+    frame = np.frombuffer(buffer, dtype=np.uint8, count=size, offset=offset)
+    frame = (frame.reshape(registers, frames).T if interleaved
+             else frame.reshape(frames, registers))
+    # R0-R13 only; the rest are I/O ports or effects
+    frame = frame[:, :14] & np.array(
+        [0xff, 0x0f, 0xff, 0x0f, 0xff, 0x0f, 0x1f, 0x3f,
+         0x1f, 0x1f, 0x1f, 0xff, 0xff, 0xff], dtype=np.uint8)
+
+    time = np.repeat(np.arange(0, frames, dtype=np.int64), 14)
+    address = np.tile(np.arange(0, 14, dtype=np.uint8), frames)
+    data = frame.reshape(-1)
+    # R13 restarts the envelope, so 0xFF means don't write it
+    keep = ~((address == 13) & (data == 0xff))
+    return WriteLog(clock, rate,
+                    np.concatenate([[0], time[keep]]),
+                    np.concatenate([[15], address[keep]]),
+                    np.concatenate([[MODE_YM2149], data[keep]]),
+                    frames, chips=True)
+
+# Operand bytes of each VGM command that isn't handled
+_VGM_SKIP = {0x4f: 1, 0x50: 1, 0x62: 0, 0x63: 0, 0x68: 11,
+             0x90: 4, 0x91: 4, 0x92: 5, 0x93: 10, 0x94: 1, 0x95: 4}
+for _command in range(0x30, 0x40):
+    _VGM_SKIP[_command] = 1
+for _command in range(0x40, 0x4f):
+    _VGM_SKIP[_command] = 2
+for _command in range(0x51, 0x60):
+    _VGM_SKIP[_command] = 2
+for _command in range(0xa1, 0xc0):
+    _VGM_SKIP[_command] = 2
+for _command in range(0xc0, 0xe0):
+    _VGM_SKIP[_command] = 3
+for _command in range(0xe0, 0x100):
+    _VGM_SKIP[_command] = 4
+
+def import_vgm(path: str) -> WriteLog:
+    """Import a VGM or VGZ file's AY-3-8910 family writes"""
+    with open(path, "rb") as file:
+        buffer = file.read()
+    if buffer[:2] == b"\x1f\x8b":
+        buffer = gzip.decompress(buffer)
+    return _import_vgm(buffer)
+
+def _import_vgm(buffer: bytes) -> WriteLog:
+    if buffer[:4] != b"Vgm ":
+        raise ValueError("not a VGM file")
+    version, = struct.unpack_from("<I", buffer, 0x08)
+    samples, = struct.unpack_from("<I", buffer, 0x18)
+    offset = 0x40
+    if version >= 0x150:
+        relative, = struct.unpack_from("<I", buffer, 0x34)
+        if relative:
+            offset = 0x34 + relative
+    clock, kind = 0, 0
+    if version >= 0x151 and len(buffer) >= 0x7c:
+        clock, = struct.unpack_from("<I", buffer, 0x74)
+        kind = buffer[0x78]
+    if not clock & 0x3fffffff:
+        raise ValueError("VGM file has no AY-3-8910 family chip")
+    chips = 2 if clock & 0x40000000 else 1
+    clock &= 0x3fffffff
+    ay8930 = kind == 0x03
+    ym2149 = kind >= 0x10
+
+    time, address, data = [], [], []
+    if ym2149:
+        for chip in range(0, chips):
+            time.append(0)
+            address.append((chip << 4) | 15)
+            data.append(MODE_YM2149)
+    now = 0
+    while offset < len(buffer):
+        command = buffer[offset]
+        if command == 0x66:
+            break
+        elif command == 0xa0:
+            register, value = buffer[offset + 1], buffer[offset + 2]
+            chip = register >> 7
+            register &= 0x7f
+            if register == 13 and ay8930:
+                # The mode and bank select nibble moves to R15
+                time.append(now)
+                address.append((chip << 4) | 15)
+                data.append(value & 0xf0)
+                value &= 0x0f
+            if register < 14:
+                time.append(now)
+                address.append((chip << 4) | register)
+                data.append(value)
+            offset += 3
+        elif command == 0x61:
+            now += struct.unpack_from("<H", buffer, offset + 1)[0]
+            offset += 3
+        elif command == 0x62:
+            now += 735
+            offset += 1
+        elif command == 0x63:
+            now += 882
+            offset += 1
+        elif 0x70 <= command <= 0x7f:
+            now += (command & 0x0f) + 1
+            offset += 1
+        elif 0x80 <= command <= 0x8f:
+            now += command & 0x0f
+            offset += 1
+        elif command == 0x67:
+            size, = struct.unpack_from("<I", buffer, offset + 3)
+            offset += 7 + size
+        elif command in _VGM_SKIP:
+            offset += 1 + _VGM_SKIP[command]
+        else:
+            raise ValueError(f"unknown VGM command 0x{command:02x} at "
+                             f"0x{offset:x}")
+    return WriteLog(clock, 44100, time, address, data, max(now, samples),
+                    chips=True)
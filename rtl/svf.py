@@ -0,0 +1,245 @@
+from amaranth import *
+from amaranth.lib import data
+from amaranth.lib.memory import Memory
+from .multiplier import Multiplier
+from .register_files import RegisterFiles, BankDecoder, decode
+
+# Chamberlin state variable filter bank
+#
+# One filter per channel, time-multiplexed through one pipeline:
+#
+#   low  += f * band
+#   high  = sample - low - q * band
+#   band += f * high
+#
+# f is unsigned Q0.16, the same as the LFO sine oscillator's phase
+# increment, so f * x is (f * x) >> 16; for a cutoff fc at sample rate
+# fs, f = 2 sin(pi fc / fs).  q is the damping, 1/Q, as unsigned Q1.15,
+# so it covers the whole stable range from 0 to 2.  Low and band are
+# 24-bit, the same as the samples, and every sum saturates.
+#
+# Each channel's coefficients and state are in memory, so the cost
+# doesn't grow with the number of channels beyond the memories.  The
+# three multiplies run on two multipliers:
+#
+#   Multiplier 0:  f * band, then f * high
+#   Multiplier 1:  q * band
+#
+# A channel's first multiplies are issued one cycle after it arrives,
+# and its second is issued an odd number of cycles later; so as long as
+# samples arrive an even number of cycles apart, multiplier 0 is never
+# asked for two products at once.  That is, a sample may be presented
+# every initiation_interval cycles, or any multiple of it.  Like the
+# bitcrusher, a channel must not be presented again within latency
+# cycles, while its state is still in flight.
+#
+# Output is selected by mode:  low-pass, band-pass, high-pass, or notch
+# (high + low).  A disabled filter still runs, so enabling it doesn't
+# start from stale state, but passes its input through.
+
+LOW_PASS = 0
+BAND_PASS = 1
+HIGH_PASS = 2
+NOTCH = 3
+
+SVFRegisterLayout = data.StructLayout({
+    "f": 16,
+    "q": 16,
+    "mode": 2,
+    "enable": 1,
+})
+
+SVFStateLayout = data.StructLayout({
+    "low": signed(24),
+    "band": signed(24),
+})
+
+def _saturate(m: Module, value: Value) -> Signal:
+    result = Signal(signed(24))
+    with m.If(value > 2**23 - 1):
+        m.d.comb += result.eq(2**23 - 1)
+    with m.Elif(value < -2**23):
+        m.d.comb += result.eq(-2**23)
+    with m.Else():
+        m.d.comb += result.eq(value)
+    return result
+
+class StateVariableFilter(Elaboratable):
+    """State variable filter bank
+    sample:  Signed 24-bit input for channel, taken while valid is
+       high.
+    out:  Filtered sample for out_channel, latency cycles later, valid
+       while out_valid is high.
+    f, q, mode, enable:  Coefficients and output mode, written to
+       channel_select with write_enable.
+    files:  RegisterFiles, or None.  With register files,
+       channel_select is a BankAddressLayout, and writes to files that
+       aren't implemented are dropped; see register_files.py.
+    initiation_interval:  Clock cycles between samples.
+    latency:  Clock cycles from a sample to its output.
+    multipliers:  Multiplier 0 and multiplier 1.
+    """
+    def __init__(self, channels: int = 3, multiplier_delay: int = 1,
+                 files: RegisterFiles = None):
+        assert (channels > 0), "channels must be greater than zero"
+        assert (multiplier_delay > 0), "multiplier_delay must be greater than zero"
+        assert (files is None or files.channels == channels), \
+            "channels must be three per register file"
+        self.channels = channels
+        self.multiplier_delay = multiplier_delay
+        self.initiation_interval = 2
+        # The second multiply is issued at an even offset from the
+        # first, one cycle after the sample arrives
+        self._pad = multiplier_delay % 2 ^ 1
+        # Read, two multiplies, register the output
+        self.latency = 1 + 2*multiplier_delay + self._pad + 1
+
+        self.clk = Signal(1)
+        self.sample = Signal(signed(24))
+        self.channel = Signal(range(channels))
+        self.valid = Signal(1)
+        self.out = Signal(signed(24))
+        self.out_channel = Signal(range(channels))
+        self.out_valid = Signal(1)
+
+        self.decoder = BankDecoder(files) if files is not None else None
+        self.channel_select = (self.decoder.address if self.decoder
+                               else Signal(range(channels)))
+        self.f = Signal(16)
+        self.q = Signal(16)
+        self.mode = Signal(2)
+        self.enable = Signal(1)
+        self.write_enable = Signal(1)
+
+        self.multipliers = [
+            Multiplier(16, signed(24), multiplier_delay),
+            Multiplier(16, signed(24), multiplier_delay),
+        ]
+
+        self.config = Memory(shape=SVFRegisterLayout, depth=channels,
+                             init=[])
+        self.state = Memory(shape=SVFStateLayout, depth=channels, init=[])
+        self._config_write = self.config.write_port()
+        self._config_read = self.config.read_port()
+        self._state_write = self.state.write_port()
+        self._state_read = self.state.read_port()
+
+    def elaborate(self, platform) -> Module:
+        m = Module()
+        m.submodules.config = self.config
+        m.submodules.state = self.state
+        for i, multiplier in enumerate(self.multipliers):
+            m.submodules[f"multiplier_{i}"] = multiplier
+        delay = self.multiplier_delay
+        product = [x.product for x in self.multipliers]
+
+        select, write_enable = decode(m, self.decoder, self.channel_select,
+                                      self.write_enable)
+        m.d.comb += [
+            self._config_write.addr.eq(select),
+            self._config_write.data.f.eq(self.f),
+            self._config_write.data.q.eq(self.q),
+            self._config_write.data.mode.eq(self.mode),
+            self._config_write.data.enable.eq(self.enable),
+            self._config_write.en.eq(write_enable),
+        ]
+
+        # Read the channel's registers
+        m.d.comb += [
+            self._config_read.addr.eq(self.channel),
+            self._state_read.addr.eq(self.channel),
+        ]
+        item_layout = data.StructLayout({
+            "valid": 1,
+            "channel": range(self.channels),
+            "sample": signed(24),
+            "f": 16,
+            "mode": 2,
+            "enable": 1,
+            "low": signed(24),
+            "band": signed(24),
+            "high": signed(24),
+        })
+        read = Signal(item_layout)
+        m.d.sync += [
+            read.valid.eq(self.valid),
+            read.channel.eq(self.channel),
+            read.sample.eq(self.sample),
+        ]
+        config = self._config_read.data
+        state = self._state_read.data
+
+        # The items in flight for each multiply, delayed for pipelining
+        first = [Signal(item_layout) for x in range(0, delay)]
+        second = [Signal(item_layout) for x in range(0, delay)]
+        for pipeline in [first, second]:
+            for i in range(1, delay):
+                m.d.sync += pipeline[i].eq(pipeline[i-1])
+
+        # First multiplies
+        m.d.sync += [
+            first[0].eq(read),
+            first[0].f.eq(config.f),
+            first[0].mode.eq(config.mode),
+            first[0].enable.eq(config.enable),
+            first[0].low.eq(state.low),
+            first[0].band.eq(state.band),
+        ]
+        m.d.comb += [
+            self.multipliers[1].a.eq(config.q),
+            self.multipliers[1].b.eq(state.band),
+        ]
+
+        # low and high, then the second multiply
+        a = first[-1]
+        low = _saturate(m, a.low + (product[0] >> 16))
+        high = _saturate(m, a.sample - low - (product[1] >> 15))
+        issue = Signal(item_layout)
+        m.d.comb += [
+            issue.eq(a),
+            issue.low.eq(low),
+            issue.high.eq(high),
+        ]
+        if self._pad:
+            padded = Signal(item_layout)
+            m.d.sync += padded.eq(issue)
+            issue = padded
+        m.d.sync += second[0].eq(issue)
+
+        # Multiplier 0 serves whichever multiply is issued this cycle
+        with m.If(issue.valid):
+            m.d.comb += [
+                self.multipliers[0].a.eq(issue.f),
+                self.multipliers[0].b.eq(issue.high),
+            ]
+        with m.Else():
+            m.d.comb += [
+                self.multipliers[0].a.eq(config.f),
+                self.multipliers[0].b.eq(state.band),
+            ]
+
+        # band, write back, and select the output
+        b = second[-1]
+        band = _saturate(m, b.band + (product[0] >> 16))
+        m.d.comb += [
+            self._state_write.addr.eq(b.channel),
+            self._state_write.data.low.eq(b.low),
+            self._state_write.data.band.eq(band),
+            self._state_write.en.eq(b.valid),
+        ]
+        selected = Signal(signed(24))
+        with m.Switch(b.mode):
+            with m.Case(LOW_PASS):
+                m.d.comb += selected.eq(b.low)
+            with m.Case(BAND_PASS):
+                m.d.comb += selected.eq(band)
+            with m.Case(HIGH_PASS):
+                m.d.comb += selected.eq(b.high)
+            with m.Case(NOTCH):
+                m.d.comb += selected.eq(_saturate(m, b.high + b.low))
+        m.d.sync += [
+            self.out.eq(Mux(b.enable, selected, b.sample)),
+            self.out_channel.eq(b.channel),
+            self.out_valid.eq(b.valid),
+        ]
+        return m
@@ -0,0 +1,65 @@
+import numpy as np
+from .svf import LOW_PASS, BAND_PASS, HIGH_PASS, NOTCH
+
+# Bit-exact NumPy model of the state variable filter bank
+#
+# Reproduces the samples StateVariableFilter in svf.py puts on out for
+# each channel, given the same input samples and registers.  Each
+# sample steps every channel once:
+#
+#   low  = sat(low + ((f * band) >> 16))
+#   high = sat(sample - low - ((q * band) >> 15))
+#   band = sat(band + ((f * high) >> 16))
+#
+# with products floored, the new low in high, the old band in q * band,
+# and every sat() to signed 24-bit.  The output is low, the new band,
+# high, or sat(high + low) by mode, or the sample itself for a disabled
+# channel, whose state still steps.  State powers on cleared.
+
+def _saturate(x):
+    return np.clip(x, -2**23, 2**23 - 1)
+
+class SVFModel:
+    """State variable filter reference model
+    channels:  Number of channels.
+    All registers and state are arrays of (channels) entries, in int64
+    so products can be formed without overflow:
+       f, q, mode, enable, low, band
+    """
+    def __init__(self, channels: int = 3):
+        assert (channels > 0), "channels must be greater than zero"
+        self.channels = channels
+        self.f = np.zeros(channels, dtype=np.int64)
+        self.q = np.zeros(channels, dtype=np.int64)
+        self.mode = np.zeros(channels, dtype=np.int64)
+        self.enable = np.zeros(channels, dtype=np.int64)
+        self.low = np.zeros(channels, dtype=np.int64)
+        self.band = np.zeros(channels, dtype=np.int64)
+
+    def write(self, channel, f: int, q: int, mode: int, enable: int):
+        """Write a channel's registers, as write_enable does"""
+        self.f[channel] = f
+        self.q[channel] = q
+        self.mode[channel] = mode
+        self.enable[channel] = enable
+
+    def step(self, x) -> np.ndarray:
+        """Filter one sample of every channel, from (channels) samples"""
+        x = np.asarray(x, dtype=np.int64)
+        low = _saturate(self.low + ((self.f * self.band) >> 16))
+        high = _saturate(x - low - ((self.q * self.band) >> 15))
+        band = _saturate(self.band + ((self.f * high) >> 16))
+        self.low, self.band = low, band
+        y = np.select([self.mode == LOW_PASS, self.mode == BAND_PASS,
+                       self.mode == HIGH_PASS, self.mode == NOTCH],
+                      [low, band, high, _saturate(high + low)])
+        return np.where(self.enable != 0, y, x)
+
+    def render(self, x) -> np.ndarray:
+        """Filter a (samples, channels) array of input samples
+        Returns the outputs as a (samples, channels) array of int64, and
+        leaves the model ready for the samples that follow.
+        """
+        x = np.asarray(x, dtype=np.int64).reshape(-1, self.channels)
+        return np.array([self.step(row) for row in x],
+                        dtype=np.int64).reshape(-1, self.channels)
@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from amaranth.back import rtlil
+from ..generators.lfo import LFO
+from ..generators.tone_generator import ToneGenerator
+from ..svf import StateVariableFilter
+from ..output_filter import HalfBandFilter
+from ..control_unit import tone_stage, filter_stage, lfo_stage
+from ..sim.simulator import design_ports
+
+# Resource and fmax sweep on the open source ECP5 toolchain
+#
+#   python -m rtl.synth.resources -o resources.json
+#   python -m rtl.synth.resources --device 12k --clock 9.216
+#
+# Each generator is synthesized with Yosys synth_ecp5 and placed and
+# routed out of context with nextpnr-ecp5 over a parameter grid.  For
+# each build this records:
+#
+#   lut, carry, ff:  LUT4, CCU2C (two LUT4 each), and flip-flop counts.
+#   distributed_ram, bram, dsp:  TRELLIS_DPR16X4, DP16KD, and
+#      MULT18X18D counts.
+#   fmax:  Maximum clock in MHz, as estimated by nextpnr.
+#   cycles:  Clock cycles needed per sample:  the cycles of the unit's
+#      Stage, as the control unit schedules it (see schedule.py), so
+#      the time to take every channel.  Samples overlap, so the
+#      pipeline drains in the next sample's time.
+#   budget:  Clock cycles available per sample, at the lesser of the
+#      clock and fmax.
+#
+# A build is flagged if it doesn't fit the device, or if cycles exceeds
+# budget; the exit status is 1 if any build is flagged.  The LFO is
+# budgeted as if updated every sample, the fastest it can be updated.
+#
+# Yosys is $YOSYS, yosys, or yowasp-yosys, and nextpnr is $NEXTPNR_ECP5,
+# nextpnr-ecp5, or yowasp-nextpnr-ecp5, whichever is found first.
+
+# Generator, its Stage, and the parameter grid
+GENERATORS = {
+    "LFO": (LFO, lfo_stage, {
+        "count": [3, 24, 48],
+        "multiplier_delay": [1, 2, 3],
+    }),
+    "ToneGenerator": (ToneGenerator, tone_stage, {
+        "channels": [3, 24, 48],
+        "sample_rate": [96000],
+        "multiplier_delay": [1, 2, 3],
+    }),
+    "StateVariableFilter": (StateVariableFilter,
+                            lambda dut: filter_stage("svf", dut), {
+        "channels": [3, 24, 48],
+        "multiplier_delay": [1, 2, 3],
+    }),
+    "HalfBandFilter": (HalfBandFilter,
+                       lambda dut: filter_stage("output_filter", dut), {
+        "channels": [3, 24, 48],
+        "taps": [11, 19],
+        "multipliers": [1, 2],
+    }),
+}
+
+# nextpnr-ecp5 device flags
+DEVICES = {
+    "12k": "--12k",
+    "25k": "--25k",
+    "45k": "--45k",
+    "85k": "--85k",
+}
+
+def _tool(variable: str, *names) -> str:
+    for name in (os.environ.get(variable),) + names:
+        if name and shutil.which(name):
+            return name
+    raise RuntimeError(f"none of {', '.join(names)} found; set ${variable}")
+
+def _synth_ecp5(yosys: str, build: str) -> tuple:
+    # Synthesize design.il in build to design.json, returning the cells
+    # by type and the memories mapped to flip-flops
+    log = subprocess.run([yosys, "-p",
+                          "read_rtlil design.il; "
+                          "synth_ecp5 -top top -json design.json; "
+                          "tee -q -o stat.json stat -json"],
+                         cwd=build, check=True, capture_output=True,
+                         text=True).stdout
+    with open(os.path.join(build, "stat.json")) as file:
+        stat = json.load(file)["design"]["num_cells_by_type"]
+    prefix = "using FF mapping for memory "
+    memories = sorted(line.split(prefix, 1)[1].strip()
+                      for line in log.splitlines() if prefix in line)
+    return stat, memories
+
+def cell_counts(dut) -> dict:
+    """Cells of dut after synth_ecp5
+    Returns lut, carry, ff, distributed_ram, bram, and dsp, as for
+    synthesize(), and ff_memories, the memories Yosys mapped to
+    flip-flops.
+    """
+    yosys = _tool("YOSYS", "yosys", "yowasp-yosys")
+    with tempfile.TemporaryDirectory() as build:
+        with open(os.path.join(build, "design.il"), "w") as file:
+            file.write(rtlil.convert(dut, ports=design_ports(dut)))
+        stat, memories = _synth_ecp5(yosys, build)
+    return dict(_cells(stat), ff_memories=memories)
+
+def _cells(stat: dict) -> dict:
+    return {
+        "lut": stat.get("LUT4", 0),
+        "carry": stat.get("CCU2C", 0),
+        "ff": stat.get("TRELLIS_FF", 0),
+        "distributed_ram": stat.get("TRELLIS_DPR16X4", 0),
+        "bram": stat.get("DP16KD", 0),
+        "dsp": stat.get("MULT18X18D", 0),
+    }
+
+def synthesize(name: str, params: dict, device: str = "25k",
+               package: str = "CABGA381", clock: float = 24.576,
+               sample_rate: int = 96000) -> dict:
+    """Synthesize, place, and route one build of one generator"""
+    cls, stage, grid = GENERATORS[name]
+    dut = cls(**params)
+    sample_rate = params.get("sample_rate", sample_rate)
+    result = {
+        "generator": name,
+        "params": params,
+        "device": device,
+        "cycles": stage(dut).cycles,
+    }
+
+    yosys = _tool("YOSYS", "yosys", "yowasp-yosys")
+    nextpnr = _tool("NEXTPNR_ECP5", "nextpnr-ecp5", "yowasp-nextpnr-ecp5")
+    with tempfile.TemporaryDirectory() as build:
+        with open(os.path.join(build, "design.il"), "w") as file:
+            file.write(rtlil.convert(dut, ports=design_ports(dut)))
+        stat, _ = _synth_ecp5(yosys, build)
+        # A build too big for the device fails here, with no report
+        placed = subprocess.run([nextpnr, "-q", DEVICES[device],
+                                 "--package", package,
+                                 "--json", "design.json",
+                                 "--out-of-context",
+                                 "--freq", str(clock),
+                                 "--report", "report.json"],
+                                cwd=build, capture_output=True)
+        report = None
+        if placed.returncode == 0:
+            with open(os.path.join(build, "report.json")) as file:
+                report = json.load(file)
+
+    result.update(_cells(stat))
+    result.update({
+        "fits": report is not None,
+        "fmax": None,
+        "utilization": None,
+    })
+    if report is not None:
+        result["fmax"] = min((f["achieved"] for f in report["fmax"].values()),
+                             default=None)
+        result["utilization"] = {k: v["used"] / v["available"]
+                                 for k, v in report["utilization"].items()
+                                 if v["used"]}
+    limit = clock if result["fmax"] is None else min(clock, result["fmax"])
+    result["budget"] = int(limit * 1e6 // sample_rate)
+    return result
+
+def _synthesize(job):
+    name, params, options = job
+    return synthesize(name, params, **options)
+
+def sweep(generators=None, jobs: int = None, **options) -> list:
+    """Synthesize every build in the parameter grid, (jobs) at a time"""
+    work = []
+    for name in generators or GENERATORS:
+        cls, stage, grid = GENERATORS[name]
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            work.append((name, dict(zip(keys, values)), options))
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(_synthesize, work))
+
+def flagged(result: dict) -> list:
+    """Reasons a build can't be used"""
+    reasons = []
+    if not result["fits"]:
+        reasons.append(f"does not fit {result['device']}")
+    if result["cycles"] > result["budget"]:
+        reasons.append(f"needs {result['cycles']} cycles per sample, "
+                       f"has {result['budget']}")
+    return reasons
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resource and fmax sweep of the RTL generators")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("-g", "--generator", action="append",
+                        choices=list(GENERATORS))
+    parser.add_argument("--device", choices=list(DEVICES), default="25k")
+    parser.add_argument("--package", default="CABGA381")
+    parser.add_argument("--clock", type=float, default=24.576,
+                        help="core clock in MHz")
+    parser.add_argument("--sample-rate", type=int, default=96000)
+    parser.add_argument("-j", "--jobs", type=int)
+    args = parser.parse_args()
+
+    results = sweep(args.generator, args.jobs, device=args.device,
+                    package=args.package, clock=args.clock,
+                    sample_rate=args.sample_rate)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    print(f"{'generator':14} {'params':52} {'LUT4':>6} {'CCU2C':>6} "
+          f"{'FF':>6} {'DPR16':>6} {'BRAM':>5} {'DSP':>4} {'fmax':>7} "
+          f"{'cycles':>7} {'budget':>7}")
+    bad = 0
+    for r in results:
+        params = ", ".join(f"{k}={v}" for k, v in r["params"].items())
+        fmax = "-" if r["fmax"] is None else f"{r['fmax']:.1f}"
+        print(f"{r['generator']:14} {params:52} {r['lut']:>6} "
+              f"{r['carry']:>6} {r['ff']:>6} {r['distributed_ram']:>6} "
+              f"{r['bram']:>5} {r['dsp']:>4} {fmax:>7} {r['cycles']:>7} "
+              f"{r['budget']:>7}")
+        for reason in flagged(r):
+            print(f"    FLAGGED: {reason}")
+            bad += 1
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The RTL is imported as rtl.*, from the top of the tree, and the
+# firmware as ay38930.*, from code/firmware, as it is on the device.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "code", "firmware")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,24 @@
+from rtl.sim.benchmark import regressions
+
+# Regressions flagged by the benchmark
+
+def _result(channels, lut, ff):
+    return {"generator": "Bitcrusher", "params": {"channels": channels},
+            "lut": lut, "ff": ff, "ff_memories": [],
+            "cycles_per_second": {}, "counters": {}}
+
+def test_flat_logic_passes():
+    assert regressions([_result(3, 111, 85), _result(48, 179, 93)]) == []
+
+def test_flip_flops_growing_with_channels_fail():
+    # A register file mapped to flip-flops grows with the channels
+    found = regressions([_result(3, 111, 85), _result(48, 179, 1200)])
+    assert len(found) == 1 and "ff grows" in found[0]
+
+def test_without_yosys_nothing_is_flagged():
+    assert regressions([_result(3, None, None),
+                        _result(48, None, None)]) == []
+
+def test_more_cells_than_the_baseline_fail():
+    found = regressions([_result(3, 112, 85)], [_result(3, 111, 85)])
+    assert found == ["Bitcrusher {'channels': 3}: lut 111 -> 112"]
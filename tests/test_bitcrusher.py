@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.bitcrusher import Bitcrusher
+
+# The bitcrusher against a NumPy model of its quantizer and error
+# feedback
+
+# crush for each channel; 5 is there twice, so two channels carry
+# errors of their own
+CRUSH = [0, 5, 24, 63, 5]
+
+def bitcrusher_model(x, crush, compensate) -> np.ndarray:
+    """Crush a (samples, channels) array, each channel's error
+    starting at zero
+    """
+    out = np.zeros_like(x)
+    for c in range(0, x.shape[1]):
+        low = (1 << min(crush[c], 24)) - 1
+        error = 0
+        for n in range(0, x.shape[0]):
+            v = int(x[n, c]) + (error if compensate[c] else 0)
+            saturated = min(max(v, -2**23), 2**23 - 1)
+            # The mask is 24 bits, so crushing every bit gives zero
+            quantized = saturated & ~low & 0xffffff
+            quantized -= (quantized & 0x800000) << 1
+            error = saturated - quantized if compensate[c] else 0
+            out[n, c] = quantized
+    return out
+
+def simulate(x, crush, compensate) -> np.ndarray:
+    channels = x.shape[1]
+    dut = Bitcrusher(channels)
+    out = np.zeros_like(x)
+    taken = [0]*channels
+
+    async def testbench(ctx):
+        for channel in range(0, channels):
+            ctx.set(dut.channel_select, channel)
+            ctx.set(dut.crush, crush[channel])
+            ctx.set(dut.compensate, compensate[channel])
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        # One sample a cycle, channel after channel
+        items = [(n, c) for n in range(0, len(x)) for c in range(0, channels)]
+        for item in items + [None]*(dut.latency + 1):
+            ctx.set(dut.valid, item is not None)
+            if item is not None:
+                ctx.set(dut.sample, int(x[item]))
+                ctx.set(dut.channel, item[1])
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                c = ctx.get(dut.out_channel)
+                out[taken[c], c] = ctx.get(dut.out)
+                taken[c] += 1
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    assert taken == [len(x)]*channels
+    return out
+
+def samples(channels: int) -> np.ndarray:
+    # Noise, then a run at each end of full scale to saturate
+    rng = np.random.default_rng(channels)
+    return np.concatenate([
+        rng.integers(-2**23, 2**23, (24, channels)),
+        np.full((6, channels), 2**23 - 1),
+        np.full((6, channels), -2**23),
+        rng.integers(-1000, 1000, (24, channels)),
+    ])
+
+@pytest.mark.parametrize("compensate", [0, 1])
+def test_bitcrusher_matches_model(compensate):
+    x = samples(len(CRUSH))
+    compensate = [compensate]*len(CRUSH)
+    expected = bitcrusher_model(x, CRUSH, compensate)
+    np.testing.assert_array_equal(simulate(x, CRUSH, compensate), expected)
+    # crush 0 passes the sample, and 24 and up clear every bit
+    np.testing.assert_array_equal(expected[:, 0], x[:, 0])
+    assert not expected[:, 2:4].any()
+    assert not (expected[:, 1] & 0x1f).any()
+
+def test_error_feedback():
+    x = samples(len(CRUSH))
+    # Per channel, so channels with and without feedback interleave
+    compensate = [1, 1, 1, 0, 0]
+    out = simulate(x, CRUSH, compensate)
+    np.testing.assert_array_equal(out, bitcrusher_model(x, CRUSH,
+                                                        compensate))
+    # Feedback changes the crushed samples, but at full scale the sum
+    # saturates rather than wrapping
+    plain = bitcrusher_model(x, CRUSH, [0]*len(CRUSH))
+    assert (out[:, 1] != plain[:, 1]).any()
+    assert (out[24:30, 1] == (2**23 - 1) & ~0x1f).all()
+    np.testing.assert_array_equal(out[:, 4], plain[:, 4])
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.config_deserializer import ConfigDeserializer
+
+# Configuration frames through the serial deserializer and back
+
+def random_frame(layout, channels: int, rng) -> int:
+    """A frame of random fields, as an integer"""
+    fields = {
+        "tone_write": rng.integers(0, 2),
+        "lfo_write": rng.integers(0, 2),
+        "channel": rng.integers(0, channels),
+        "tone": {
+            "phase_reset": rng.integers(0, 4),
+            "enable": rng.integers(0, 4),
+            "waveform": rng.integers(0, 4),
+            "lfo": rng.integers(0, 4),
+            "duty_cycle": rng.integers(0, 2**8),
+            "phase_increment": rng.integers(0, 2**24),
+            "lfo_offset": rng.integers(0, 2**24),
+        },
+        "lfo_phase_increment": rng.integers(0, 2**16),
+        "lfo_wfdr": rng.integers(0, 16),
+        "lfo_wfdr_mask": rng.integers(0, 16),
+    }
+    return layout.const(fields).as_value().value
+
+def chunks(dut, frame: int) -> list:
+    """A frame's chunks, least significant first"""
+    mask = (1 << dut.width) - 1
+    return [(frame >> (i*dut.width)) & mask
+            for i in range(0, dut.frame_cycles)]
+
+def run(dut, stream: list) -> list:
+    """Frames out of the deserializer, for a list of (data, valid, start)"""
+    frames = []
+
+    async def testbench(ctx):
+        for data, valid, start in stream + [(0, 0, 0)]*2:
+            ctx.set(dut.data, data)
+            ctx.set(dut.valid, valid)
+            ctx.set(dut.start, start)
+            await ctx.tick()
+            if ctx.get(dut.frame_valid):
+                frames.append(ctx.get(dut.frame.as_value()))
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    return frames
+
+@pytest.mark.parametrize("channels, width", [(3, 1), (3, 8), (48, 48),
+                                             (48, 92), (4, 128)])
+def test_round_trip(channels, width):
+    dut = ConfigDeserializer(channels, width)
+    assert dut.frame_cycles * width >= dut.layout.size
+    assert dut.reconfigure_cycles == channels * dut.frame_cycles
+    rng = np.random.default_rng(width)
+    frames = [random_frame(dut.layout, channels, rng) for x in range(0, 4)]
+    # Back to back, then with idle cycles between chunks
+    stream = [(x, 1, i == 0) for frame in frames
+              for i, x in enumerate(chunks(dut, frame))]
+    stream += [y for x in stream for y in (x, (0, 0, 0))]
+    assert run(dut, stream) == frames + frames
+
+def test_realigns_on_start():
+    dut = ConfigDeserializer(3, 8)
+    rng = np.random.default_rng(0)
+    lost, frame = (random_frame(dut.layout, 3, rng) for x in range(0, 2))
+    # A frame missing its last chunk, then a whole one
+    stream = [(x, 1, i == 0)
+              for i, x in enumerate(chunks(dut, lost)[:-1])]
+    stream += [(x, 1, i == 0) for i, x in enumerate(chunks(dut, frame))]
+    assert run(dut, stream) == [frame]
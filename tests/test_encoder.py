@@ -0,0 +1,90 @@
+import pytest
+from ay38930.encoder import (BusTiming, WriteBatch, CHIPS, SET_ADDRESS,
+                             SET_DATA, unpack, _ticks)
+
+# The firmware's write coalescing and bus timing
+
+def targets(batch: WriteBatch) -> list:
+    return [unpack(word)[1] for word in batch.words]
+
+def test_redundant_writes_dropped():
+    batch = WriteBatch(BusTiming("8910"))
+    batch.write(0, 5)
+    batch.write(1, 7)
+    batch.write(0, 5)
+    batch.write(0, 6)
+    assert (batch.written, batch.dropped) == (3, 1)
+
+@pytest.mark.parametrize("address", [13, 14, 15])
+def test_always_written(address):
+    batch = WriteBatch(BusTiming("8910"))
+    batch.write(address, 9)
+    batch.write(address, 9)
+    assert (batch.written, batch.dropped) == (2, 0)
+
+def test_latch_skipped():
+    batch = WriteBatch(BusTiming("8910"))
+    batch.write(3, 1)
+    batch.write(3, 2)
+    batch.write(4, 2)
+    assert batch.latches_skipped == 1
+    assert targets(batch) == [SET_ADDRESS, SET_DATA, SET_DATA,
+                              SET_ADDRESS, SET_DATA]
+
+def test_invalidate():
+    batch = WriteBatch(BusTiming("8910"))
+    batch.write(0, 5)
+    batch.invalidate()
+    batch.write(0, 5)
+    assert (batch.written, batch.dropped, batch.latches_skipped) == (2, 0, 0)
+
+def test_8930_bank_from_r13():
+    batch = WriteBatch(BusTiming("8930"))
+    batch.write(0, 5)
+    batch.write(13, 0xb0)
+    batch.write(0, 5)
+    assert (batch.written, batch.dropped) == (3, 0)
+    # Back to bank 0, which still holds 5
+    batch.write(13, 0xa0)
+    batch.write(0, 5)
+    assert (batch.written, batch.dropped) == (4, 1)
+
+def test_8930_r15_is_not_a_bank_select():
+    batch = WriteBatch(BusTiming("8930"))
+    batch.write(0, 5)
+    batch.write(15, 0xb0)
+    batch.write(0, 5)
+    assert batch.dropped == 1
+
+def test_hard_ay_page_from_r15():
+    batch = WriteBatch(BusTiming("HardAY"))
+    batch.write(0, 5)
+    for select in (0xb0, 0xe0):
+        batch.write(15, select)
+        batch.write(0, 5)
+    batch.write(15, 0x00)
+    batch.write(0, 5)
+    assert (batch.written, batch.dropped) == (6, 1)
+
+@pytest.mark.parametrize("chip", ["8910", "YM2149"])
+def test_r15_is_an_io_port(chip):
+    batch = WriteBatch(BusTiming(chip))
+    batch.write(0, 5)
+    batch.write(15, 0xb0)
+    batch.write(0, 5)
+    assert batch.dropped == 1
+
+@pytest.mark.parametrize("chip", sorted(CHIPS))
+def test_bus_timing(chip):
+    timing = BusTiming(chip)
+    pio_freq = timing.pio_freq
+    chip = CHIPS[chip]
+    # The strobe covers the access time and the 2-cycle input synchronizer
+    assert 2*timing.read + 4 >= _ticks(chip["read_access"], pio_freq) + 1
+    assert 2*timing.write + 3 >= _ticks(chip["write_pulse"], pio_freq)
+    assert 2*timing.address + 4 >= _ticks(chip["address_setup"], pio_freq)
+
+def test_8930_write_setup_to_end_of_pulse():
+    timing = BusTiming("8930")
+    assert 2*timing.write + 3 >= _ticks(CHIPS["8930"]["write_setup"],
+                                        timing.pio_freq)
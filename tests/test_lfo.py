@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.generators.lfo import LFO
+from rtl.generators.lfo_model import LFOModel, RAMP, SINE, TRIANGLE
+
+# The LFO against its reference model, lfo_model.py
+
+def _simulate(dut, testbench):
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+
+async def _write(ctx, dut, address, value, select=0, mask=0):
+    ctx.set(dut.address, address)
+    ctx.set(dut.data_in, value)
+    ctx.set(dut.write_select, select)
+    ctx.set(dut.write_mask, mask)
+    ctx.set(dut.write_enable, 1)
+    await ctx.tick()
+    ctx.set(dut.write_enable, 0)
+
+async def _update(ctx, dut):
+    ctx.set(dut.update, 1)
+    await ctx.tick()
+    ctx.set(dut.update, 0)
+    await ctx.tick().repeat(dut.update_cycles)
+
+async def _read(ctx, dut, count):
+    out = []
+    for i in range(0, count):
+        ctx.set(dut.address, i)
+        await ctx.tick()
+        out.append(ctx.get(dut.data_out))
+    return out
+
+@pytest.mark.parametrize("count,lanes,multiplier_delay", [
+    (5, 1, 1),
+    (6, 2, 2),
+    (7, 3, 1),
+])
+def test_matches_model(count, lanes, multiplier_delay):
+    dut = LFO(count, multiplier_delay=multiplier_delay, lanes=lanes)
+    model = LFOModel(count)
+    rng = np.random.default_rng(count)
+
+    async def testbench(ctx):
+        for i in range(0, count):
+            f = int(rng.integers(0, 2**16)) >> (i % 4) * 3
+            await _write(ctx, dut, i, f)
+            model.write_phase_increment(i, f)
+        for step in range(0, 24):
+            # New commands every few updates, some partial
+            if step % 4 == 0:
+                for i in range(0, count):
+                    wfdr = int(rng.integers(0, 16))
+                    mask = int(rng.choice([0b1111, 0b1100, 0b0011, 0]))
+                    await _write(ctx, dut, i, wfdr, 1, mask)
+                    model.write_wfdr(i, wfdr, mask)
+            await _update(ctx, dut)
+            model.update()
+            assert await _read(ctx, dut, count) == list(model.read()), \
+                f"after update {step}"
+    _simulate(dut, testbench)
+
+def test_config_port_matches_model():
+    dut = LFO(4, lanes=2)
+    model = LFOModel(4)
+
+    async def testbench(ctx):
+        for i, waveform in enumerate((RAMP, TRIANGLE, SINE, SINE)):
+            ctx.set(dut.config_write, 1)
+            ctx.set(dut.config_address, i)
+            ctx.set(dut.config_phase_increment, 1500*(i + 1))
+            ctx.set(dut.config_wfdr, (waveform << 2) | (i & 1) << 1 | 1)
+            ctx.set(dut.config_wfdr_mask, 0b1111)
+            await ctx.tick()
+            model.write_phase_increment(i, 1500*(i + 1))
+            model.write_wfdr(i, (waveform << 2) | (i & 1) << 1 | 1, 0b1111)
+        ctx.set(dut.config_write, 0)
+        expected = model.render(10)
+        for step in range(0, 10):
+            await _update(ctx, dut)
+            assert await _read(ctx, dut, 4) == list(expected[step])
+    _simulate(dut, testbench)
+
+@pytest.mark.parametrize("lanes", [1, 2])
+def test_command_racing_update_is_applied(lanes):
+    # With a command pending, a reset written at any point in an update
+    # is applied by that update or the next, never lost
+    count = 4
+    dut = LFO(count, lanes=lanes)
+    f = 1000
+
+    async def testbench(ctx):
+        for i in range(0, count):
+            await _write(ctx, dut, i, f)
+        for offset in range(0, dut.update_cycles + 2):
+            for i in range(0, count):
+                await _write(ctx, dut, i, 0b0001, 1, 0b1111)
+            await _update(ctx, dut)
+            # Oscillators are at 0; set Direction next update
+            for i in range(0, count):
+                await _write(ctx, dut, i, 0b0010, 1, 0b0010)
+            # Pulse update on cycle 2, and write oscillator i on cycle
+            # i + offset
+            ctx.set(dut.write_select, 1)
+            ctx.set(dut.write_mask, 0b0011)
+            ctx.set(dut.data_in, 0b0001)
+            for cycle in range(0, count + offset + dut.update_cycles):
+                i = cycle - offset
+                ctx.set(dut.update, cycle == 2)
+                ctx.set(dut.address, max(0, min(i, count - 1)))
+                ctx.set(dut.write_enable, 0 <= i < count)
+                await ctx.tick()
+            ctx.set(dut.write_enable, 0)
+            await _update(ctx, dut)
+            # Reset by the first update, or the second
+            assert set(await _read(ctx, dut, count)) <= {0, f}, \
+                f"offset {offset}"
+            # Then nothing is pending
+            await _update(ctx, dut)
+            assert set(await _read(ctx, dut, count)) <= {f, 2*f}, \
+                f"offset {offset}"
+    _simulate(dut, testbench)
+
+def test_wfdr_dropped():
+    dut = LFO(3)
+
+    async def testbench(ctx):
+        await _write(ctx, dut, 1, 0b0100, 1, 0b0100)
+        assert not ctx.get(dut.wfdr_dropped)
+        await _write(ctx, dut, 1, 0b0010, 1, 0b0010)
+        assert not ctx.get(dut.wfdr_dropped)
+        await _write(ctx, dut, 1, 0b0000, 1, 0b0100)
+        assert ctx.get(dut.wfdr_dropped)
+        await ctx.tick()
+        await _update(ctx, dut)
+        await _write(ctx, dut, 1, 0b0000, 1, 0b0100)
+        assert not ctx.get(dut.wfdr_dropped)
+    _simulate(dut, testbench)
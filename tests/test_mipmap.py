@@ -0,0 +1,51 @@
+from fractions import Fraction
+import pytest
+from amaranth.sim import Simulator
+from rtl.generators.mipmap import MipmapSelector
+from rtl.generators.wavetable import base_frequencies
+
+# The mipmap selector against the table choice worked out from the base
+# frequencies
+
+def reference(increment: int, frequencies, sample_rate: int,
+              blend_window: int) -> tuple:
+    """(level, blend) for a phase increment, in exact arithmetic"""
+    def increment_of(frequency):
+        return Fraction(frequency) * 2**24 / sample_rate
+    level = next((i for i, f in enumerate(frequencies[:-1])
+                  if increment <= increment_of(f)), len(frequencies) - 1)
+    blend = level > 0 and increment <= increment_of(
+        Fraction(frequencies[level - 1]) * (1 + Fraction(1, 2**blend_window)))
+    return level, int(blend)
+
+@pytest.mark.parametrize("blend_window", [1, 3])
+def test_mipmap_matches_reference(blend_window):
+    sample_rate = 96000
+    frequencies = base_frequencies()
+    dut = MipmapSelector(sample_rate, blend_window=blend_window)
+    # Just below, at, and just above each table boundary and the end of
+    # each blend window, then above the top boundary, and the extremes
+    increments = {0, 1, 2**24 - 1}
+    for f in frequencies[:-1]:
+        for edge in (f, f * (1 + Fraction(1, 2**blend_window))):
+            x = int(Fraction(edge) * 2**24 / sample_rate)
+            increments |= {x - 1, x, x + 1}
+    top = int(Fraction(frequencies[-2]) * 2**24 / sample_rate)
+    increments |= {top + 1000, top * 2}
+    seen = set()
+
+    async def testbench(ctx):
+        for increment in sorted(increments):
+            ctx.set(dut.increment, increment)
+            await ctx.delay(1e-6)
+            result = (ctx.get(dut.level), ctx.get(dut.blend))
+            assert result == reference(increment, frequencies, sample_rate,
+                                       blend_window), increment
+            seen.add(result)
+
+    sim = Simulator(dut)
+    sim.add_testbench(testbench)
+    sim.run()
+    # Every level was reached, with and without the blend
+    assert {level for level, blend in seen} == set(range(0, dut.levels))
+    assert {(level, 1) for level in range(1, dut.levels)} <= seen
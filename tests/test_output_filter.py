@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.output_filter import HalfBandFilter
+from rtl.output_filter_model import HalfBandModel
+
+# The half-band output filter against its reference model,
+# output_filter_model.py
+
+# The last channel is disabled
+ENABLE = [1, 1, 1, 0]
+
+@pytest.mark.parametrize("taps, multipliers, multiplier_delay, decimate", [
+    (11, 1, 1, False),
+    (11, 2, 2, True),
+    (11, 3, 1, False),
+    (31, 1, 2, False),
+    (31, 3, 3, True),
+])
+def test_halfband_matches_model(taps, multipliers, multiplier_delay,
+                                decimate):
+    channels = len(ENABLE)
+    dut = HalfBandFilter(channels, taps, multipliers, multiplier_delay,
+                         decimate)
+    model = HalfBandModel(channels, taps, decimate)
+    model.enable = np.array(ENABLE, dtype=bool)
+    rng = np.random.default_rng(taps + multipliers)
+    # Full-scale noise, then a square wave whose overshoot saturates
+    x = np.concatenate([
+        rng.integers(-2**23, 2**23, (2*taps, channels)),
+        np.repeat([[2**23 - 1], [-2**23]], taps, axis=0)
+            .repeat(channels, axis=1),
+    ])
+    expected = model.render(x)
+    out = np.zeros_like(expected)
+    taken = [0]*channels
+
+    async def testbench(ctx):
+        for channel, enable in enumerate(ENABLE):
+            ctx.set(dut.channel_select, channel)
+            ctx.set(dut.enable, enable)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+
+        # A channel isn't presented again within latency cycles
+        interval = max(dut.initiation_interval,
+                       -(-dut.latency // channels))
+        items = [(n, c) for n in range(0, len(x))
+                 for c in range(0, channels)]
+        for cycle in range(0, len(items)*interval + dut.latency + 1):
+            item = cycle // interval
+            valid = cycle % interval == 0 and item < len(items)
+            if valid:
+                n, c = items[item]
+                ctx.set(dut.sample, int(x[n, c]))
+                ctx.set(dut.channel, c)
+            ctx.set(dut.valid, valid)
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                c = ctx.get(dut.out_channel)
+                out[taken[c], c] = ctx.get(dut.out)
+                taken[c] += 1
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    assert taken == [len(expected)]*channels
+    assert len(expected) == (len(x) // 2 if decimate else len(x))
+    np.testing.assert_array_equal(out, expected)
+    # The square wave's overshoot did saturate
+    assert (np.abs(expected[:, 0]) == 2**23 - 1).any() \
+        or (expected[:, 0] == -2**23).any()
@@ -0,0 +1,116 @@
+import pytest
+from ay38930.emulator import pio
+from ay38930.emulator.pio import asm_pio, PIO, StateMachine
+from ay38930.emulator.throughput import VARIANTS, run
+
+# The PIO emulator's clock dividers, autopull, and input synchronizer,
+# which the bus timings rest on, then PIOInterface against the emulated
+# chips
+
+@asm_pio(set_init=PIO.OUT_LOW)
+def toggle():
+    set(pins, 1)
+    set(pins, 0)
+
+@asm_pio(out_init=(PIO.OUT_LOW,)*8, out_shiftdir=PIO.SHIFT_RIGHT,
+         autopull=True, pull_thresh=16)
+def out_bytes():
+    out(pins, 8)
+
+@asm_pio(in_shiftdir=PIO.SHIFT_LEFT, autopush=True, push_thresh=8)
+def sample():
+    in_(pins, 8)
+
+@asm_pio(set_init=PIO.OUT_LOW)
+def wait_high():
+    wait(1, pin, 0)
+    set(pins, 1)
+    label("done")
+    jmp("done")
+
+def edges(system: pio.System, pin: int) -> list:
+    """Record the cycles at which a pin changes level"""
+    out = []
+    last = [0]
+
+    def observer(system):
+        level = (system.levels()[0] >> pin) & 1
+        if level != last[0]:
+            out.append(system.cycle)
+            last[0] = level
+
+    system.observers.append(observer)
+    return out
+
+@pytest.mark.parametrize("freq, gaps", [(125_000_000, {1}),
+                                        (50_000_000, {2, 3}),
+                                        (10_000_000, {12, 13})])
+def test_fractional_divider(freq, gaps):
+    system = pio.reset(125_000_000)
+    toggled = edges(system, 0)
+    sm = StateMachine(0, toggle, freq=freq, set_base=0)
+    sm.active(1)
+    system.run(10_000)
+    # One instruction per edge, spaced by the 16.8 divider with its
+    # jitter, and on average at freq
+    assert {b - a for a, b in zip(toggled, toggled[1:])} == gaps
+    divider = 125_000_000 / freq
+    assert abs((toggled[-1] - toggled[0]) / (len(toggled) - 1)
+               - divider) < 1 / len(toggled)
+
+def test_autopull_threshold():
+    system = pio.reset()
+    sm = StateMachine(0, out_bytes, out_base=0)
+    sm.put(0xaabbccdd)
+    sm.put(0x11223344)
+    seen = []
+    system.observers.append(
+        lambda system: seen.append(system.levels()[0] & 0xff))
+    sm.active(1)
+    system.run(20)
+    # Two bytes from each word, the threshold throwing away the rest,
+    # then a stall on the empty FIFO
+    assert seen[:4] == [0xdd, 0xcc, 0x44, 0x33]
+    assert set(seen[4:]) == {0x33}
+    assert sm.idle()
+    # pull_thresh given to init overrides the program's
+    system = pio.reset()
+    sm = StateMachine(0, out_bytes, out_base=0, pull_thresh=24)
+    sm.put(0xaabbccdd)
+    sm.active(1)
+    seen = []
+    system.observers.append(
+        lambda system: seen.append(system.levels()[0] & 0xff))
+    system.run(5)
+    assert seen == [0xdd, 0xcc, 0xbb, 0xbb, 0xbb]
+
+def test_inputs_two_cycles_late():
+    system = pio.reset()
+    # Each cycle's level is its cycle number, driven at the end of the
+    # cycle before
+    system.drive(0, 8, 0)
+    system.observers.append(
+        lambda system: system.drive(0, 8, (system.cycle + 1) & 0xff))
+    sm = StateMachine(0, sample, in_base=0)
+    system.run(10)
+    sm.active(1)
+    system.run(4)
+    assert [sm.get() for i in range(0, 4)] == [8, 9, 10, 11]
+
+def test_wait_two_cycles_late():
+    system = pio.reset()
+    raised = edges(system, 1)
+    sm = StateMachine(0, wait_high, in_base=0, set_base=1)
+    sm.active(1)
+    system.run(10)
+    system.drive(0, 1, 1)
+    driven = system.cycle
+    system.run(10)
+    # Two cycles through the synchronizer, then a cycle for the SET
+    assert raised == [driven + 3]
+
+@pytest.mark.parametrize("name, chip, clock_freq", VARIANTS,
+                         ids=[name for name, _, _ in VARIANTS])
+def test_emulated_chip(name, chip, clock_freq):
+    result = run(chip, clock_freq, writes=64, reads=16)
+    assert result["errors"] == []
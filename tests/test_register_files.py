@@ -0,0 +1,180 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.register_files import (RegisterFiles, BankDecoder, FILES,
+                                CHANNELS_PER_FILE)
+from rtl.generators.lfo import LFO
+from rtl.generators.lfo_model import LFOModel
+from rtl.svf import StateVariableFilter, LOW_PASS, BAND_PASS, HIGH_PASS, \
+    NOTCH
+from rtl.svf_model import SVFModel
+from rtl.control_unit import ControlUnit
+
+# The bank decoder over contiguous and sparse register files, and a
+# unit addressed through it
+
+FILE_SETS = [1, 4, 16, (0, 2, 5), (0, 15)]
+
+def _address(file: int, channel: int) -> int:
+    # BankAddressLayout as an integer
+    return file << 2 | channel
+
+def _simulate(dut, testbench, clock: bool = True):
+    sim = Simulator(dut)
+    if clock:
+        sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+
+@pytest.mark.parametrize("files", FILE_SETS)
+def test_register_files(files):
+    files = RegisterFiles(files)
+    assert files.channels == CHANNELS_PER_FILE * len(files.implemented)
+    dense = [files.channel(f, c) for f in range(0, FILES)
+             for c in range(0, 4)]
+    assert sorted(x for x in dense if x is not None) \
+        == list(range(0, files.channels))
+
+@pytest.mark.parametrize("read_latency", [0, 1, 2])
+@pytest.mark.parametrize("files", FILE_SETS)
+def test_decoder(files, read_latency):
+    files = RegisterFiles(files)
+    dut = BankDecoder(files, read_latency=read_latency)
+
+    async def step(ctx):
+        # Without a read latency, the decoder has no clock
+        if read_latency:
+            await ctx.tick()
+        else:
+            await ctx.delay(1e-6)
+
+    async def testbench(ctx):
+        addresses = [(f, c) for f in range(0, FILES) for c in range(0, 4)]
+        for f, c in addresses:
+            ctx.set(dut.address.as_value(), _address(f, c))
+            channel = files.channel(f, c)
+            assert ctx.get(dut.implemented) == (channel is not None)
+            # Reads stay in the unit's memories
+            assert ctx.get(dut.select) == (channel or 0), (f, c)
+            await step(ctx)
+        # data_out follows the address through the read latency
+        ctx.set(dut.read_data, 0x1234)
+        for i, (f, c) in enumerate(addresses + [(0, 0)]*read_latency):
+            ctx.set(dut.address.as_value(), _address(f, c))
+            if i >= read_latency:
+                f, c = addresses[i - read_latency]
+                expected = 0x1234 if files.channel(f, c) is not None else 0
+                assert ctx.get(dut.data_out) == expected, (f, c)
+            await step(ctx)
+
+    _simulate(dut, testbench, read_latency > 0)
+
+def test_unit_drops_unimplemented_files():
+    files = RegisterFiles((0, 2, 5))
+    dut = LFO(files.channels, files=files)
+    model = LFOModel(files.channels)
+
+    async def testbench(ctx):
+        # Every address, so a write that wasn't dropped would land on
+        # an implemented channel
+        for f in range(0, FILES):
+            for c in range(0, 4):
+                value = 1000*f + 300*c + 1
+                ctx.set(dut.address.as_value(), _address(f, c))
+                ctx.set(dut.data_in, value)
+                ctx.set(dut.write_enable, 1)
+                await ctx.tick()
+                channel = files.channel(f, c)
+                if channel is not None:
+                    model.write_phase_increment(channel, value)
+        ctx.set(dut.write_enable, 0)
+        for step in range(0, 3):
+            ctx.set(dut.update, 1)
+            await ctx.tick()
+            ctx.set(dut.update, 0)
+            await ctx.tick().repeat(dut.update_cycles)
+            model.update()
+        expected = model.read()
+        for f in range(0, FILES):
+            for c in range(0, 4):
+                ctx.set(dut.address.as_value(), _address(f, c))
+                await ctx.tick()
+                channel = files.channel(f, c)
+                assert ctx.get(dut.data_out) == \
+                    (0 if channel is None else expected[channel]), (f, c)
+
+    _simulate(dut, testbench)
+
+def test_svf_on_sparse_files():
+    files = RegisterFiles((0, 2, 5))
+    channels = files.channels
+    dut = StateVariableFilter(channels, files=files)
+    model = SVFModel(channels)
+    rng = np.random.default_rng(5)
+    x = rng.integers(-2**22, 2**22, (24, channels))
+    # Different registers at every address, file zero first, so a write
+    # that wasn't dropped, or landed on the wrong channel, shows
+    writes = []
+    for f in range(0, FILES):
+        for c in range(0, 4):
+            registers = (1000 + 997*(4*f + c), 20000 + 311*(4*f + c),
+                         (LOW_PASS, BAND_PASS, HIGH_PASS, NOTCH)[c], 1)
+            writes.append((f, c, registers))
+            channel = files.channel(f, c)
+            if channel is not None:
+                model.write(channel, *registers)
+    expected = model.render(x)
+    out = np.zeros_like(x)
+    taken = [0]*channels
+
+    async def testbench(ctx):
+        for f, c, (freq, q, mode, enable) in writes:
+            ctx.set(dut.channel_select.as_value(), _address(f, c))
+            ctx.set(dut.f, freq)
+            ctx.set(dut.q, q)
+            ctx.set(dut.mode, mode)
+            ctx.set(dut.enable, enable)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+        # The sample path takes the dense channel
+        items = [(n, c) for n in range(0, len(x))
+                 for c in range(0, channels)]
+        interval = dut.initiation_interval
+        for cycle in range(0, len(items)*interval + dut.latency + 1):
+            item = cycle // interval
+            valid = cycle % interval == 0 and item < len(items)
+            if valid:
+                n, c = items[item]
+                ctx.set(dut.sample, int(x[n, c]))
+                ctx.set(dut.channel, c)
+            ctx.set(dut.valid, valid)
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                c = ctx.get(dut.out_channel)
+                out[taken[c], c] = ctx.get(dut.out)
+                taken[c] += 1
+
+    _simulate(dut, testbench)
+    assert taken == [len(x)]*channels
+    np.testing.assert_array_equal(out, expected)
+
+@pytest.mark.parametrize("files, channels", [(1, 3), (4, 12),
+                                             ((0, 2, 5), 9)])
+def test_control_unit_files(files, channels):
+    # files sets channels, whatever channels is given
+    dut = ControlUnit(channels=48, files=files)
+    assert dut.channels == channels
+    assert dut.files.channels == channels
+    for unit in (dut.lfo, dut.tone, dut.svf, dut.bitcrusher):
+        assert unit.decoder is not None and unit.decoder.files is dut.files
+    outputs = set()
+
+    async def testbench(ctx):
+        for cycle in range(0, 3*dut.schedule.budget):
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                outputs.add(ctx.get(dut.out_channel))
+
+    _simulate(dut, testbench)
+    assert outputs == set(range(0, channels))
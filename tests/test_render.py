@@ -0,0 +1,162 @@
+import struct
+import numpy as np
+import pytest
+from rtl.generators.psg_model import (PSGModel, amplitude_table, MODE_8910,
+                                      MODE_YM2149)
+from rtl.sim.render import render_file
+from rtl.sim.writelog import (WriteLog, dumps, loads, _import_ym,
+                              _import_vgm)
+
+# The YM and VGM importers, the PSG model's envelopes, and rendering
+# register files of a log
+
+def vgm(commands: bytes, kind: int = 0x00, dual: bool = False,
+        clock: int = 1_789_772, samples: int = 0) -> bytes:
+    """A VGM 1.71 file with an AY-3-8910 family chip"""
+    header = bytearray(0x100)
+    header[0:4] = b"Vgm "
+    struct.pack_into("<I", header, 0x08, 0x171)
+    struct.pack_into("<I", header, 0x18, samples)
+    struct.pack_into("<I", header, 0x34, 0x100 - 0x34)
+    struct.pack_into("<I", header, 0x74,
+                     clock | (0x40000000 if dual else 0))
+    header[0x78] = kind
+    return bytes(header) + commands + b"\x66"
+
+def writes(log: WriteLog) -> list:
+    return list(zip(log.time.tolist(), log.address.tolist(),
+                    log.data.tolist()))
+
+def test_ym3():
+    frames = np.arange(0, 3*14, dtype=np.uint8).reshape(3, 14)
+    frames[1, 13] = 0xff
+    # Interleaved:  every frame of R0, then every frame of R1, ...
+    log = _import_ym(b"YM3!" + frames.T.tobytes())
+    assert (log.clock, log.rate, log.length, log.chips) \
+        == (2_000_000, 50, 3, True)
+    assert writes(log)[0] == (0, 15, 0x10)
+    # Registers masked to their widths, and R13 = 0xFF skipped
+    masks = [0xff, 0x0f]*3 + [0x1f, 0x3f] + [0x1f]*3 + [0xff]*3
+    assert writes(log)[1:15] == [(0, r, r & masks[r])
+                                 for r in range(0, 14)]
+    assert [x for x in writes(log) if x[0] == 1 and x[1] == 13] == []
+    assert len(log) == 1 + 3*14 - 1
+
+def test_ym5():
+    frames = np.random.default_rng(0).integers(0, 256, (4, 16),
+                                               dtype=np.uint8)
+    header = (b"YM5!LeOnArD!"
+              + struct.pack(">IIHIHIH", 4, 0, 0, 1_000_000, 60, 0, 0)
+              + b"name\0author\0\0")
+    log = _import_ym(header + frames.tobytes())
+    assert (log.clock, log.rate, log.length) == (1_000_000, 60, 4)
+    assert writes(log)[-1] == (3, 13, frames[3, 13])
+    with pytest.raises(ValueError, match="truncated"):
+        _import_ym(header + frames.tobytes()[:-1])
+
+def test_vgm_dual_chip():
+    log = _import_vgm(vgm(b"\xa0\x00\x40"       # chip 0 R0
+                          + b"\x61\x10\x00"     # wait 16 samples
+                          + b"\xa0\x88\x0f"     # chip 1 R8
+                          + b"\xa0\x0e\x55",    # chip 0 R14, dropped
+                          dual=True, samples=100))
+    assert log.chips and (log.clock, log.rate) == (1_789_772, 44100)
+    assert writes(log) == [(0, 0x00, 0x40), (16, 0x18, 0x0f)]
+    assert log.length == 100
+
+def test_vgm_ym2149_selects_each_chip():
+    log = _import_vgm(vgm(b"\xa0\x07\x3e", kind=0x10, dual=True))
+    assert writes(log) == [(0, 0x0f, 0x10), (0, 0x1f, 0x10),
+                           (0, 0x07, 0x3e)]
+
+def test_vgm_8930_mode_nibble_moves_to_r15():
+    log = _import_vgm(vgm(b"\xa0\x0d\xa9\xa0\x8d\xb4", kind=0x03,
+                          dual=True))
+    assert writes(log) == [(0, 0x0f, 0xa0), (0, 0x0d, 0x09),
+                           (0, 0x1f, 0xb0), (0, 0x1d, 0x04)]
+
+def test_chips_flag_round_trip():
+    log = _import_vgm(vgm(b"\xa0\x00\x40", dual=True))
+    assert loads(dumps(log)).chips
+    assert not loads(dumps(WriteLog(1, 1))).chips
+    with pytest.raises(ValueError, match="flags"):
+        loads(dumps(WriteLog(1, 1))[:12] + b"\x02\0\0\0\x01")
+
+def envelope_reference(shape: int, steps: int, count: int) -> list:
+    """Envelope level at each step, from the datasheet's shapes"""
+    if not shape & 8:
+        shape = 15 if shape & 4 else 9
+    out = []
+    for step in range(0, count):
+        cycle, up = divmod(step, steps)
+        down = steps - 1 - up
+        first = cycle == 0
+        out.append({
+            8: down,
+            9: down if first else 0,
+            10: down if cycle % 2 == 0 else up,
+            11: down if first else steps - 1,
+            12: up,
+            13: up if first else steps - 1,
+            14: up if cycle % 2 == 0 else down,
+            15: up if first else 0,
+        }[shape])
+    return out
+
+@pytest.mark.parametrize("mode, steps", [(MODE_8910, 16),
+                                         (MODE_YM2149, 32)])
+@pytest.mark.parametrize("shape", range(0, 16))
+def test_envelope_shapes(shape, mode, steps):
+    model = PSGModel(mode)
+    # Everything off in the mixer, so the gate is open, and channel A
+    # on the envelope
+    model.write(7, 0x3f)
+    model.write(8, 0x10)
+    model.write(11, 3)
+    model.write(13, shape)
+    # Ticks per step
+    period = 3 * (2 if steps == 16 else 1)
+    count = 4*steps
+    out = model.render(np.arange(0, count) * period, count * period)
+    expected = amplitude_table(steps)[envelope_reference(shape, steps,
+                                                          count)]
+    np.testing.assert_array_equal(out[:, 0], expected)
+    assert not out[:, 1:].any()
+
+def tone(chip: int) -> bytes:
+    # Tone A at period 0x40, full amplitude, on one chip
+    return b"".join(bytes([0xa0, (chip << 7) | r, x])
+                    for r, x in ((0, 0x40), (7, 0x3e), (8, 0x0f)))
+
+def render(log: WriteLog, index: int) -> tuple:
+    out = np.zeros((log.length * 96000) // log.rate, dtype=np.int64)
+    return render_file(log, index, out), out
+
+def test_render_dual_chip():
+    log = _import_vgm(vgm(tone(0) + tone(1), dual=True, samples=441))
+    for index in (0, 1):
+        result, out = render(log, index)
+        assert result == {"writes": 3, "ignored": 0}
+        assert out.max() == amplitude_table(16)[15]
+
+def test_render_8930_second_chip_bank():
+    # The second chip selects expanded bank 1, which isn't modeled
+    log = _import_vgm(vgm(b"\xa0\x8d\xb0" + tone(1), kind=0x03, dual=True,
+                          samples=441))
+    result, out = render(log, 1)
+    # R13 and the tone registers all land in bank 1
+    assert result == {"writes": 4, "ignored": 4}
+    assert not out.any()
+
+def test_render_enhanced_files():
+    # One chip with register files:  file 1 is heard only in enhanced
+    # mode, and counted as ignored before it
+    body = [(0, 0x00, 0x40), (0, 0x07, 0x3e), (0, 0x08, 0x0f)]
+    file1 = [(t, a | 0x10, d) for t, a, d in body]
+    log = WriteLog(1_789_772, 100, *zip(*(body + file1)), length=1)
+    assert render(log, 1)[0] == {"writes": 0, "ignored": 3}
+    log = WriteLog(1_789_772, 100,
+                   *zip(*([(0, 0x0f, 0xc0)] + body + file1)), length=1)
+    result, out = render(log, 1)
+    assert result == {"writes": 3, "ignored": 0}
+    assert out.any()
@@ -0,0 +1,106 @@
+import gc
+import pytest
+from amaranth.sim import Simulator
+from rtl.control_unit import ControlUnit, read_counters
+from rtl.schedule import Stage, Schedule
+
+# The modulo schedule, and the control unit running on it
+
+# A control unit that fails to build leaves its units unelaborated
+pytestmark = pytest.mark.filterwarnings(
+    "ignore::amaranth.hdl.UnusedElaboratable")
+
+def test_stages_overlap_across_periods():
+    # Each stage takes its items in 64 of the 100 cycles, but the chain
+    # takes longer than a period
+    schedule = Schedule([
+        Stage("a", latency=40, interval=2, items=32),
+        Stage("b", latency=30, interval=2, items=32, after=("a",)),
+    ], clock=100, sample_rate=1)
+    assert schedule.start == {"a": 0, "b": 40}
+    assert schedule.length == 132
+    assert schedule.offset == {"a": 0, "b": 40}
+    # a works on cycles 0 to 101 and b on 40 to 131, so every cycle
+    assert schedule.headroom == 0
+    assert schedule.minimum_clock == 64
+
+def test_stage_that_cannot_keep_up():
+    with pytest.raises(ValueError, match="at least 128Hz"):
+        Schedule([Stage("a", latency=1, interval=4, items=32)],
+                 clock=100, sample_rate=1)
+
+def test_multiplier_windows_wrap():
+    # a holds its multiplier on cycles 80 to 119, so 80 to 99 and 0 to
+    # 19 of the period; b, ready at 0, must wait until cycle 20
+    schedule = Schedule([
+        Stage("x", latency=80),
+        Stage("a", latency=39, after=("x",), multipliers=1),
+        Stage("b", latency=10, multipliers=1),
+    ], clock=100, sample_rate=1, multipliers=1)
+    assert schedule.start["a"] == 80
+    assert schedule.start["b"] == 20
+
+def test_lag():
+    # r reads w's results without waiting for them:  before w writes,
+    # it sees the update from the last sample
+    stages = [
+        Stage("r", latency=1, items=10, reads=("w",)),
+        Stage("w", latency=5),
+    ]
+    schedule = Schedule(stages, clock=100, sample_rate=1)
+    assert schedule.lag == {"r": {"w": (1, 0)}}
+    # Read after w finishes, the update is this sample's
+    stages[0] = Stage("r", latency=1, items=10, after=("x",),
+                      reads=("w",))
+    schedule = Schedule(stages + [Stage("x", latency=20)],
+                        clock=100, sample_rate=1)
+    assert schedule.lag == {"r": {"w": (0, 0)}}
+
+def test_too_many_interpolators():
+    with pytest.raises(ValueError, match="4 interpolators"):
+        ControlUnit(interpolators=4)
+    # Warn about the units it left here, not in a later test
+    gc.collect()
+
+@pytest.mark.parametrize("multipliers", [None, 6])
+def test_48_channels_at_9_216MHz(multipliers):
+    dut = ControlUnit(files=16, clock=9_216_000, counters=True,
+                      multipliers=multipliers)
+    budget = dut.schedule.budget
+    assert budget == 96 and dut.schedule.length > budget
+    outputs = []
+
+    async def testbench(ctx):
+        for cycle in range(0, 4*budget):
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                outputs.append((cycle, ctx.get(dut.out_channel)))
+        counters = await read_counters(ctx, dut)
+        assert counters["overruns"] == 0
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    # Every channel comes out once a period, in order
+    channels = [c for cycle, c in outputs]
+    first = channels.index(0)
+    assert channels[first:first + 2*48] == 2*list(range(0, 48))
+
+def test_resources_budget_matches_schedule():
+    # The resource sweep budgets each unit as the control unit schedules
+    # it, so 48 channels fit 9.216MHz there too
+    from rtl.synth.resources import GENERATORS
+    dut = ControlUnit(files=16, clock=9_216_000)
+    units = {
+        "LFO": ("lfo", dut.lfo),
+        "ToneGenerator": ("tone", dut.tone),
+        "StateVariableFilter": ("svf", dut.svf),
+    }
+    for generator, (name, unit) in units.items():
+        cycles = GENERATORS[generator][1](unit).cycles
+        assert cycles == dut.schedule.stages[name].cycles
+        assert cycles <= dut.schedule.budget
+    # The units are never elaborated; warn about them here, if at all
+    del dut, units, unit
+    gc.collect()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import pytest
+from amaranth import *
+from amaranth.lib import data
+from rtl.generators.lfo import LFO
+from rtl.generators.tone_generator import ToneGenerator
+from rtl.register_files import RegisterFiles
+from rtl.sim.simulator import Simulator, design_ports
+
+# The simulation backends agree on the same testbenches
+
+def _have_cxxrtl():
+    return shutil.which(os.environ.get("CXX", "c++")) and any(
+        shutil.which(x) for x in ("yosys", "yowasp-yosys"))
+
+Layout = data.StructLayout({"a": 4, "b": signed(4)})
+
+class _Design(Elaboratable):
+    def __init__(self):
+        self.config = Signal(Layout)
+        self.out = Signal(Layout)
+        self.count = Signal(8)
+        self.x = Signal(8)
+        self.y = Signal(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.sync += [
+            self.out.eq(self.config),
+            self.count.eq(self.count + 1),
+            self.y.eq(self.x),
+        ]
+        return m
+
+def _run(backend):
+    dut = _Design()
+    log = []
+
+    async def first(ctx):
+        ctx.set(dut.config, {"a": 3, "b": -2})
+        log.append(await ctx.tick().sample(dut.count))
+        log.append((ctx.get(dut.out).b, ctx.get(dut.count)))
+        await ctx.delay(3.2e-6)
+        log.append(ctx.get(dut.count))
+        log.append(await ctx.tick().until(dut.count == 10))
+        log.append(ctx.get(dut.count))
+        ctx.set(dut.config.a, 7)
+        await ctx.tick()
+        log.append(ctx.get(dut.out.a))
+
+    async def second(ctx):
+        for i in range(0, 5):
+            ctx.set(dut.x, i + 10)
+            await ctx.tick()
+            log.append((ctx.get(dut.y), ctx.get(dut.config.a)))
+        log.append(await ctx.tick().sample(dut.y).repeat(3))
+        n = 0
+        async for values in ctx.tick().sample(dut.count):
+            log.append(values)
+            n += 1
+            if n == 2:
+                break
+
+    sim = Simulator(dut, backend)
+    sim.add_clock(1e-6)
+    sim.add_testbench(first)
+    sim.add_testbench(second)
+    sim.run()
+    return log
+
+def _ports(dut) -> set:
+    ports = {name for name, value, direction in design_ports(dut)}
+    Fragment.get(dut, None)
+    return ports
+
+def test_design_ports_include_views():
+    assert {"config", "out"} <= _ports(_Design())
+    assert "config" in _ports(ToneGenerator())
+    assert "address" in _ports(LFO(3, files=RegisterFiles(1)))
+
+@pytest.mark.skipif(not _have_cxxrtl(), reason="needs Yosys and a C++ compiler")
+def test_cxxrtl_matches_pysim(tmp_path, monkeypatch):
+    monkeypatch.setenv("HARDAY_CACHE_DIR", str(tmp_path))
+    assert _run("cxxrtl") == _run("pysim")
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.svf import StateVariableFilter, LOW_PASS, BAND_PASS, HIGH_PASS, \
+    NOTCH
+from rtl.svf_model import SVFModel
+
+# The state variable filter against its reference model, svf_model.py
+
+# (f, q, mode, enable) for each channel:  a gentle low-pass, a resonant
+# band-pass that saturates, a high-pass, a notch, and a disabled filter
+REGISTERS = [
+    (4000, 20000, LOW_PASS, 1),
+    (30000, 500, BAND_PASS, 1),
+    (12000, 32768, HIGH_PASS, 1),
+    (20000, 45000, NOTCH, 1),
+    (9000, 20000, LOW_PASS, 0),
+]
+
+@pytest.mark.parametrize("multiplier_delay", [1, 2, 3])
+def test_svf_matches_model(multiplier_delay):
+    channels = len(REGISTERS)
+    dut = StateVariableFilter(channels, multiplier_delay)
+    model = SVFModel(channels)
+    rng = np.random.default_rng(multiplier_delay)
+    # Full-scale noise, then a square wave to ring the resonant filter
+    x = np.concatenate([
+        rng.integers(-2**23, 2**23, (40, channels)),
+        np.repeat([[2**23 - 1], [-2**23]], 20, axis=0)
+            .repeat(channels, axis=1),
+    ])
+    for channel, registers in enumerate(REGISTERS):
+        model.write(channel, *registers)
+    expected = model.render(x)
+    out = np.zeros_like(x)
+    taken = [0]*channels
+
+    async def testbench(ctx):
+        for channel, (f, q, mode, enable) in enumerate(REGISTERS):
+            ctx.set(dut.channel_select, channel)
+            ctx.set(dut.f, f)
+            ctx.set(dut.q, q)
+            ctx.set(dut.mode, mode)
+            ctx.set(dut.enable, enable)
+            ctx.set(dut.write_enable, 1)
+            await ctx.tick()
+        ctx.set(dut.write_enable, 0)
+
+        items = [(n, c) for n in range(0, len(x))
+                 for c in range(0, channels)]
+        interval = dut.initiation_interval
+        for cycle in range(0, len(items)*interval + dut.latency + 1):
+            item = cycle // interval
+            valid = cycle % interval == 0 and item < len(items)
+            if valid:
+                n, c = items[item]
+                ctx.set(dut.sample, int(x[n, c]))
+                ctx.set(dut.channel, c)
+            ctx.set(dut.valid, valid)
+            await ctx.tick()
+            if ctx.get(dut.out_valid):
+                c = ctx.get(dut.out_channel)
+                out[taken[c], c] = ctx.get(dut.out)
+                taken[c] += 1
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+    assert taken == [len(x)]*channels
+    np.testing.assert_array_equal(out, expected)
+    # The resonant filter did saturate
+    assert np.abs(expected[:, 1]).max() == 2**23 - 1 \
+        or expected[:, 1].min() == -2**23
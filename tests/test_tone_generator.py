@@ -0,0 +1,264 @@
+import numpy as np
+import pytest
+from amaranth.sim import Simulator
+from rtl.generators.interpolator import Interpolator, WavetableROM
+from rtl.generators.tone_generator import ToneGenerator, RAMP, PULSE, \
+    TRIANGLE
+from rtl.generators.wavetable import ramp_tables, base_frequencies
+
+# The interpolator against the arithmetic in interpolator.py, and the
+# tone generator against a reference built on it
+
+def _simulate(dut, testbench):
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_testbench(testbench)
+    sim.run()
+
+def _reference(tables, phase, level, blend):
+    levels, length = tables.shape
+    index_bits = length.bit_length() - 1
+    fraction_bits = 23 - index_bits
+
+    def sample(position):
+        index = position & (length - 1)
+        half = (position >> index_bits) & 1
+        address = (length - 1 - index) if half else index
+        value = int(tables[level, address])
+        if blend and level:
+            value = (value + int(tables[level - 1, address])) >> 1
+        return -value if half else value
+
+    position = phase >> fraction_bits
+    s0 = sample(position)
+    s1 = sample((position + 1) & (2*length - 1))
+    fraction = phase & ((1 << fraction_bits) - 1)
+    return s0 + (((s1 - s0) * fraction) >> fraction_bits)
+
+@pytest.mark.parametrize("interpolators", [1, 2])
+def test_interpolator_matches_reference(interpolators):
+    tables = ramp_tables()
+    rom = WavetableROM(tables)
+    dut = [Interpolator(multiplier_delay=2, rom=rom)
+           for x in range(0, interpolators)]
+    rng = np.random.default_rng(interpolators)
+    # Random phases, and every sample around the middle and the end of
+    # the period, where both samples are the same ROM entry
+    phases = [int(x) for x in rng.integers(0, 2**24, 300)]
+    for edge in (0, 2**23):
+        phases += [(edge + d*2**12) % 2**24 for d in range(-8, 8)]
+    lookups = [(p, int(rng.integers(0, len(tables))),
+                int(rng.integers(0, 2))) for p in phases]
+
+    from amaranth import Module
+    top = Module()
+    top.submodules.rom = rom
+    for i, interpolator in enumerate(dut):
+        top.submodules[f"interpolator_{i}"] = interpolator
+
+    async def testbench(ctx):
+        # Each interpolator looks up its own share, all at once
+        results = [[] for x in dut]
+        shares = [lookups[i::interpolators] for i in range(0, len(dut))]
+        for cycle in range(0, len(shares[0]) + dut[0].latency):
+            for interpolator, share in zip(dut, shares):
+                if cycle < len(share):
+                    phase, level, blend = share[cycle]
+                    ctx.set(interpolator.phase, phase)
+                    ctx.set(interpolator.level, level)
+                    ctx.set(interpolator.blend, blend)
+                ctx.set(interpolator.read, cycle < len(share))
+            await ctx.tick()
+            for interpolator, result in zip(dut, results):
+                if ctx.get(interpolator.valid):
+                    result.append(ctx.get(interpolator.sample))
+        for share, result in zip(shares, results):
+            assert result == [_reference(tables, *x) for x in share]
+    _simulate(top, testbench)
+
+def test_phase_reset_racing_update():
+    # With a reset pending, a second one written at any point in an
+    # update is either merged with it, if it lands before the channel
+    # is read, or applied by the next update
+    channels = 3
+    f = 100000
+    channel = 1
+    dut = ToneGenerator(channels, interpolators=2)
+    rf = dut.register_file
+
+    async def update(ctx):
+        ctx.set(dut.update, 1)
+        await ctx.tick()
+        ctx.set(dut.update, 0)
+        await ctx.tick().repeat(dut.sample_cycles)
+
+    async def testbench(ctx):
+        for c in range(0, channels):
+            ctx.set(dut.channel_select, c)
+            ctx.set(dut.enable, 1)
+            ctx.set(dut.phase_increment, f)
+            ctx.set(dut.wr, 0b0000111)
+            await ctx.tick()
+        ctx.set(dut.wr, 0)
+        # The channel is read on this cycle of the update, counting the
+        # pulse as cycle 0
+        issue = 1 + channel*dut.slots
+        for offset in range(0, issue + 4):
+            await update(ctx)
+            ctx.set(dut.channel_select, channel)
+            ctx.set(dut.wr, 1)
+            await ctx.tick()
+            ctx.set(dut.wr, 0)
+            await ctx.tick()
+            # Pulse on cycle 2; write the second reset on cycle offset
+            for cycle in range(0, offset + dut.sample_cycles):
+                ctx.set(dut.update, cycle == 2)
+                ctx.set(dut.wr, cycle == offset)
+                await ctx.tick()
+            ctx.set(dut.wr, 0)
+            await update(ctx)
+            # Writes land the cycle after they're presented
+            merged = offset + 1 < 2 + issue
+            phase = ctx.get(rf.phase.data[channel]).dry
+            assert phase == (2*f if merged else f), f"offset {offset}"
+            # Then nothing is pending
+            await update(ctx)
+            phase = ctx.get(rf.phase.data[channel]).dry
+            assert phase == (3*f if merged else 2*f), f"offset {offset}"
+    _simulate(dut, testbench)
+
+def test_back_to_back_updates():
+    # Updates every initiation_interval give the samples updates with
+    # idle cycles between them do
+    channels = 3
+
+    def run(gap):
+        dut = ToneGenerator(channels, interpolators=2)
+        samples = []
+        overruns = []
+
+        async def testbench(ctx):
+            for c in range(0, channels):
+                ctx.set(dut.channel_select, c)
+                ctx.set(dut.enable, 1)
+                ctx.set(dut.waveform, c % 3)
+                ctx.set(dut.duty_cycle, 64)
+                ctx.set(dut.phase_increment, 300000*c + 100000)
+                ctx.set(dut.wr, 0b1001111)
+                await ctx.tick()
+            ctx.set(dut.wr, 0)
+            period = dut.initiation_interval + gap
+            for cycle in range(0, 4*period + dut.sample_cycles):
+                ctx.set(dut.update, cycle % period == 0
+                        and cycle < 4*period)
+                overruns.append(ctx.get(dut.overrun))
+                await ctx.tick()
+                if ctx.get(dut.output_valid):
+                    samples.append((ctx.get(dut.output_channel),
+                                    ctx.get(dut.output)))
+        _simulate(dut, testbench)
+        return samples, any(overruns)
+
+    spaced, _ = run(5)
+    samples, overrun = run(0)
+    assert len(spaced) == 4*channels
+    assert samples == spaced and not overrun
+    # One cycle less is an overrun
+    samples, overrun = run(-1)
+    assert overrun
+
+def _naive_triangle(phase):
+    folded = (phase & 0x7fffff) ^ (0x7fffff if phase >> 23 else 0)
+    return 2*folded - (2**23 - 1)
+
+def _tone_reference(registers, updates, sample_rate=96000):
+    """Output of each channel for (updates) updates from phase zero
+    registers:  (waveform, enable, duty_cycle, phase_increment,
+       lfo_offset) for each channel.
+    Returns an (updates, channels) array.
+    """
+    tables = ramp_tables()
+    # The first table at or above the tone, averaged with the one below
+    # within 1/8 of a boundary (see mipmap.py)
+    boundaries = base_frequencies()[:-1]
+
+    def mipmap(increment):
+        frequency = increment * sample_rate / 2**24
+        level = sum(frequency > x for x in boundaries)
+        blend = level > 0 and frequency <= boundaries[level - 1] * 9/8
+        return level, int(blend)
+
+    out = np.zeros((updates, len(registers)), dtype=np.int64)
+    for c, (waveform, enable, duty, f, offset) in enumerate(registers):
+        copies = [(f, enable & 1), ((f + offset) % 2**24, enable >> 1)]
+        for n in range(0, updates):
+            total = 0
+            for increment, enabled in copies:
+                if not enabled:
+                    continue
+                # Each copy's phase before this update's advance
+                phase = (n * increment) % 2**24
+                level, blend = mipmap(increment)
+                if waveform == TRIANGLE:
+                    total += _naive_triangle(phase)
+                else:
+                    total += _reference(tables, phase, level, blend)
+                if waveform == PULSE:
+                    total -= _reference(tables, (phase + (duty << 16)) % 2**24,
+                                        level, blend)
+            # Pulse and dry + wet each add a term to scale back
+            out[n, c] = total >> ((waveform == PULSE) + (enable == 0b11))
+    return out
+
+# (waveform, enable, duty_cycle, phase_increment, lfo_offset):  each
+# waveform dry, wet only, and dry + wet with vibrato up and down, and a
+# disabled channel
+TONE_REGISTERS = [
+    (RAMP, 0b01, 0, 100000, 0),
+    (PULSE, 0b01, 64, 250000, 0),
+    (TRIANGLE, 0b01, 0, 50000, 0),
+    (RAMP, 0b11, 0, 120000, 7000),
+    (PULSE, 0b10, 200, 30000, 2**24 - 9000),
+    (TRIANGLE, 0b11, 0, 400000, 30000),
+    (PULSE, 0b11, 128, 1500, 600),
+    (RAMP, 0b00, 0, 100000, 0),
+]
+
+@pytest.mark.parametrize("interpolators", [1, 2, 4])
+def test_tone_matches_reference(interpolators):
+    channels = len(TONE_REGISTERS)
+    updates = 6
+    dut = ToneGenerator(channels, interpolators=interpolators)
+    out = np.zeros((updates, channels), dtype=np.int64)
+    taken = [0]*channels
+
+    async def testbench(ctx):
+        for c, (waveform, enable, duty, f, offset) in \
+                enumerate(TONE_REGISTERS):
+            ctx.set(dut.channel_select, c)
+            ctx.set(dut.waveform, waveform)
+            ctx.set(dut.enable, enable)
+            ctx.set(dut.duty_cycle, duty)
+            ctx.set(dut.phase_increment, f)
+            ctx.set(dut.wr, 0b1001110)
+            await ctx.tick()
+            # lfo_offset shares phase_increment's data lines
+            ctx.set(dut.lfo_offset, offset)
+            ctx.set(dut.wr, 0b0100000)
+            await ctx.tick()
+        ctx.set(dut.wr, 0)
+        # Back to back
+        period = dut.initiation_interval
+        for cycle in range(0, updates*period + dut.sample_cycles):
+            ctx.set(dut.update, cycle % period == 0
+                    and cycle < updates*period)
+            await ctx.tick()
+            if ctx.get(dut.output_valid):
+                c = ctx.get(dut.output_channel)
+                out[taken[c], c] = ctx.get(dut.output)
+                taken[c] += 1
+
+    _simulate(dut, testbench)
+    assert taken == [updates]*channels
+    np.testing.assert_array_equal(out, _tone_reference(TONE_REGISTERS,
+                                                       updates))
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+from rtl.generators import wavetable
+from rtl.generators.wavetable import ramp_tables
+
+# Ramp wavetable construction and its disk cache
+
+def test_extra_frequencies_list(tmp_path, monkeypatch):
+    monkeypatch.setenv("HARDAY_CACHE_DIR", str(tmp_path))
+    tables = ramp_tables(length=16, extra_frequencies=[3072, 6144])
+    assert tables.shape == (10, 16)
+    assert tables is ramp_tables(length=16, extra_frequencies=(3072, 6144))
+
+def test_cache_is_versioned(tmp_path, monkeypatch):
+    monkeypatch.setenv("HARDAY_CACHE_DIR", str(tmp_path))
+    ramp_tables(length=32)
+    names = os.listdir(tmp_path)
+    assert names == [f"ramp-v{wavetable.VERSION}-18000Hz-9x32-24bit-"
+                     "16_32_64_128_256_512_1024_2048_3072.npy"]
+
+def test_bad_cache_file_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setenv("HARDAY_CACHE_DIR", str(tmp_path))
+    expected = np.array(ramp_tables(length=8, bits=16))
+    name, = os.listdir(tmp_path)
+    for bad in (np.zeros((9, 4), dtype=np.uint32),
+                np.zeros((9, 8), dtype=np.float64)):
+        np.save(tmp_path / name, bad)
+        wavetable._ramp_tables.cache_clear()
+        assert np.array_equal(ramp_tables(length=8, bits=16), expected)
+    # And saved again
+    assert np.array_equal(np.load(tmp_path / name), expected)
+
+def test_ramp_shape():
+    tables = ramp_tables()
+    assert tables.dtype == np.uint32
+    assert not tables.flags.writeable
+    # Peaks at full scale, every table falling toward pi
+    assert tables.max() == 2**23 - 1
+    assert (tables[:, 0] > tables[:, -1]).all()
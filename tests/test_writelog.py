@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from rtl.sim.writelog import WriteLog, dumps, loads, save, load, MAGIC
+
+# Write logs through their file format and back
+
+def random_log(rng, writes: int) -> WriteLog:
+    # Deltas of every varint length, including writes at the same time
+    deltas = rng.choice([0, 1, 63, 64, 1920, 2**20, 2**40], writes)
+    time = np.cumsum(deltas)
+    tail = int(rng.integers(0, 2**16))
+    return WriteLog(2_000_000, 96000, time,
+                    rng.integers(0, 256, writes), rng.integers(0, 256, writes),
+                    int(time[-1]) + tail if writes else tail)
+
+def assert_same(a: WriteLog, b: WriteLog):
+    assert (a.clock, a.rate, a.length) == (b.clock, b.rate, b.length)
+    np.testing.assert_array_equal(a.time, b.time)
+    np.testing.assert_array_equal(a.address, b.address)
+    np.testing.assert_array_equal(a.data, b.data)
+
+@pytest.mark.parametrize("writes", [0, 1, 100])
+def test_round_trip(writes):
+    log = random_log(np.random.default_rng(writes), writes)
+    assert_same(loads(dumps(log)), log)
+
+def test_frame_writes_are_three_bytes():
+    # A write every frame, in 50Hz frames as YM files are imported
+    log = WriteLog(2_000_000, 50, range(1, 11), [0]*10, [0]*10)
+    assert len(dumps(log)) == 16 + 3*10 + 1
+
+def test_save_and_load(tmp_path):
+    log = random_log(np.random.default_rng(0), 20)
+    path = str(tmp_path / "tune.hwl")
+    save(log, path)
+    assert_same(load(path), log)
+
+def test_truncated():
+    buffer = dumps(random_log(np.random.default_rng(0), 5))
+    # Every cut ends inside the header or a record
+    for end in range(0, len(buffer)):
+        with pytest.raises(ValueError):
+            loads(buffer[:end])
+
+def test_not_a_write_log(tmp_path):
+    with pytest.raises(ValueError, match="not a write log"):
+        loads(b"HWL2" + dumps(WriteLog(1, 1))[4:])
+    path = tmp_path / "tune.bin"
+    path.write_bytes(b"\0"*32)
+    with pytest.raises(ValueError, match="not a write log, YM, or VGM"):
+        load(str(path))
+    assert dumps(WriteLog(1, 1)).startswith(MAGIC)